@@ -20,9 +20,10 @@ import json
 
 from config.settings import settings
 from config.logger import setup_logger
-from tools.http_tools import estoque, pedidos, alterar, estoque_preco, consultar_encarte
+from tools.http_tools import estoque, pedidos, alterar, estoque_preco, estoque_preco_many, consultar_encarte
 
 from tools.time_tool import get_current_time, search_message_history
+from tools.product_attributes import category_family
 from tools.redis_tools import (
     mark_order_sent, 
     add_item_to_cart, 
@@ -66,80 +67,124 @@ class AgentState(TypedDict):
 
 # --- FERRAMENTAS DO VENDEDOR ---
 
+def _aviso_ambiguidade(resultados: list) -> dict | None:
+    """Retorna um item de aviso se os melhores resultados misturam LIMPEZA e HIGIENE."""
+    if not resultados:
+        return None
+    # Filtrar apenas os que têm match razoável
+    top_results = [r for r in resultados if r.get("match_score", 0) > 0.5]
+    categorias = set()
+    for r in top_results:
+        # Família calculada no sync (LIMPEZA/HIGIENE/BEBIDAS/AÇOUGUE/HORTIFRUTI); fallback pela categoria
+        cat = r.get("familia") or category_family(r.get("categoria", ""))
+        if cat:
+            categorias.add(cat)
+    
+    # Se encontrou categorias muito distintas (ex: LIMPEZA e HIGIENE)
+    if len(categorias) > 1 and "LIMPEZA" in categorias and "HIGIENE" in categorias:
+        return {
+            "id": "AVISO_AMBIGUIDADE",
+            "nome": "⚠️ AMBIGUIDADE DETECTADA",
+            "preco": 0.0,
+            "estoque": 0,
+            "match_ok": False,
+            "aviso": f"Encontrei produtos de categorias diferentes ({', '.join(categorias)}). PERGUNTE ao cliente qual ele deseja antes de adicionar."
+        }
+    return None
+
+# Termos que atrapalham a busca (medidas, preposições) removidos na variante relaxada
+TERMOS_RELAXAMENTO = {"de", "da", "do", "com", "sem", "g", "kg", "ml", "litros", "unidade"}
+
+def _consulta_relaxada(query: str) -> str | None:
+    """Variante mais genérica da consulta, ou None se não houver o que remover."""
+    query_limpa = " ".join([p for p in query.split() if p.lower() not in TERMOS_RELAXAMENTO])
+    if query_limpa != query and len(query_limpa) > 3:
+        return query_limpa
+    return None
+
+def _melhor_score(resultados: list) -> float:
+    return max([r.get("match_score", 0.0) for r in resultados], default=0.0)
+
+def _busca_com_relaxamento(telefone: str, queries: List[str]) -> Dict[str, list]:
+    """
+    Busca as consultas originais e suas variantes relaxadas numa única chamada em lote.
+    A relaxada só vence se a original ficou abaixo de 0.6 e ela pontuou melhor.
+    Sugestões dos conjuntos vencedores são salvas numa única escrita no Redis.
+    """
+    from tools.db_search import search_products_db_many, save_search_suggestions
+
+    relaxadas = {q: _consulta_relaxada(q) for q in queries}
+    termos = list(queries) + [r for r in relaxadas.values() if r and r not in queries]
+    brutos = search_products_db_many(termos)
+
+    vencedores: Dict[str, list] = {}
+    sugestoes: Dict[str, list] = {}
+    for query in queries:
+        resultados = json.loads(brutos.get(query, "[]"))
+        termo_vencedor = query
+        relaxada = relaxadas.get(query)
+        if relaxada and (not resultados or _melhor_score(resultados) < 0.6):
+            resultados_relaxados = json.loads(brutos.get(relaxada, "[]"))
+            if _melhor_score(resultados_relaxados) > _melhor_score(resultados):
+                logger.info(f"🔄 Busca Inteligente (relaxada): '{query}' -> '{relaxada}'")
+                resultados = resultados_relaxados
+                termo_vencedor = relaxada
+        vencedores[query] = resultados
+        if resultados:
+            sugestoes[termo_vencedor] = resultados
+
+    if telefone and sugestoes:
+        save_search_suggestions(telefone, sugestoes)
+    return vencedores
+
 @tool
 def busca_produto_tool(telefone: str, query: str) -> str:
     """
-    Busca produtos e preços. Tenta ser inteligente: se não achar de primeira,
-    refaz a busca com termos mais genéricos automaticamente.
+    Busca produtos e preços. Tenta ser inteligente: avalia junto uma versão
+    mais genérica da busca e fica com a melhor automaticamente.
 
     Retorna um JSON list com os dados dos produtos:
     [{"nome": "...", "categoria": "...", "preco": 10.0, "estoque": 5}]
 
     Usa chamadas na API FastAPI local.
     """
-    from tools.db_search import search_products_db
-    import json
-    
-    # 1. Busca Original
-    resultado_json = search_products_db(query, telefone=telefone)
-    resultados = json.loads(resultado_json)
-    
-    # Analisar qualidade dos resultados
-    melhor_score = 0.0
-    if resultados:
-        melhor_score = max([r.get("match_score", 0.0) for r in resultados])
-    
-    # 2. Se score baixo (< 0.6) ou vazio, tenta limpar a query (Retry Automático)
-    if not resultados or melhor_score < 0.6:
-        # Tenta remover termos comuns que atrapalham (marcas, medidas, etc) se a query for longa
-        termos_limpeza = ["de", "da", "do", "com", "sem", "g", "kg", "ml", "litros", "unidade"]
-        query_limpa = " ".join([p for p in query.split() if p.lower() not in termos_limpeza])
-        
-        if query_limpa != query and len(query_limpa) > 3:
-            logger.info(f"🔄 Retry Busca Inteligente: '{query}' -> '{query_limpa}'")
-            resultado_retry_json = search_products_db(query_limpa, telefone=telefone)
-            resultados_retry = json.loads(resultado_retry_json)
-            
-            # Se o retry trouxe algo melhor, usa ele
-            score_retry = 0.0
-            if resultados_retry:
-                score_retry = max([r.get("match_score", 0.0) for r in resultados_retry])
-            
-            if score_retry > melhor_score:
-                resultado_json = resultado_retry_json
-                resultados = resultados_retry
-
-    # 3. Análise de Ambiguidade de Categoria
-    if resultados:
-        # Filtrar apenas os que têm match razoável
-        top_results = [r for r in resultados if r.get("match_score", 0) > 0.5]
-        categorias = set()
-        for r in top_results:
-            cat = r.get("categoria", "").upper()
-            # Simplificar categorias para evitar falsos positivos (ex: MERCEARIA DOCE vs MERCEARIA SALGADA)
-            if "LIMPEZA" in cat: cat = "LIMPEZA"
-            elif "HIGIENE" in cat: cat = "HIGIENE"
-            elif "BEBIDAS" in cat: cat = "BEBIDAS"
-            elif "AÇOUGUE" in cat or "CARNE" in cat: cat = "AÇOUGUE"
-            elif "HORTIFRUTI" in cat or "LEGUMES" in cat: cat = "HORTIFRUTI"
-            
-            if cat:
-                categorias.add(cat)
-        
-        # Se encontrou categorias muito distintas (ex: LIMPEZA e HIGIENE)
-        if len(categorias) > 1 and "LIMPEZA" in categorias and "HIGIENE" in categorias:
-             warning = {
-                 "id": "AVISO_AMBIGUIDADE",
-                 "nome": "⚠️ AMBIGUIDADE DETECTADA",
-                 "preco": 0.0,
-                 "estoque": 0,
-                 "match_ok": False,
-                 "aviso": f"Encontrei produtos de categorias diferentes ({', '.join(categorias)}). PERGUNTE ao cliente qual ele deseja antes de adicionar."
-             }
-             resultados.insert(0, warning)
-             resultado_json = json.dumps(resultados, ensure_ascii=False)
-
-    return resultado_json
+    resultados = _busca_com_relaxamento(telefone, [query]).get(query, [])
+
+    # Análise de Ambiguidade de Categoria
+    aviso = _aviso_ambiguidade(resultados)
+    if aviso:
+        resultados.insert(0, aviso)
+
+    return json.dumps(resultados, ensure_ascii=False)
+
+@tool
+def busca_lista_produtos_tool(telefone: str, queries: List[str]) -> str:
+    """
+    Busca VÁRIOS produtos de uma vez (listas de compras, ex: "arroz | feijão | óleo | café").
+    Resolve todos os itens em uma única consulta — prefira esta ferramenta a chamar
+    busca_produto_tool item por item quando o cliente mandar uma lista.
+
+    Retorna um JSON com os resultados por termo, no mesmo formato de busca_produto_tool:
+    {"arroz": [{"nome": "...", "categoria": "...", "preco": 10.0, "estoque": 5}], "feijão": [...]}
+    """
+    termos = []
+    for q in queries or []:
+        q = (q or "").strip()
+        if q and q not in termos:
+            termos.append(q)
+    if not termos:
+        return "{}"
+
+    por_termo = _busca_com_relaxamento(telefone, termos)
+    saida = {}
+    for termo in termos:
+        resultados = por_termo.get(termo, [])
+        aviso = _aviso_ambiguidade(resultados)
+        if aviso:
+            resultados.insert(0, aviso)
+        saida[termo] = resultados
+
+    return json.dumps(saida, ensure_ascii=False)
 
 @tool
 def add_item_tool(telefone: str, produto: str, quantidade: float = 1.0, observacao: str = "", preco: float = 0.0, unidades: int = 0) -> str:
@@ -316,8 +361,24 @@ def ean_tool_alias(query: str) -> str:
 
 @tool("estoque")
 def estoque_preco_alias(ean: str) -> str:
-    """Consulta preço e disponibilidade pelo EAN (apenas dígitos)."""
-    return estoque_preco(ean)
+    """
+    Consulta preço e disponibilidade pelo EAN (apenas dígitos).
+    Para conferir vários produtos (ex.: o carrinho), mande todos os EANs de uma vez
+    separados por vírgula: "7891234567890, 7890000000017". Nesse caso o retorno é um
+    JSON {ean: itens ou mensagem de erro}, consultado em paralelo.
+    Cada item traz `idade_dados_segundos`: há quanto tempo o preço/estoque foi lido do sistema.
+    """
+    eans = [e for e in re.split(r"[,;|\s]+", ean or "") if e]
+    if len(eans) <= 1:
+        return estoque_preco(ean)
+
+    saida = {}
+    for codigo, resposta in estoque_preco_many(eans).items():
+        try:
+            saida[codigo] = json.loads(resposta)
+        except ValueError:
+            saida[codigo] = resposta
+    return json.dumps(saida, ensure_ascii=False)
 
 
 # ============================================
@@ -374,6 +435,8 @@ def salvar_endereco_tool(telefone: str, endereco: str) -> str:
     Use IMEDIATAMENTE quando o cliente informar o endereço (mesmo no início da conversa).
     """
     if save_address(telefone, endereco):
+        from tools.http_tools import invalidate_cliente_cache
+        invalidate_cliente_cache(telefone)
         return f"✅ Endereço salvo: {endereco}"
     return "❌ Erro ao salvar endereço."
 
@@ -507,6 +570,7 @@ def search_history_tool(telefone: str, keyword: str = None) -> str:
 
 VENDEDOR_TOOLS = [
     busca_produto_tool,
+    busca_lista_produtos_tool,
     time_tool,
     salvar_endereco_tool,
     finalizar_pedido_tool,
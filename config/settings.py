@@ -36,6 +36,33 @@ class Settings(BaseSettings):
     postgres_table_name: str = "memoria"
     postgres_products_table_name: str = "produtos-sp-queiroz"  # Nova variável para tabela de produtos
     postgres_message_limit: int = 5
+    products_sync_batch_size: int = 500  # Upserts por lote no sync do catálogo (streaming)
+    # Agendamento do sync do catálogo (um líder por vez via lease no Redis)
+    catalog_sync_enabled: bool = True
+    catalog_sync_interval_seconds: int = 3600
+    catalog_sync_jitter_seconds: int = 300
+    catalog_sync_lease_seconds: int = 600  # Renovado enquanto o sync roda
+
+    # Índice de catálogo em memória (busca sem ir ao Postgres a cada consulta)
+    catalog_index_enabled: bool = False
+    catalog_index_refresh_seconds: int = 3600  # Recarrega índices vencidos (0 = nunca)
+    catalog_index_version_check_seconds: int = 5  # Intervalo para comparar com a versão do catálogo no Redis
+    # Snapshot binário do catálogo gravado no sync e mapeado (mmap) por todos os workers
+    catalog_snapshot_enabled: bool = False
+    catalog_snapshot_path: str = "data/catalog.snap"
+
+    # Corretor ortográfico com vocabulário do catálogo (montado no sync)
+    spell_correction_enabled: bool = True
+
+    # PREPARE/EXECUTE da busca por conexão (desligar atrás de pgbouncer em modo transaction)
+    search_prepared_statements: bool = True
+
+    # Cache de resultados de busca (LRU local + Redis, invalidado pela versão do catálogo)
+    search_cache_enabled: bool = True
+    search_cache_local_size: int = 2000
+    search_cache_ttl_seconds: int = 7200
+    search_cache_negative_ttl_seconds: int = 900  # Buscas sem resultado (typos) expiram antes
+    search_cache_version_check_seconds: int = 5  # Intervalo para reler a versão do catálogo no Redis
     
     # Banco Vetorial de Produtos (Postgres - pgvector)
     vector_db_connection_string: Optional[str] = None
@@ -53,9 +80,37 @@ class Settings(BaseSettings):
     # API do Supermercado
     supermercado_base_url: str
     supermercado_auth_token: str
+    # Circuit breaker das APIs upstream (estado no Redis, janela deslizante)
+    circuit_window_seconds: int = 60
+    circuit_min_calls: int = 10  # Mínimo de chamadas na janela para avaliar taxas
+    circuit_error_rate: float = 0.5
+    circuit_slow_call_seconds: float = 8.0
+    circuit_slow_call_rate: float = 0.6
+    circuit_p95_seconds: float = 12.0
+    circuit_open_seconds: int = 30  # Cooldown antes do half-open
+    circuit_half_open_probes: int = 3
+    # Cache do encarte (atualizado em background com GET condicional)
+    encarte_refresh_enabled: bool = True
+    encarte_refresh_seconds: int = 900  # Idade máxima do payload antes de rebuscar
+    encarte_refresh_check_seconds: int = 60  # Intervalo do job (fração do encarte_refresh_seconds)
+    encarte_cache_max_age_seconds: int = 172800  # Servido enquanto a API estiver fora
+    # Cache do perfil do cliente (consultar_cliente)
+    cliente_perfil_ttl_seconds: int = 1800
+    cliente_perfil_negative_ttl_seconds: int = 300  # Telefone sem cadastro
+    # Clientes HTTP (pool por host com keep-alive)
+    http_pool_maxsize: int = 20  # Conexões reaproveitadas por host
+    http_connect_timeout: float = 3.05
+    http_auth_headers_ttl_seconds: int = 300  # Headers de auth em cache (relê token/.env depois disso)
 
     # Consulta de EAN (estoque/preço)
     estoque_ean_base_url: str = "http://45.178.95.233:5001/api/Produto/GetProdutosEAN"
+    estoque_preco_fresh_seconds: int = 120  # Cache servido sem consultar a API
+    estoque_preco_stale_seconds: int = 21600  # Cache servido enquanto atualiza em background
+    estoque_preco_budget_seconds: float = 12.0  # Prazo total de uma consulta (todas as tentativas)
+    estoque_preco_hedge_delay_seconds: float = 2.0  # Espera antes do hedge sem histórico de latência
+    estoque_preco_hedge_percentile: float = 0.9  # Percentil de latência que dispara o hedge
+    estoque_preco_max_concurrency: int = 6  # Consultas simultâneas em estoque_preco_many
+    estoque_preco_batch_deadline_seconds: float = 20.0  # Prazo total de um lote
 
     # EAN Smart Responder (Supabase Functions)
     smart_responder_url: Optional[str] = None
@@ -79,6 +134,7 @@ class Settings(BaseSettings):
     worker_retry_attempts: int = 3  # Tentativas de retry em caso de falha
     
     # Servidor
+    admin_token: Optional[str] = None  # Exigido em X-Admin-Token; sem ele os endpoints /admin respondem 403
     server_host: str = "0.0.0.0"
     server_port: int = 8000
     debug_mode: bool = False
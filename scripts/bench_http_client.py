@@ -0,0 +1,150 @@
+"""
+Micro-benchmark: requests.get sem sessão vs. pool keep-alive (tools.http_client).
+
+Sobe um servidor stub local (HTTP/1.1 keep-alive) que responde um JSON
+parecido com o da API de EAN. `--handshake-ms` atrasa cada conexão NOVA,
+simulando o RTT do handshake TCP+TLS até o ERP real; requisições em conexões
+reaproveitadas não pagam esse custo.
+
+Caminhos medidos:
+    bare    requests.get(url) -> conexão nova por chamada (código antigo)
+    pooled  tools.http_client.http_request -> Session por host
+    async   tools.http_client.async_http_request -> httpx.AsyncClient por host
+
+Uso:
+    python scripts/bench_http_client.py [--runs 300] [--handshake-ms 30] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from tools.http_client import async_http_request, close_async_clients, http_request
+
+PAYLOAD = json.dumps(
+    [{"produto": "ARROZ TIPO 1 5KG", "vl_produto": "24,90", "qtd_produto": 12, "ativo": True}]
+).encode("utf-8")
+
+
+def _start_stub(handshake_ms: float):
+    connections = {"count": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Cabeçalho e corpo saem em writes separados; sem isso o delayed ACK trava conexões reaproveitadas
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            with lock:
+                connections["count"] += 1
+            if handshake_ms:
+                time.sleep(handshake_ms / 1000.0)
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(PAYLOAD)))
+            self.end_headers()
+            self.wfile.write(PAYLOAD)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, connections
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000
+
+
+def _bench_sync(call, runs: int, concurrency: int):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda _: _timed(call), range(runs)))
+
+
+async def _bench_async(url: str, runs: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    timings = []
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            resp = await async_http_request("GET", url, endpoint="estoque_preco")
+            resp.json()
+            timings.append((time.perf_counter() - t0) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(runs)))
+    await close_async_clients()
+    return timings
+
+
+def _report(name: str, timings, connections: int, baseline=None) -> float:
+    mean = statistics.mean(timings)
+    extra = f"  ({baseline - mean:+.2f} ms/chamada vs bare)" if baseline is not None else ""
+    print(
+        f"{name:<7} mean={mean:7.2f}ms  p50={_percentile(timings, 50):7.2f}ms  "
+        f"p95={_percentile(timings, 95):7.2f}ms  conexões={connections}{extra}"
+    )
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=300)
+    parser.add_argument("--handshake-ms", type=float, default=30.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    server, connections = _start_stub(args.handshake_ms)
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/Produto/GetProdutosEAN/7891234567890"
+    print(f"Stub em {url} (handshake simulado {args.handshake_ms:.0f}ms, {args.runs} chamadas, concorrência {args.concurrency})")
+
+    # Aquecimento (imports, resolução, primeira conexão)
+    requests.get(url, timeout=5).json()
+    http_request("GET", url, endpoint="estoque_preco").json()
+
+    connections["count"] = 0
+    bare = _bench_sync(lambda: requests.get(url, timeout=10).json(), args.runs, args.concurrency)
+    baseline = _report("bare", bare, connections["count"])
+
+    connections["count"] = 0
+    pooled = _bench_sync(lambda: http_request("GET", url, endpoint="estoque_preco").json(), args.runs, args.concurrency)
+    _report("pooled", pooled, connections["count"], baseline)
+
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        print("async   (httpx não instalado, ignorado)")
+    else:
+        connections["count"] = 0
+        timings = asyncio.run(_bench_async(url, args.runs, args.concurrency))
+        _report("async", timings, connections["count"], baseline)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Micro-benchmark: busca híbrida ad-hoc vs. statement preparado (PREPARE/EXECUTE).
+
+Ad-hoc: o psycopg2 envia o texto completo (parâmetro q repetido 8x) e o
+Postgres faz parse + planejamento a cada chamada.
+Preparado: PREPARE uma vez por conexão, depois só EXECUTE com parâmetros
+deduplicados (mesmo caminho de tools.db_search._execute_plan).
+
+Reusa a tabela sintética de bench_search_indexes.
+
+Uso:
+    python scripts/bench_prepared_search.py [--rows 20000] [--runs 200] [--indexed] [--keep]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from psycopg2 import sql
+
+from config.settings import settings
+from tools.db_search import _HYBRID_SQL, _INDEXED_HYBRID_SQL, _TRGM_THRESHOLD_SQL, _format_search_sql, _prepared_spec
+from scripts.bench_search_indexes import BENCH_TABLE, QUERIES, _setup_table
+from scripts.populate_products_db import migrate_search_schema
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _planning_time_ms(conn, stmt, params, prefix: str) -> float:
+    with conn.cursor() as cur:
+        if prefix:
+            cur.execute(prefix)
+        cur.execute(sql.SQL("EXPLAIN (ANALYZE, SUMMARY) ") + stmt, params)
+        lines = [r[0] for r in cur.fetchall()]
+    conn.rollback()
+    for line in lines:
+        if line.strip().startswith("Planning Time:"):
+            return float(line.split(":")[1].strip().split()[0])
+    return 0.0
+
+
+def _bench_adhoc(conn, stmt, runs: int, prefix: str):
+    timings = []
+    with conn.cursor() as cur:
+        for i in range(runs):
+            q = QUERIES[i % len(QUERIES)]
+            t0 = time.perf_counter()
+            if prefix:
+                cur.execute(sql.SQL(prefix) + stmt, {"q": q, "like": f"%{q}%", "limit": 8})
+            else:
+                cur.execute(stmt, {"q": q, "like": f"%{q}%", "limit": 8})
+            cur.fetchall()
+            timings.append((time.perf_counter() - t0) * 1000)
+    conn.rollback()
+    return timings
+
+
+def _bench_prepared(conn, stmt, runs: int, prefix: str):
+    spec = _prepared_spec(conn, "bench_busca_produtos", stmt)
+    placeholders = ", ".join(["%s"] * len(spec["params"]))
+    execute_sql = f"{prefix}EXECUTE {spec['name']} ({placeholders})"
+    timings = []
+    with conn.cursor() as cur:
+        cur.execute(spec["prepare"])
+        for i in range(runs):
+            q = QUERIES[i % len(QUERIES)]
+            params = {"q": q, "like": f"%{q}%", "limit": 8}
+            t0 = time.perf_counter()
+            cur.execute(execute_sql, [params[p] for p in spec["params"]])
+            cur.fetchall()
+            timings.append((time.perf_counter() - t0) * 1000)
+        cur.execute(f"DEALLOCATE {spec['name']}")
+    conn.rollback()
+    return timings
+
+
+def _report(label: str, timings):
+    print(
+        f"{label:<12} mediana {statistics.median(timings):>7.2f}ms | "
+        f"p95 {_percentile(timings, 95):>7.2f}ms | média {statistics.mean(timings):>7.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--indexed", action="store_true", help="Aplica migrate_search_schema e usa a consulta indexada")
+    parser.add_argument("--keep", action="store_true", help="Não remover a tabela sintética no final")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(settings.postgres_connection_string)
+    print(f"🏗️ Criando tabela sintética '{BENCH_TABLE}' com {args.rows} produtos...")
+    _setup_table(conn, args.rows)
+
+    query_sql, prefix = _HYBRID_SQL, ""
+    if args.indexed:
+        if not migrate_search_schema(conn, BENCH_TABLE):
+            print("❌ Migração falhou (extensões/privilégios?). Abortando.")
+            sys.exit(1)
+        query_sql, prefix = _INDEXED_HYBRID_SQL, _TRGM_THRESHOLD_SQL
+    stmt = _format_search_sql(query_sql, sql.Identifier(BENCH_TABLE))
+
+    plan_ms = _planning_time_ms(conn, stmt, {"q": QUERIES[0], "like": f"%{QUERIES[0]}%", "limit": 8}, prefix)
+    print(f"\nPlanning Time por chamada ad-hoc (EXPLAIN): {plan_ms:.2f}ms")
+
+    # Aquecimento (cache de páginas / catálogo)
+    _bench_adhoc(conn, stmt, min(20, args.runs), prefix)
+
+    print(f"\n=== {args.runs} buscas ({'indexada' if args.indexed else 'híbrida original'}) ===")
+    adhoc = _bench_adhoc(conn, stmt, args.runs, prefix)
+    prepared = _bench_prepared(conn, stmt, args.runs, prefix)
+    _report("ad-hoc", adhoc)
+    _report("preparado", prepared)
+    gain = statistics.median(adhoc) / statistics.median(prepared) if statistics.median(prepared) > 0 else float("inf")
+    print(f"ganho (mediana): {gain:.2f}x")
+
+    if not args.keep:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {t}").format(t=sql.Identifier(BENCH_TABLE)))
+        conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
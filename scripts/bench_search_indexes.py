@@ -0,0 +1,144 @@
+"""
+Benchmark da busca de produtos antes/depois do schema indexado.
+
+Cria uma tabela sintética (~20k produtos), roda EXPLAIN ANALYZE da busca
+híbrida original (seq scan com unaccent/to_tsvector por linha), aplica
+migrate_search_schema() e repete com a consulta indexada.
+
+Uso:
+    python scripts/bench_search_indexes.py [--rows 20000] [--runs 5] [--keep]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from config.settings import settings
+from tools.db_search import _HYBRID_SQL, _INDEXED_HYBRID_SQL, _TRGM_THRESHOLD_SQL, _format_search_sql
+from scripts.populate_products_db import migrate_search_schema
+
+BENCH_TABLE = "bench-produtos-search"
+
+PRODUTOS = [
+    "ARROZ", "FEIJÃO", "ÓLEO DE SOJA", "AÇÚCAR", "CAFÉ", "LEITE", "MACARRÃO", "FARINHA DE TRIGO",
+    "FRANGO", "CARNE MOÍDA", "LINGUIÇA CALABRESA", "PRESUNTO", "QUEIJO MUSSARELA", "MANTEIGA",
+    "DETERGENTE", "SABÃO EM PÓ", "AMACIANTE", "SHAMPOO", "SABONETE", "CREME DENTAL",
+    "REFRIGERANTE", "SUCO", "CERVEJA", "ÁGUA MINERAL", "BISCOITO", "CHOCOLATE", "TOMATE", "CEBOLA",
+]
+MARCAS = ["TIO JOÃO", "CAMIL", "LIZA", "UNIÃO", "PILÃO", "ITALAC", "SADIA", "PERDIGÃO", "SEARA",
+          "YPÊ", "OMO", "COMFORT", "DOVE", "COLGATE", "COCA-COLA", "DEL VALLE", "SKOL", "NESTLÉ"]
+EMBALAGENS = ["1KG", "5KG", "500G", "900ML", "1L", "2L", "350ML", "200G", "KG", "UN"]
+CATEGORIAS = ["MERCEARIA", "FRIGORIFICO AVES", "LIMPEZA", "HIGIENE", "BEBIDAS", "HORTIFRUTI"]
+
+QUERIES = ["arroz 5kg", "feijao carioca", "oleo soja", "frango abatido", "sabao po", "cafe pilao", "refrigerante 2l"]
+
+
+def _make_rows(n: int):
+    rnd = random.Random(42)
+    rows = []
+    for i in range(n):
+        nome = f"{rnd.choice(PRODUTOS)} {rnd.choice(MARCAS)} {rnd.choice(EMBALAGENS)}"
+        descricao = f"{nome.title()} - produto de qualidade" if rnd.random() < 0.5 else ""
+        rows.append((str(i + 1), nome, descricao, round(rnd.uniform(1, 80), 2), rnd.randint(0, 200),
+                     str(7890000000000 + i), rnd.choice(CATEGORIAS), "UN", True))
+    return rows
+
+
+def _setup_table(conn, n: int):
+    ident = sql.Identifier(BENCH_TABLE)
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {t}").format(t=ident))
+        cur.execute(sql.SQL(
+            """
+            CREATE TABLE {t} (
+                id VARCHAR(255) PRIMARY KEY, nome TEXT, descricao TEXT, preco DECIMAL(10, 2),
+                estoque DECIMAL(10, 3), codigo_barras TEXT, categoria TEXT, unidade TEXT,
+                ativo BOOLEAN DEFAULT TRUE
+            )
+            """
+        ).format(t=ident))
+        execute_values(
+            cur,
+            sql.SQL("INSERT INTO {t} (id, nome, descricao, preco, estoque, codigo_barras, categoria, unidade, ativo) VALUES %s")
+            .format(t=ident).as_string(conn),
+            _make_rows(n),
+        )
+        cur.execute(sql.SQL("ANALYZE {t}").format(t=ident))
+    conn.commit()
+
+
+def _explain_and_time(conn, query_sql: str, params, runs: int, prefix: str = ""):
+    stmt = _format_search_sql(query_sql, sql.Identifier(BENCH_TABLE))
+    with conn.cursor() as cur:
+        if prefix:
+            cur.execute(prefix)
+        cur.execute(sql.SQL("EXPLAIN (ANALYZE, BUFFERS) ") + stmt, params)
+        plan = "\n".join(r[0] for r in cur.fetchall())
+        timings = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            cur.execute(stmt, params)
+            cur.fetchall()
+            timings.append((time.perf_counter() - t0) * 1000)
+    conn.rollback()
+    return plan, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="Não remover a tabela sintética no final")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(settings.postgres_connection_string)
+    print(f"🏗️ Criando tabela sintética '{BENCH_TABLE}' com {args.rows} produtos...")
+    _setup_table(conn, args.rows)
+
+    before = {}
+    print("\n=== ANTES (busca híbrida original, sem índices) ===")
+    for q in QUERIES:
+        params = {"q": q, "like": f"%{q}%", "limit": 8}
+        plan, ms = _explain_and_time(conn, _HYBRID_SQL, params, args.runs)
+        before[q] = ms
+        print(f"\n--- '{q}' | mediana {ms:.1f}ms ---\n{plan}")
+
+    print("\n🔧 Aplicando migrate_search_schema()...")
+    if not migrate_search_schema(conn, BENCH_TABLE):
+        print("❌ Migração falhou (extensões/privilégios?). Abortando.")
+        sys.exit(1)
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("ANALYZE {t}").format(t=sql.Identifier(BENCH_TABLE)))
+    conn.commit()
+
+    after = {}
+    print("\n=== DEPOIS (search_tsv + GIN trigram) ===")
+    for q in QUERIES:
+        params = {"q": q, "like": f"%{q}%", "limit": 8}
+        plan, ms = _explain_and_time(conn, _INDEXED_HYBRID_SQL, params, args.runs, prefix=_TRGM_THRESHOLD_SQL)
+        after[q] = ms
+        print(f"\n--- '{q}' | mediana {ms:.1f}ms ---\n{plan}")
+
+    print("\n=== RESUMO (mediana em ms) ===")
+    print(f"{'query':<20} {'antes':>10} {'depois':>10} {'ganho':>8}")
+    for q in QUERIES:
+        gain = before[q] / after[q] if after[q] > 0 else float("inf")
+        print(f"{q:<20} {before[q]:>10.1f} {after[q]:>10.1f} {gain:>7.1f}x")
+
+    if not args.keep:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {t}").format(t=sql.Identifier(BENCH_TABLE)))
+        conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
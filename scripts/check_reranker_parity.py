@@ -0,0 +1,136 @@
+"""
+Paridade do re-ranker (tools.reranker) com o _score_match original (difflib).
+
+Compara os scores 0.6·overlap + 0.4·ratio dos dois caminhos num corpus de
+consultas x nomes de produto, e confere o kernel Ratcliff/Obershelp contra o
+difflib em pares aleatórios. Sai com código 1 se passar da tolerância.
+
+Uso:
+    python scripts/check_reranker_parity.py [--from-db] [--tolerance 0.0001] [--limit 2000]
+
+--from-db usa nomes reais da tabela de produtos em vez do corpus embutido.
+"""
+import argparse
+import difflib
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.db_search import (
+    _score_match,
+    _score_candidates,
+    _MATCH_FEATURES_CACHE,
+)
+from tools.reranker import char_index, matched_chars
+
+QUERIES = [
+    "frango abatido", "arroz 5kg", "feijao carioca 1kg", "oleo de soja", "leite ninho", "cafe pilao 500g",
+    "coca cola 2l", "refrigerante guarana", "sabao em po omo", "detergente ype", "papel higienico",
+    "tomate", "cebola kg", "batata", "calabresa", "carne moida", "creme de leite", "kisuki", "alho",
+    "agua sanitaria", "margarina", "biscoito recheado", "macarrao espaguete", "acucar cristal",
+]
+
+PRODUCTS = [
+    ("FRANGO ABATIDO KG", "FRIGORIFICO AVES"), ("FILE DE PEITO DE FRANGO SADIA 1KG", "FRIGORIFICO AVES"),
+    ("ARROZ TIO JOAO TIPO 1 5KG", "MERCEARIA"), ("ARROZ CAMIL PARBOILIZADO 1KG", "MERCEARIA"),
+    ("FEIJAO CARIOCA KICALDO 1KG", "MERCEARIA"), ("FEIJÃO PRETO CAMIL 1KG", "MERCEARIA"),
+    ("OLEO DE SOJA LIZA 900ML", "MERCEARIA"), ("LEITE EM PO NINHO 380G", "MERCEARIA DOCE"),
+    ("LEITE INTEGRAL ITALAC 1L", "LATICINIOS"), ("CAFE PILAO TRADICIONAL 500G", "MERCEARIA"),
+    ("REFRIGERANTE COCA-COLA 2L", "BEBIDAS"), ("REFRIG GUARANA ANTARCTICA 2L", "BEBIDAS"),
+    ("SABAO EM PO OMO LAVAGEM PERFEITA 800G", "LIMPEZA"), ("DETERGENTE LIQUIDO YPE NEUTRO 500ML", "LIMPEZA"),
+    ("PAPEL HIGIENICO NEVE FOLHA DUPLA 12UN", "HIGIENE"), ("TOMATE KG", "HORTIFRUTI"),
+    ("CEBOLA KG", "HORTIFRUTI"), ("BATATA INGLESA KG", "HORTIFRUTI"), ("LINGUICA CALABRESA KG", "AÇOUGUE"),
+    ("CARNE MOIDA DE PRIMEIRA KG", "AÇOUGUE"), ("CREME DE LEITE NESTLE 200G", "MERCEARIA DOCE"),
+    ("REFRESCO EM PO KISUKI LARANJA 25G", "MERCEARIA"), ("ALHO KG", "HORTIFRUTI"),
+    ("AGUA SANITARIA QBOA 1L", "LIMPEZA"), ("MARGARINA QUALY COM SAL 500G", "LATICINIOS"),
+    ("BISCOITO RECHEADO OREO 90G", "MERCEARIA DOCE"), ("MACARRAO ESPAGUETE RENATA 500G", "MERCEARIA"),
+    ("ACUCAR CRISTAL UNIAO 1KG", "MERCEARIA"), ("SHAMPOO SEDA CERAMIDAS 325ML", "HIGIENE"),
+]
+
+
+def _load_products_from_db(limit: int):
+    from tools.db_search import _get_connection, _return_connection
+
+    conn = _get_connection()
+    try:
+        from psycopg2 import sql
+        from config.settings import settings
+
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("SELECT id, nome, categoria FROM {t} ORDER BY random() LIMIT %s").format(
+                    t=sql.Identifier(settings.postgres_products_table_name)
+                ),
+                (limit,),
+            )
+            return [{"id": r[0], "nome": r[1] or "", "categoria": r[2] or ""} for r in cur.fetchall()]
+    finally:
+        _return_connection(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--from-db", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.0001)
+    parser.add_argument("--limit", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.from_db:
+        rows = _load_products_from_db(args.limit)
+    else:
+        rows = [{"id": str(i), "nome": n, "categoria": c} for i, (n, c) in enumerate(PRODUCTS)]
+    print(f"🧪 {len(QUERIES)} consultas x {len(rows)} produtos")
+
+    # 1) Kernel vs difflib em pares aleatórios (alfabeto pequeno força muitos empates)
+    rnd = random.Random(7)
+    kernel_errors = 0
+    for _ in range(5000):
+        a = "".join(rnd.choice("abc de") for _ in range(rnd.randint(0, 60)))
+        b = "".join(rnd.choice("abc de") for _ in range(rnd.randint(0, 60)))
+        expected = difflib.SequenceMatcher(None, a, b).get_matching_blocks()
+        if matched_chars(a, b, char_index(b)) != sum(m.size for m in expected):
+            kernel_errors += 1
+    print(f"Kernel Ratcliff/Obershelp: {kernel_errors} divergência(s) em 5000 pares aleatórios")
+
+    # 2) Scores: difflib (original) vs re-ranker em lote
+    max_diff = 0.0
+    worst = None
+    flips = 0
+    t_old = t_new = 0.0
+    for q in QUERIES:
+        t0 = time.perf_counter()
+        old = [_score_match(q, r["nome"], r["categoria"]) for r in rows]
+        t_old += time.perf_counter() - t0
+
+        _MATCH_FEATURES_CACHE.clear()
+        t0 = time.perf_counter()
+        new = _score_candidates(q, rows)
+        t_new += time.perf_counter() - t0
+
+        for r, a, b in zip(rows, old, new):
+            diff = abs(a - b)
+            if diff > max_diff:
+                max_diff, worst = diff, (q, r["nome"], a, b)
+            if (a >= 0.55) != (b >= 0.55):
+                flips += 1
+
+    print(f"Maior diferença de score: {max_diff:.4f}" + (f" em {worst}" if worst else ""))
+    print(f"Mudanças de match_ok (limiar 0.55): {flips}")
+    print(f"Tempo difflib: {t_old * 1000:.1f}ms | re-ranker (cache frio): {t_new * 1000:.1f}ms")
+
+    # Caminho quente: features dos produtos já em cache
+    t0 = time.perf_counter()
+    for q in QUERIES:
+        _score_candidates(q, rows)
+    print(f"Re-ranker (cache quente): {(time.perf_counter() - t0) * 1000:.1f}ms")
+
+    ok = kernel_errors == 0 and max_diff <= args.tolerance
+    print("✅ Paridade OK" if ok else f"❌ Fora da tolerância ({args.tolerance})")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
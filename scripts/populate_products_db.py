@@ -1,9 +1,13 @@
 import os
 import sys
 import json
+import codecs
+import hashlib
 import logging
+import time
 import requests
 import psycopg2
+from psycopg2 import errors as pg_errors
 from psycopg2.extras import execute_values
 from datetime import datetime
 from dotenv import load_dotenv
@@ -15,10 +19,36 @@ try:
     from config.settings import settings
     DB_CONNECTION = settings.postgres_connection_string
     TABLE_NAME = settings.postgres_products_table_name
+    SYNC_BATCH_SIZE = settings.products_sync_batch_size
+    from tools.catalog_index import rebuild_catalog_index
+    from tools.catalog_snapshot import write_catalog_snapshot
+    from tools.search_cache import invalidate_search_cache
+    from tools.db_search import refresh_search_plan
+    from tools.spell_corrector import rebuild_spell_dictionary
+    from tools.product_attributes import ATTRIBUTE_COLUMNS, ATTRIBUTE_COLUMNS_DDL, derive_attributes
 except ImportError:
     load_dotenv()
     DB_CONNECTION = os.getenv("POSTGRES_CONNECTION_STRING")
     TABLE_NAME = os.getenv("POSTGRES_PRODUCTS_TABLE_NAME", "produtos-sp-queiroz")
+    SYNC_BATCH_SIZE = int(os.getenv("PRODUCTS_SYNC_BATCH_SIZE", "500"))
+
+    def rebuild_catalog_index(conn=None, catalog_version=None):
+        return False
+
+    def write_catalog_snapshot(conn=None, if_missing=False):
+        return False
+
+    def invalidate_search_cache(catalog_version=None):
+        return None
+
+    def refresh_search_plan(conn=None):
+        return False
+
+    def rebuild_spell_dictionary(conn):
+        return False
+
+    # Standalone mode: derived attribute columns are not written
+    ATTRIBUTE_COLUMNS, ATTRIBUTE_COLUMNS_DDL, derive_attributes = (), {}, None
 
 # Setup logging
 logging.basicConfig(
@@ -32,6 +62,18 @@ logger = logging.getLogger("populate_products_db")
 
 API_URL = "http://45.178.95.233:5001/api/Produto/GetProdutos"
 
+# Safety net for delta sync: a truncated/partial feed must not deactivate the catalog
+MAX_DEACTIVATE_RATIO = 0.5
+
+# Change feed: one row per added/changed/removed product, pruned after this many days
+CHANGELOG_TABLE = f"{TABLE_NAME}_changelog"
+CHANGELOG_WATERMARK_TABLE = f"{CHANGELOG_TABLE}_watermark"
+CHANGELOG_RETENTION_DAYS = 30
+
+# Streaming ingestion: HTTP read size and the largest single product we accept
+STREAM_CHUNK_SIZE = 64 * 1024
+MAX_RECORD_CHARS = 1024 * 1024
+
 def get_db_connection():
     """Establishes a connection to the PostgreSQL database."""
     try:
@@ -41,6 +83,13 @@ def get_db_connection():
         logger.error(f"Failed to connect to database: {e}")
         return None
 
+def base_index_statements(table_name: str) -> str:
+    prefix = f"idx_{table_name.replace('-', '_')}"
+    return (
+        f'CREATE INDEX IF NOT EXISTS {prefix}_nome ON "{table_name}" (nome);\n'
+        f'    CREATE INDEX IF NOT EXISTS {prefix}_ean ON "{table_name}" (codigo_barras);'
+    )
+
 def create_table_if_not_exists(conn):
     """Creates the products table if it does not exist."""
     create_query = f"""
@@ -58,8 +107,7 @@ def create_table_if_not_exists(conn):
         raw_data JSONB
     );
     
-    CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME.replace("-", "_")}_nome ON "{TABLE_NAME}" (nome);
-    CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME.replace("-", "_")}_ean ON "{TABLE_NAME}" (codigo_barras);
+    {base_index_statements(TABLE_NAME)}
     """
     try:
         with conn.cursor() as cur:
@@ -71,105 +119,376 @@ def create_table_if_not_exists(conn):
         conn.rollback()
         raise
 
-def fetch_products():
-    """Fetches products from the API."""
+    migrate_search_schema(conn)
+    migrate_attribute_columns(conn)
+    migrate_sync_columns(conn)
+    migrate_changelog_table(conn)
+
+def migrate_changelog_table(conn):
+    """
+    Creates the catalog change feed: every sync run takes a new catalog version and
+    appends one row per added/changed/removed product. Consumers read it by `seq` cursor
+    (see tools/catalog_changelog.py). The watermark table keeps the highest pruned `seq`,
+    so consumers can tell whether their cursor is still covered (seq may have gaps).
+    Idempotent.
+    """
     try:
-        logger.info(f"Fetching products from {API_URL}...")
-        response = requests.get(API_URL, timeout=60)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Ensure it's a list
+        with conn.cursor() as cur:
+            cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS "{CHANGELOG_TABLE}" (
+                seq BIGSERIAL PRIMARY KEY,
+                version BIGINT NOT NULL,
+                synced_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                product_id VARCHAR(255) NOT NULL,
+                change TEXT NOT NULL,
+                old_preco DECIMAL(10, 2),
+                new_preco DECIMAL(10, 2),
+                old_estoque DECIMAL(10, 3),
+                new_estoque DECIMAL(10, 3)
+            );
+            CREATE INDEX IF NOT EXISTS idx_{CHANGELOG_TABLE.replace("-", "_")}_version ON "{CHANGELOG_TABLE}" (version);
+            CREATE SEQUENCE IF NOT EXISTS "{CHANGELOG_TABLE}_version_seq";
+            CREATE TABLE IF NOT EXISTS "{CHANGELOG_WATERMARK_TABLE}" (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                pruned_through_seq BIGINT NOT NULL
+            );
+            -- Existing feeds: everything below the oldest row (or the whole sequence, if empty) is gone
+            INSERT INTO "{CHANGELOG_WATERMARK_TABLE}" (pruned_through_seq)
+            SELECT coalesce(
+                (SELECT min(seq) - 1 FROM "{CHANGELOG_TABLE}"),
+                (SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM "{CHANGELOG_TABLE}_seq_seq")
+            )
+            ON CONFLICT (id) DO NOTHING;
+            """)
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Failed to create changelog table '{CHANGELOG_TABLE}': {e}")
+        conn.rollback()
+        raise
+
+def next_catalog_version(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT nextval(%s)", (f'"{CHANGELOG_TABLE}_version_seq"',))
+        return cur.fetchone()[0]
+
+def change_kind(previous, ativo) -> str:
+    """added / changed / removed, from the search-visible point of view."""
+    if previous is None or (not previous[1] and ativo):
+        return "added"
+    if previous[1] and not ativo:
+        return "removed"
+    return "changed"
+
+def append_changelog(conn, version, now, entries):
+    """entries: (product_id, change, old_preco, new_preco, old_estoque, new_estoque)."""
+    if not entries:
+        return
+    with conn.cursor() as cur:
+        execute_values(
+            cur,
+            f"""
+            INSERT INTO "{CHANGELOG_TABLE}"
+            (version, synced_at, product_id, change, old_preco, new_preco, old_estoque, new_estoque)
+            VALUES %s
+            """,
+            [(version, now) + tuple(e) for e in entries],
+        )
+
+def prune_changelog(conn):
+    """Drops entries past the retention window and advances the pruned-through watermark."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            WITH pruned AS (
+                DELETE FROM "{CHANGELOG_TABLE}"
+                WHERE synced_at < now() - make_interval(days => %s)
+                RETURNING seq
+            )
+            UPDATE "{CHANGELOG_WATERMARK_TABLE}" w
+            SET pruned_through_seq = greatest(w.pruned_through_seq, p.max_seq)
+            FROM (SELECT max(seq) AS max_seq FROM pruned) p
+            WHERE p.max_seq IS NOT NULL
+            """,
+            (CHANGELOG_RETENTION_DAYS,),
+        )
+
+def migrate_sync_columns(conn, table_name: str = None):
+    """Adds `row_hash` (content hash of the synced row) used by the delta sync. Idempotent."""
+    table_name = table_name or TABLE_NAME
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f'ALTER TABLE "{table_name}" ADD COLUMN IF NOT EXISTS row_hash TEXT')
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Failed to add sync columns to '{table_name}': {e}")
+        conn.rollback()
+        raise
+
+def row_hash(values) -> str:
+    """Stable hash of the row content (everything written except ultima_atualizacao)."""
+    payload = json.dumps(values, default=str, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def create_seen_table(conn):
+    """
+    Temp table with the ids the delta sync has already taken from the feed. It replaces an
+    in-memory id set: cross-batch dedup and deactivation are answered by the database.
+    Dropped at commit (the whole delta sync is one transaction).
+    """
+    with conn.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE sync_seen (id TEXT PRIMARY KEY) ON COMMIT DROP")
+
+def mark_seen(conn, ids):
+    """Records ids as seen; returns the ones not seen earlier in the run."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO sync_seen (id) SELECT unnest(%s::text[]) ON CONFLICT DO NOTHING RETURNING id",
+            (list(ids),),
+        )
+        return {r[0] for r in cur.fetchall()}
+
+def load_changed_rows(conn, rows):
+    """
+    rows: (id, row_hash, ativo) for one batch. Joins them with the live table and returns
+    id -> previous (row_hash, ativo, preco, estoque) for the rows that must be written;
+    previous is None for new products. Unchanged rows are not returned.
+    """
+    if not rows:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT b.id, l.id IS NOT NULL, l.row_hash, coalesce(l.ativo, true), l.preco, l.estoque
+            FROM unnest(%s::text[], %s::text[], %s::boolean[]) AS b(id, row_hash, ativo)
+            LEFT JOIN "{TABLE_NAME}" l ON l.id = b.id
+            WHERE l.id IS NULL
+               OR l.row_hash IS DISTINCT FROM b.row_hash
+               OR coalesce(l.ativo, true) IS DISTINCT FROM b.ativo
+            """,
+            ([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]),
+        )
+        return {r[0]: ((r[2], r[3], r[4], r[5]) if r[1] else None) for r in cur.fetchall()}
+
+def migrate_attribute_columns(conn, table_name: str = None):
+    """
+    Adds the derived attribute columns computed at sync time (see tools/product_attributes.py):
+    normalized name, package size/unit, unit tokens, category family, is_weighted,
+    is_hortifruti and ignore_stock. Idempotent.
+    """
+    table_name = table_name or TABLE_NAME
+    if not ATTRIBUTE_COLUMNS_DDL:
+        return False
+    try:
+        with conn.cursor() as cur:
+            for column, ddl in ATTRIBUTE_COLUMNS_DDL.items():
+                cur.execute(f'ALTER TABLE "{table_name}" ADD COLUMN IF NOT EXISTS {column} {ddl}')
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Failed to add derived attribute columns to '{table_name}': {e}")
+        conn.rollback()
+        raise
+
+def migrate_search_schema(conn, table_name: str = None):
+    """
+    Adds the indexed search schema used by search_products_db:
+    - IMMUTABLE wrapper around unaccent() (required for expression indexes)
+    - stored generated tsvector column `search_tsv` + GIN index
+    - GIN pg_trgm indexes on the unaccented nome/descricao
+
+    Idempotent. Failures (e.g. missing privileges to create extensions) are
+    logged and the search keeps working through the non-indexed SQL fallback.
+    """
+    table_name = table_name or TABLE_NAME
+    idx_prefix = f"idx_{table_name.replace('-', '_')}"
+    steps = [
+        "CREATE EXTENSION IF NOT EXISTS unaccent",
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        """
+        CREATE OR REPLACE FUNCTION immutable_unaccent(text)
+        RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+        """,
+        f"""
+        ALTER TABLE "{table_name}" ADD COLUMN IF NOT EXISTS search_tsv tsvector
+        GENERATED ALWAYS AS (
+            to_tsvector('simple', immutable_unaccent(coalesce(nome, '') || ' ' || coalesce(descricao, '')))
+        ) STORED
+        """,
+        f'CREATE INDEX IF NOT EXISTS {idx_prefix}_search_tsv ON "{table_name}" USING GIN (search_tsv)',
+        f'CREATE INDEX IF NOT EXISTS {idx_prefix}_nome_trgm ON "{table_name}" USING GIN (immutable_unaccent(nome) gin_trgm_ops)',
+        f'CREATE INDEX IF NOT EXISTS {idx_prefix}_descricao_trgm ON "{table_name}" USING GIN (immutable_unaccent(descricao) gin_trgm_ops)',
+    ]
+    try:
+        with conn.cursor() as cur:
+            for stmt in steps:
+                cur.execute(stmt)
+        conn.commit()
+        logger.info(f"Search schema for '{table_name}' checked/migrated (search_tsv + trigram GIN indexes).")
+        return True
+    except Exception as e:
+        logger.warning(f"Search schema migration skipped for '{table_name}': {e}")
+        conn.rollback()
+        return False
+
+def iter_json_array(chunks):
+    """
+    Incrementally parses a JSON feed from raw byte chunks, yielding one item at a time.
+    A top-level array is streamed item by item; any other shape (e.g. a {"data": [...]}
+    wrapper or a single object) is parsed whole, as before.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buf, pos, eof
+        for chunk in chunks:
+            if chunk:
+                buf, pos = buf[pos:] + utf8.decode(chunk), 0
+                return True
+        buf, pos, eof = buf[pos:] + utf8.decode(b"", final=True), 0, True
+        return False
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if pos >= len(buf):
+        return
+    if buf[pos] != "[":
+        while fill():
+            pass
+        data = json.loads(buf[pos:])
         if isinstance(data, dict):
-             # Some APIs wrap in a 'data' key or similar, but user said "GetProdutos"
-             # Let's inspect the first item if possible or assume list
-             if "data" in data and isinstance(data["data"], list):
-                 return data["data"]
-             return [data]
+            # Some APIs wrap in a 'data' key
+            if "data" in data and isinstance(data["data"], list):
+                yield from data["data"]
+            else:
+                yield data
         elif isinstance(data, list):
-            return data
+            yield from data
         else:
             logger.error(f"Unexpected data format: {type(data)}")
-            return []
-            
-    except Exception as e:
-        logger.error(f"Failed to fetch products: {e}")
-        return []
-
-def sync_products_db():
-    """Main function to sync products from API to DB."""
-    logger.info("Starting product sync...")
-    
-    products = fetch_products()
-    if not products:
-        logger.warning("No products fetched. Aborting sync.")
-        return
-    
-    logger.info(f"Fetched {len(products)} products. Connecting to DB...")
-    
-    conn = get_db_connection()
-    if not conn:
         return
 
-    try:
-        create_table_if_not_exists(conn)
-        
-        # Prepare data for insertion
-        # Schema: id, nome, descricao, preco, estoque, codigo_barras, categoria, unidade, ativo, ultima_atualizacao, raw_data
-        
-        unique_products = {}
-        for p in products:
-            # Extract fields safely
-            # ID: use 'id_produto'
-            p_id = str(p.get("id_produto") or p.get("id") or "")
-            if not p_id:
-                continue
-            
-            # Keep the last occurrence or handle as needed
-            unique_products[p_id] = p
-            
-        values = []
-        for p_id, p in unique_products.items():
-                
-            nome = p.get("produto") or p.get("nome") or p.get("descricao") or ""
-            descricao = p.get("descricaoEcommerceHTML") or ""
-            
-            # Price logic
-            preco = p.get("vl_produto") or p.get("preco_venda") or 0.0
-            
-            # Stock logic
-            estoque_val = p.get("qtd_produto") or p.get("estoque") or 0.0
-            
-            cod_barras = str(p.get("codigo_ean") or p.get("cod_barra") or "").strip()
-            
-            categoria = f"{p.get('classificacao01', '')} {p.get('classificacao02', '')}".strip()
-            unidade = p.get("emb") or p.get("unid_medida") or ""
-            
-            # Ensure boolean
-            ativo = bool(p.get("ativo")) if "ativo" in p else True
-            
-            values.append((
-                p_id,
-                nome,
-                descricao,
-                preco,
-                estoque_val,
-                cod_barras,
-                categoria,
-                unidade,
-                ativo,
-                datetime.now(),
-                json.dumps(p)
-            ))
-            
-        if not values:
-            logger.warning("No valid products to insert.")
+    pos += 1
+    while True:
+        skip_whitespace()
+        if pos >= len(buf):
+            raise ValueError("Truncated product feed (JSON array not closed)")
+        if buf[pos] == "]":
             return
+        if buf[pos] == ",":
+            pos += 1
+            continue
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof or len(buf) - pos > MAX_RECORD_CHARS:
+                raise
+            fill()
+            continue
+        if (end >= len(buf) or buf[end] not in ",] \t\r\n") and not eof and len(buf) - pos <= MAX_RECORD_CHARS:
+            # Only a delimiter ends a value: a number may continue in the next chunk ("1." | "5")
+            fill()
+            continue
+        pos = end
+        yield item
+
+def fetch_products():
+    """Streams products from the API, yielding one product dict at a time."""
+    logger.info(f"Fetching products from {API_URL}...")
+    with requests.get(API_URL, timeout=60, stream=True) as response:
+        response.raise_for_status()
+        yield from iter_json_array(response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+
+def build_product_row(p_id, p, now):
+    """(row_hash, ativo, values tuple in upsert column order) for one feed product."""
+    nome = p.get("produto") or p.get("nome") or p.get("descricao") or ""
+    descricao = p.get("descricaoEcommerceHTML") or ""
+
+    # Price logic
+    preco = p.get("vl_produto") or p.get("preco_venda") or 0.0
+
+    # Stock logic
+    estoque_val = p.get("qtd_produto") or p.get("estoque") or 0.0
+
+    cod_barras = str(p.get("codigo_ean") or p.get("cod_barra") or "").strip()
 
-        # Upsert query
-        insert_query = f"""
+    categoria = f"{p.get('classificacao01', '')} {p.get('classificacao02', '')}".strip()
+    unidade = p.get("emb") or p.get("unid_medida") or ""
+
+    # Ensure boolean
+    ativo = bool(p.get("ativo")) if "ativo" in p else True
+
+    # Derived attributes (computed once here instead of on every search)
+    attributes = ()
+    if derive_attributes is not None:
+        derived = derive_attributes(nome, descricao, categoria)
+        attributes = tuple(derived[c] for c in ATTRIBUTE_COLUMNS)
+
+    raw_data = json.dumps(p, sort_keys=True)
+    content = (p_id, nome, descricao, preco, estoque_val, cod_barras, categoria, unidade, ativo, raw_data) + attributes
+    h = row_hash(content)
+    return h, ativo, content[:9] + (now, raw_data) + attributes + (h,)
+
+def iter_feed_products(counts):
+    """Streams the feed as (id, product) pairs; entries that are not objects are counted in counts["failed"]."""
+    for p in fetch_products():
+        if not isinstance(p, dict):
+            counts["failed"] += 1
+            continue
+        # ID: use 'id_produto'
+        p_id = str(p.get("id_produto") or p.get("id") or "")
+        if p_id:
+            yield p_id, p
+
+def try_build_product_row(p_id, p, now, counts):
+    """build_product_row, or None (counted in counts["failed"]) for a malformed product."""
+    try:
+        return build_product_row(p_id, p, now)
+    except Exception as e:
+        counts["failed"] += 1
+        logger.error(f"Skipping malformed product {p_id}: {e}")
+        return None
+
+def iter_feed_rows(now, counts, seen):
+    """
+    Streams the feed as (id, row_hash, ativo, values) tuples, deduplicated by id
+    (the first occurrence wins). Malformed products are skipped and counted in counts["failed"].
+    """
+    for p_id, p in iter_feed_products(counts):
+        if p_id in seen:
+            continue
+        seen.add(p_id)
+
+        built = try_build_product_row(p_id, p, now, counts)
+        if built is not None:
+            yield (p_id,) + built
+
+def sync_columns():
+    """Column order of the values built by build_product_row."""
+    return [
+        "id", "nome", "descricao", "preco", "estoque", "codigo_barras", "categoria", "unidade",
+        "ativo", "ultima_atualizacao", "raw_data", *ATTRIBUTE_COLUMNS, "row_hash",
+    ]
+
+def upsert_query():
+    attribute_updates = "".join(f",\n            {c} = EXCLUDED.{c}" for c in ATTRIBUTE_COLUMNS)
+    return f"""
         INSERT INTO "{TABLE_NAME}" 
-        (id, nome, descricao, preco, estoque, codigo_barras, categoria, unidade, ativo, ultima_atualizacao, raw_data)
+        ({", ".join(sync_columns())})
         VALUES %s
         ON CONFLICT (id) DO UPDATE SET
             nome = EXCLUDED.nome,
@@ -181,20 +500,435 @@ def sync_products_db():
             unidade = EXCLUDED.unidade,
             ativo = EXCLUDED.ativo,
             ultima_atualizacao = EXCLUDED.ultima_atualizacao,
-            raw_data = EXCLUDED.raw_data;
+            raw_data = EXCLUDED.raw_data{attribute_updates},
+            row_hash = EXCLUDED.row_hash;
         """
+
+def write_batch(conn, insert_query, batch, counts):
+    """
+    Upserts one batch inside a savepoint. If the batch fails, it is retried row by
+    row so a single bad record is skipped instead of rolling back the whole sync.
+    `batch` holds (kind, values, previous) entries; kind is "inserted" or "updated".
+    Returns the entries that were written.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SAVEPOINT sync_batch")
+        try:
+            execute_values(cur, insert_query, [entry[1] for entry in batch])
+            cur.execute("RELEASE SAVEPOINT sync_batch")
+            for entry in batch:
+                counts[entry[0]] += 1
+            return batch
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT sync_batch")
+            logger.warning(f"Batch of {len(batch)} products failed ({e}); retrying row by row.")
+
+        written = []
+        for entry in batch:
+            cur.execute("SAVEPOINT sync_row")
+            try:
+                execute_values(cur, insert_query, [entry[1]])
+                cur.execute("RELEASE SAVEPOINT sync_row")
+                counts[entry[0]] += 1
+                written.append(entry)
+            except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT sync_row")
+                counts["failed"] += 1
+                logger.error(f"Skipping product {entry[1][0]}: {e}")
+        return written
+
+def write_batch_with_changelog(conn, insert_query, batch, counts, run):
+    """write_batch + changelog rows for what was written (same transaction)."""
+    written = write_batch(conn, insert_query, batch, counts)
+    if not written:
+        return
+    if run["version"] is None:
+        run["version"] = next_catalog_version(conn)
+    append_changelog(
+        conn,
+        run["version"],
+        run["now"],
+        [
+            (values[0], change_kind(previous, values[8]),
+             previous[2] if previous else None, values[3],
+             previous[3] if previous else None, values[4])
+            for _, values, previous in written
+        ],
+    )
+
+def sync_feed_batch(conn, insert_query, products, counts, run):
+    """
+    One batch of the delta sync. `products` maps id -> product (first occurrence in the batch).
+    Ids already seen earlier in the run are dropped (sync_seen), the rest are compared with the
+    live rows of just this batch and only new/changed rows are upserted. Returns how many ids
+    were new to the run.
+    """
+    fresh = mark_seen(conn, products.keys())
+    rows = []
+    for p_id, p in products.items():
+        if p_id not in fresh:
+            continue
+        built = try_build_product_row(p_id, p, run["now"], counts)
+        if built is not None:
+            rows.append((p_id,) + built)
+
+    changed = load_changed_rows(conn, [(p_id, h, ativo) for p_id, h, ativo, _ in rows])
+    batch = []
+    for p_id, _, _, values in rows:
+        if p_id not in changed:
+            counts["unchanged"] += 1
+            continue
+        previous = changed[p_id]
+        batch.append(("inserted" if previous is None else "updated", values, previous))
+    if batch:
+        write_batch_with_changelog(conn, insert_query, batch, counts, run)
+    return len(fresh)
+
+def deactivate_missing_products(conn, now, run):
+    """
+    Deactivates active products that are not in sync_seen (set-based, no id list in memory).
+    Skipped when too many would go (see MAX_DEACTIVATE_RATIO). Returns how many were deactivated.
+    """
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE sync_seen")
+        cur.execute(
+            f"""
+            SELECT count(*) FILTER (WHERE NOT EXISTS (SELECT 1 FROM sync_seen s WHERE s.id = t.id)), count(*)
+            FROM "{TABLE_NAME}" t
+            WHERE coalesce(t.ativo, true)
+            """
+        )
+        missing, active_before = cur.fetchone()
+        if not missing:
+            return 0
+        if missing > active_before * MAX_DEACTIVATE_RATIO:
+            logger.warning(
+                f"Feed is missing {missing} of {active_before} active products; "
+                f"skipping deactivation (looks like a partial feed)."
+            )
+            return 0
+        cur.execute(
+            f"""
+            UPDATE "{TABLE_NAME}" t SET ativo = false, ultima_atualizacao = %s
+            WHERE coalesce(t.ativo, true)
+              AND NOT EXISTS (SELECT 1 FROM sync_seen s WHERE s.id = t.id)
+            RETURNING t.id, t.preco, t.estoque
+            """,
+            (now,),
+        )
+        removed = cur.fetchall()
+    if run["version"] is None:
+        run["version"] = next_catalog_version(conn)
+    append_changelog(
+        conn,
+        run["version"],
+        now,
+        [(p_id, "removed", preco, None, estoque, None) for p_id, preco, estoque in removed],
+    )
+    return len(removed)
+
+def sync_products_db(full_reload: bool = False):
+    """
+    Main function to sync products from API to DB.
+    The feed is streamed and applied in batches of SYNC_BATCH_SIZE: each batch is compared
+    with the live rows of its own ids (unnest + join on row_hash), and the ids seen so far
+    live in a temp table, so memory stays bounded by the batch regardless of catalog size.
+    full_reload=True rebuilds the table through COPY + staging swap (see full_reload_products_db).
+    Returns True when the whole feed was applied.
+    """
+    if full_reload:
+        return full_reload_products_db()
+
+    logger.info("Starting product sync...")
+
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    try:
+        create_table_if_not_exists(conn)
         
-        with conn.cursor() as cur:
-            execute_values(cur, insert_query, values)
+        # Schema: id, nome, descricao, preco, estoque, codigo_barras, categoria, unidade, ativo, ultima_atualizacao, raw_data,
+        # derived attributes, row_hash. Only new/changed rows (by row_hash) are written.
+        create_seen_table(conn)
+        insert_query = upsert_query()
+        now = datetime.now()
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0, "failed": 0}
+        fetched = 0
+        products = {}
+        feed_complete = True
+        # Catalog version for the change feed, taken on the first write of the run
+        run = {"version": None, "now": now}
+
+        try:
+            for p_id, p in iter_feed_products(counts):
+                products.setdefault(p_id, p)
+                if len(products) >= SYNC_BATCH_SIZE:
+                    fetched += sync_feed_batch(conn, insert_query, products, counts, run)
+                    products = {}
+        except Exception as e:
+            # Keep what was already applied; without the full feed nothing is deactivated
+            feed_complete = False
+            logger.error(f"Product feed interrupted after {fetched + len(products)} products: {e}")
+
+        if products:
+            fetched += sync_feed_batch(conn, insert_query, products, counts, run)
+            products = {}
+
+        if not fetched:
+            logger.warning("No products fetched. Aborting sync.")
+            conn.rollback()
+            return False
+
+        # Products that disappeared from the feed are deactivated (kept for history/orders)
+        missing = deactivate_missing_products(conn, now, run) if feed_complete else 0
+        prune_changelog(conn)
         
         conn.commit()
-        logger.info(f"Successfully synced {len(values)} products to database.")
+        logger.info(
+            f"Sync finished: {counts['inserted']} inserted, {counts['updated']} updated, "
+            f"{missing} deactivated, {counts['unchanged']} unchanged, {counts['failed']} failed"
+            + (f" (catalog version {run['version']})." if run["version"] is not None else ".")
+        )
+
+        # Schema may have been migrated: re-probe and pin the SQL search plan
+        refresh_search_plan()
+
+        if not (counts["inserted"] or counts["updated"] or missing):
+            # Nothing changed: derived indexes and cached searches are still valid
+            write_catalog_snapshot(conn, if_missing=True)
+            return feed_complete
+
+        refresh_derived_indexes(conn, run["version"])
+        return feed_complete
         
     except Exception as e:
         logger.error(f"Sync failed during database operation: {e}")
         conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+def refresh_derived_indexes(conn, catalog_version=None):
+    """
+    Rebuilds everything derived from the products table after it changed.
+    `catalog_version` is the change feed version of the run; it is also the version
+    published for the search caches, so both share one number.
+    """
+    # Rebuild the in-memory search index (atomic swap) from the fresh table
+    rebuild_catalog_index(conn, catalog_version)
+
+    # Binary snapshot (mmap'ed read-only by every worker process)
+    write_catalog_snapshot(conn)
+
+    # Spelling corrector vocabulary from nome/categoria (published to Redis)
+    rebuild_spell_dictionary(conn)
+
+    # New catalog version: invalidates cached search results (local LRU + Redis)
+    invalidate_search_cache(catalog_version)
+
+def copy_field(value) -> str:
+    """One value in COPY text format (\\N for NULL, arrays as Postgres literals)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (list, tuple)):
+        value = "{" + ",".join(
+            '"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for v in value
+        ) + "}"
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+class CopyStream:
+    """File-like object feeding COPY ... FROM STDIN from a row iterator, without buffering the feed."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buf = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            try:
+                values = next(self._rows)
+            except StopIteration:
+                break
+            self._buf += ("\t".join(copy_field(v) for v in values) + "\n").encode("utf-8")
+        if size < 0:
+            size = len(self._buf)
+        out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+    readline = read
+
+def full_reload_products_db():
+    """
+    Full rebuild without touching the live table until the very end:
+    1. COPY the streamed feed into an UNLOGGED staging table (same columns, incl. generated ones)
+    2. carry over products missing from the feed as inactive, SET LOGGED, build PK/indexes
+    3. swap with two renames in one short transaction (lock_timeout-bounded)
+    Searches keep reading the old table until the swap commits. Any error (including an
+    interrupted feed) drops the staging table and leaves the live catalog untouched.
+    """
+    logger.info("Starting full product reload (COPY + staging swap)...")
+    start = time.monotonic()
+
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    staging = f"{TABLE_NAME}_staging"
+    old = f"{TABLE_NAME}_old"
+    try:
+        create_table_if_not_exists(conn)
+
+        with conn.cursor() as cur:
+            cur.execute(f'DROP TABLE IF EXISTS "{staging}"')
+            cur.execute(
+                f'CREATE UNLOGGED TABLE "{staging}" (LIKE "{TABLE_NAME}" INCLUDING DEFAULTS INCLUDING GENERATED)'
+            )
+        conn.commit()
+
+        counts = {"failed": 0}
+        seen = set()
+        now = datetime.now()
+        columns = sync_columns()
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                f'COPY "{staging}" ({", ".join(columns)}) FROM STDIN',
+                CopyStream(values for _, _, _, values in iter_feed_rows(now, counts, seen)),
+            )
+        if not seen:
+            raise RuntimeError("no products fetched")
+        logger.info(f"Copied {len(seen)} products into '{staging}' ({counts['failed']} skipped).")
+
+        with conn.cursor() as cur:
+            # Products gone from the feed stay in the table, deactivated (same rule as the delta sync)
+            cur.execute(
+                f"SELECT count(*) FROM \"{TABLE_NAME}\" l WHERE coalesce(l.ativo, true) "
+                f'AND NOT EXISTS (SELECT 1 FROM "{staging}" s WHERE s.id = l.id)'
+            )
+            missing = cur.fetchone()[0]
+            cur.execute(f'SELECT count(*) FROM "{TABLE_NAME}" WHERE coalesce(ativo, true)')
+            active_before = cur.fetchone()[0]
+            if missing and missing > active_before * MAX_DEACTIVATE_RATIO:
+                raise RuntimeError(
+                    f"feed is missing {missing} of {active_before} active products (looks like a partial feed)"
+                )
+            carried = [c for c in columns if c not in ("ativo", "ultima_atualizacao")]
+            cur.execute(
+                f'INSERT INTO "{staging}" ({", ".join(carried)}, ativo, ultima_atualizacao) '
+                f'SELECT {", ".join("l." + c for c in carried)}, '
+                f"false, CASE WHEN coalesce(l.ativo, true) THEN %s ELSE l.ultima_atualizacao END "
+                f'FROM "{TABLE_NAME}" l WHERE NOT EXISTS (SELECT 1 FROM "{staging}" s WHERE s.id = l.id)',
+                (now,),
+            )
+            cur.execute(f'ALTER TABLE "{staging}" SET LOGGED')
+            cur.execute(f'ALTER TABLE "{staging}" ADD PRIMARY KEY (id)')
+            cur.execute(base_index_statements(staging))
+        conn.commit()
+
+        # Search schema (tsvector + trigram GIN indexes) built on staging, off the live table
+        migrate_search_schema(conn, staging)
+        with conn.cursor() as cur:
+            cur.execute(f'ANALYZE "{staging}"')
+        conn.commit()
+
+        version, changes = swap_staging_table(conn, staging, old, now)
+        logger.info(
+            f"Full reload finished: {len(seen)} products, {missing} deactivated, {changes} changes "
+            f"(catalog version {version}), {counts['failed']} failed, in {time.monotonic() - start:.1f}s."
+        )
+
+        refresh_search_plan()
+        refresh_derived_indexes(conn, version)
+        return True
+    except Exception as e:
+        logger.error(f"Full reload failed, live table untouched: {e}")
+        conn.rollback()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f'DROP TABLE IF EXISTS "{staging}"')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+        return False
     finally:
         conn.close()
 
+def changelog_from_staging(cur, staging, version, now) -> int:
+    """Appends the staging-vs-live diff to the change feed (staging already holds every live id)."""
+    cur.execute(
+        f"""
+        INSERT INTO "{CHANGELOG_TABLE}"
+        (version, synced_at, product_id, change, old_preco, new_preco, old_estoque, new_estoque)
+        SELECT %s, %s, d.id, d.change, d.old_preco,
+               CASE WHEN d.change = 'removed' THEN NULL ELSE d.new_preco END,
+               d.old_estoque,
+               CASE WHEN d.change = 'removed' THEN NULL ELSE d.new_estoque END
+        FROM (
+            SELECT s.id, l.preco AS old_preco, s.preco AS new_preco, l.estoque AS old_estoque, s.estoque AS new_estoque,
+                   CASE
+                       WHEN l.id IS NULL OR (NOT coalesce(l.ativo, true) AND s.ativo) THEN 'added'
+                       WHEN coalesce(l.ativo, true) AND NOT s.ativo THEN 'removed'
+                       ELSE 'changed'
+                   END AS change
+            FROM "{staging}" s
+            LEFT JOIN "{TABLE_NAME}" l ON l.id = s.id
+            WHERE l.id IS NULL
+               OR s.row_hash IS DISTINCT FROM l.row_hash
+               OR s.ativo IS DISTINCT FROM coalesce(l.ativo, true)
+        ) d
+        """,
+        (version, now),
+    )
+    return cur.rowcount
+
+def swap_staging_table(conn, staging, old, now, attempts: int = 5):
+    """
+    Renames staging -> live in one transaction and drops the previous table.
+    The change feed rows for the reload are written in the same transaction.
+    lock_timeout keeps the ACCESS EXCLUSIVE lock request from queueing searches behind it;
+    on timeout the swap is retried. Returns (catalog version, number of changes).
+    """
+    live_prefix = f"idx_{TABLE_NAME.replace('-', '_')}"
+    staging_prefix = f"idx_{staging.replace('-', '_')}"
+    for attempt in range(1, attempts + 1):
+        try:
+            version = next_catalog_version(conn)
+            with conn.cursor() as cur:
+                changes = changelog_from_staging(cur, staging, version, now)
+                prune_changelog(conn)
+                cur.execute("SET LOCAL lock_timeout = '2s'")
+                cur.execute(f'LOCK TABLE "{TABLE_NAME}" IN ACCESS EXCLUSIVE MODE')
+                cur.execute(f'DROP TABLE IF EXISTS "{old}"')
+                cur.execute(f'ALTER TABLE "{TABLE_NAME}" RENAME TO "{old}"')
+                cur.execute(f'ALTER TABLE "{staging}" RENAME TO "{TABLE_NAME}"')
+                cur.execute(f'DROP TABLE "{old}"')
+                # Index names follow the table name so the idempotent migrations keep matching them
+                cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (TABLE_NAME,))
+                for (index_name,) in cur.fetchall():
+                    if index_name.startswith(staging_prefix):
+                        new_name = live_prefix + index_name[len(staging_prefix):]
+                    elif index_name == f"{staging}_pkey":
+                        new_name = f"{TABLE_NAME}_pkey"
+                    else:
+                        continue
+                    cur.execute(f'ALTER INDEX "{index_name}" RENAME TO "{new_name}"')
+            conn.commit()
+            return version, changes
+        except pg_errors.LockNotAvailable:
+            conn.rollback()
+            logger.warning(f"Table swap waiting on readers (attempt {attempt}/{attempts})...")
+            time.sleep(attempt)
+    raise RuntimeError("could not acquire lock for the table swap")
+
 if __name__ == "__main__":
-    sync_products_db()
+    sync_products_db(full_reload="--full" in sys.argv[1:])
@@ -0,0 +1,45 @@
+"""
+Endpoints /admin: fechados sem ADMIN_TOKEN e protegidos pelo header X-Admin-Token.
+
+Uso:
+    python -m pytest scripts/test_admin_endpoints.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+
+import server
+from config.settings import settings
+
+
+def _client(monkeypatch, admin_token):
+    calls = []
+    monkeypatch.setattr(settings, "admin_token", admin_token)
+    monkeypatch.setattr(server, "trigger_catalog_sync", lambda full=False: calls.append(full) or {"accepted": True})
+    return TestClient(server.app), calls
+
+
+def test_admin_sync_refused_without_configured_token(monkeypatch):
+    client, calls = _client(monkeypatch, None)
+
+    resp = client.post("/admin/catalog/sync?full=true")
+    assert resp.status_code == 403
+    resp = client.post("/admin/catalog/sync?full=true", headers={"X-Admin-Token": ""})
+    assert resp.status_code == 403
+    assert client.get("/admin/catalog/sync").status_code == 403
+    assert calls == []
+
+
+def test_admin_sync_requires_matching_token(monkeypatch):
+    client, calls = _client(monkeypatch, "s3cret")
+
+    assert client.post("/admin/catalog/sync?full=true").status_code == 401
+    assert client.post("/admin/catalog/sync", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert calls == []
+
+    resp = client.post("/admin/catalog/sync?full=true", headers={"X-Admin-Token": "s3cret"})
+    assert resp.status_code == 202
+    assert calls == [True]
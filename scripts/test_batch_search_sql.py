@@ -0,0 +1,62 @@
+"""
+Consulta de lote da busca (unnest + LATERAL): usa só os parâmetros que
+_search_rows_sql_many envia, inclusive na ordenação por embalagem.
+
+Uso:
+    python -m pytest scripts/test_batch_search_sql.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from psycopg2 import sql
+
+from tools.db_search import (
+    _BATCH_UNIT_EXPR,
+    _NAMED_PARAM_RE,
+    _SEARCH_VARIANTS,
+    _as_batch_sql,
+    _batch_search_params,
+    _format_search_sql,
+)
+
+
+def _render(composable) -> str:
+    """Texto da consulta sem conexão (identificadores entre aspas, sem escape)."""
+    if isinstance(composable, sql.Composed):
+        return "".join(_render(part) for part in composable.seq)
+    if isinstance(composable, sql.Identifier):
+        return ".".join(f'"{s}"' for s in composable.strings)
+    return composable.string
+
+
+def _batch_variants():
+    return [v for v in _SEARCH_VARIANTS if v.get("batch")]
+
+
+def test_batch_sql_uses_only_batch_params():
+    expected = set(_batch_search_params(["arroz 5kg", "feijao"], 8))
+    assert _batch_variants()
+    for variant in _batch_variants():
+        for with_attributes in (True, False):
+            query = _format_search_sql(
+                _as_batch_sql(variant["sql"]),
+                sql.Identifier("produtos"),
+                with_attributes=with_attributes,
+                with_active=True,
+                unit_expr=_BATCH_UNIT_EXPR,
+            )
+            text = _render(query)
+            assert "%(unit)s" not in text, variant["name"]
+            assert set(_NAMED_PARAM_RE.findall(text)) == expected, variant["name"]
+
+
+def test_batch_sql_orders_by_each_term_unit():
+    variant = _batch_variants()[0]
+    text = _render(
+        _format_search_sql(
+            _as_batch_sql(variant["sql"]), sql.Identifier("produtos"), True, True, _BATCH_UNIT_EXPR
+        )
+    )
+    assert "coalesce(b.unit = ANY(unit_tokens), false) DESC" in text
@@ -0,0 +1,70 @@
+"""
+Hedge da consulta de EAN: a tentativa perdedora é descartada sem contar no circuit breaker.
+
+Uso:
+    python -m pytest scripts/test_ean_hedge.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import requests
+
+import tools.http_client as http_client
+import tools.redis_tools as redis_tools
+from config.settings import settings
+from tools.http_tools import _consultar_ean_api
+
+PAYLOAD = [{"produto": "ARROZ TIPO 1 5KG", "vl_produto": "24,90", "qtd_produto": 12, "ativo": True}]
+
+
+class _Resp:
+    status_code = 200
+    text = ""
+
+    def json(self):
+        return PAYLOAD
+
+
+class _SlowThenFastSession:
+    """Primeira chamada estoura o timeout depois de um tempo; as seguintes respondem na hora."""
+
+    def __init__(self, slow_seconds):
+        self.slow_seconds = slow_seconds
+        self.calls = 0
+        self.slow_finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def request(self, method, url, timeout=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            time.sleep(self.slow_seconds)
+            self.slow_finished.set()
+            raise requests.exceptions.ReadTimeout("slow upstream")
+        return _Resp()
+
+
+def test_slow_attempt_with_fast_hedge_records_one_success(monkeypatch):
+    session = _SlowThenFastSession(slow_seconds=0.6)
+    reports = []
+    monkeypatch.setattr(http_client, "get_session", lambda url: session)
+    monkeypatch.setattr(redis_tools, "check_circuit_open", lambda service: False)
+    monkeypatch.setattr(redis_tools, "report_success", lambda service, latency=None: reports.append(("ok", service)))
+    monkeypatch.setattr(redis_tools, "report_failure", lambda service, latency=None: reports.append(("fail", service)))
+    monkeypatch.setattr(settings, "estoque_preco_budget_seconds", 5.0)
+    monkeypatch.setattr(settings, "estoque_preco_hedge_delay_seconds", 0.1)
+
+    out, msg, use_cache = _consultar_ean_api("http://erp.local/ean/7891234567890", "7891234567890")
+
+    assert msg is None and not use_cache
+    assert "ARROZ" in out
+    assert session.calls == 2
+    # Deixa a tentativa perdedora terminar (timeout) antes de conferir o breaker
+    assert session.slow_finished.wait(2)
+    time.sleep(0.05)
+    assert reports == [("ok", http_client.SERVICE_ESTOQUE)]
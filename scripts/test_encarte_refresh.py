@@ -0,0 +1,65 @@
+"""
+Refresh do cache do encarte: o job atualiza antes do payload passar do TTL, e o
+refresh disparado por leitura roda uma vez por processo.
+
+Uso:
+    python -m pytest scripts/test_encarte_refresh.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import tools.http_tools as http_tools
+import tools.redis_tools as redis_tools
+from config.settings import settings
+
+
+def _setup(monkeypatch, age_seconds):
+    refreshed = []
+    monkeypatch.setattr(settings, "encarte_refresh_seconds", 900)
+    monkeypatch.setattr(settings, "encarte_refresh_check_seconds", 60)
+    monkeypatch.setattr(redis_tools, "get_redis_client", lambda: None)
+    monkeypatch.setattr(
+        http_tools, "_read_encarte_cache", lambda: {"fetched_at": time.time() - age_seconds, "body": "{}"}
+    )
+    monkeypatch.setattr(http_tools, "refresh_encarte_cache", lambda: refreshed.append(1))
+    return refreshed
+
+
+def test_job_refreshes_before_the_payload_expires(monkeypatch):
+    refreshed = _setup(monkeypatch, age_seconds=845)
+    http_tools.refresh_encarte_if_stale()
+    assert refreshed == [1]
+
+
+def test_job_skips_fresh_payload(monkeypatch):
+    refreshed = _setup(monkeypatch, age_seconds=600)
+    http_tools.refresh_encarte_if_stale()
+    assert refreshed == []
+
+
+def test_read_triggered_refresh_runs_once(monkeypatch):
+    _setup(monkeypatch, age_seconds=1000)
+    release = threading.Event()
+    calls = []
+
+    def slow_refresh():
+        calls.append(1)
+        release.wait(2)
+
+    monkeypatch.setattr(http_tools, "refresh_encarte_if_stale", slow_refresh)
+    threads = [threading.Thread(target=http_tools._refresh_encarte_async) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    release.set()
+    deadline = time.monotonic() + 2
+    while http_tools._encarte_refresh_lock.locked() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert calls == [1]
+    assert not http_tools._encarte_refresh_lock.locked()
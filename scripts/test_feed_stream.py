@@ -0,0 +1,46 @@
+"""
+Leitura em streaming do feed de produtos (iter_json_array): o resultado não
+depende de onde a resposta HTTP foi quebrada em chunks.
+
+Uso:
+    python -m pytest scripts/test_feed_stream.py
+"""
+import json
+import os
+import random
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from scripts.populate_products_db import iter_json_array
+
+
+def _chunked(data: bytes, cuts):
+    bounds = [0] + sorted(cuts) + [len(data)]
+    return [data[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def test_number_split_after_dot_or_exponent():
+    assert list(iter_json_array([b"[1.", b"5]"])) == [1.5]
+    assert list(iter_json_array([b"[2e", b"3, 4]"])) == [2000.0, 4]
+    assert list(iter_json_array([b"[-", b"7 ,", b"12", b"]"])) == [-7, 12]
+
+
+def test_every_split_point_gives_the_same_items():
+    feed = [
+        {"id_produto": "1", "descricao": "ARROZ 5KG", "vl_produto": 24.9, "qtd_produto": 1e2},
+        1.25,
+        -3e-2,
+        "FEIJÃO",
+        True,
+        None,
+        [1, 2.5],
+    ]
+    data = json.dumps(feed, ensure_ascii=False).encode("utf-8")
+    for cut in range(1, len(data)):
+        assert list(iter_json_array(_chunked(data, [cut]))) == feed, cut
+
+    rng = random.Random(14)
+    for _ in range(200):
+        cuts = rng.sample(range(1, len(data)), rng.randint(1, 12))
+        assert list(iter_json_array(_chunked(data, cuts))) == feed
@@ -0,0 +1,52 @@
+"""
+Corretor ortográfico do catálogo: corrige erros claros e não mexe em palavras corretas.
+
+Uso:
+    python -m pytest scripts/test_spell_corrector.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from tools.spell_corrector import SpellCorrector, build_vocabulary
+
+ROWS = [
+    ("LINGUICA CALABRESA SADIA 1KG", "FRIOS", "Linguiça calabresa defumada"),
+    ("LINGUICA CALABRESA PERDIGAO 500G", "FRIOS", None),
+    ("PERA WILLIAMS KG", "HORTIFRUTI", "Pera importada"),
+    ("QUEIJO MUSSARELA FATIADO", "FRIOS", None),
+    ("DETERGENTE LIQUIDO NEUTRO 500ML", "LIMPEZA", None),
+    ("MARGARINA CREMOSA 500G", "MERCEARIA", "Margarina Qualy com sal"),
+    ("BALA DE GOMA", "DOCES", None),
+    ("BOLA DE FUTEBOL", "BAZAR", None),
+]
+
+
+def _corrector():
+    return SpellCorrector(build_vocabulary(ROWS))
+
+
+def test_typos_are_corrected():
+    corrector = _corrector()
+    assert corrector.correct_query("linguica calabrasa") == "linguica calabresa"
+    assert corrector.correct_query("detergene neutro") == "detergente neutro"
+
+
+def test_common_words_outside_catalog_are_unchanged():
+    corrector = _corrector()
+    # "para" está a 1 letra de "pera", "quero" a 2 de "queijo"
+    assert corrector.correct_query("quero para amanha") == "quero para amanha"
+    assert corrector.correct_query("quanto custa uma caixa") == "quanto custa uma caixa"
+
+
+def test_words_from_descricao_are_known():
+    corrector = _corrector()
+    assert corrector.correct_query("margarina qualy") == "margarina qualy"
+
+
+def test_ambiguous_candidates_are_left_alone():
+    corrector = _corrector()
+    # "bila" está a 1 letra de "bala" e de "bola", com a mesma frequência
+    assert corrector.correct_word("bila") is None
+    assert corrector.correct_query("bila") == "bila"
@@ -3,12 +3,13 @@ Servidor FastAPI para receber mensagens do WhatsApp e processar com o agente
 Suporta: Texto, Áudio (Transcrição), Imagem (Visão) e PDF (Extração de Texto + Link)
 Versão: 1.6.0 (Correção de LID e Buffer Personalizado)
 """
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Request, HTTPException, BackgroundTasks, Header
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any
 import requests
-from datetime import datetime
+from datetime import datetime, timedelta
+import hmac
 import time
 import random
 import threading
@@ -19,7 +20,9 @@ from arq import create_pool
 from arq.connections import RedisSettings
 from urllib.parse import urlparse
 from apscheduler.schedulers.background import BackgroundScheduler
-from scripts.populate_products_db import sync_products_db
+from tools.catalog_sync import get_catalog_sync_status, schedule_catalog_sync, trigger_catalog_sync
+from tools.search_cache import get_search_cache_stats
+from tools.http_tools import prefetch_cliente, refresh_encarte_if_stale
 
 # Tenta importar pypdf para leitura de comprovantes
 try:
@@ -42,6 +45,7 @@ from tools.redis_tools import (
     refresh_session_ttl,
     get_order_context,
     clear_cart,
+    get_circuit_breaker_stats,
 )
 
 logger = setup_logger(__name__)
@@ -995,14 +999,7 @@ async def startup_event():
         )
         logger.info("✅ ARQ Pool inicializado com sucesso")
         
-        # Iniciar Scheduler de Sincronização de Produtos (1x por hora)
-        if not scheduler.running:
-            scheduler.add_job(sync_products_db, 'interval', hours=1, id='sync_products_job')
-            scheduler.start()
-            # Rodar uma vez logo no início (em thread separada para não bloquear startup)
-            threading.Thread(target=sync_products_db, daemon=True).start()
-            logger.info("⏰ Scheduler iniciado: Sincronização de produtos agendada para cada 1 hora.")
-        
+        _start_scheduler()
         return
     arq_pool = await create_pool(
         RedisSettings(
@@ -1014,13 +1011,31 @@ async def startup_event():
     )
     logger.info("✅ ARQ Pool inicializado com sucesso")
 
-    # Iniciar Scheduler de Sincronização de Produtos (1x por hora)
-    if not scheduler.running:
-        scheduler.add_job(sync_products_db, 'interval', hours=1, id='sync_products_job')
+    _start_scheduler()
+
+def _start_scheduler():
+    """
+    Sync de produtos: todo processo agenda o job, mas só o líder (lease no Redis) executa.
+    Sem sync imediato no startup: o primeiro tick sai com jitter e pula se o último run é recente.
+    Encarte: refresh do cache em background (pula se outra réplica já atualizou).
+    """
+    if scheduler.running:
+        return
+    if settings.catalog_sync_enabled:
+        schedule_catalog_sync(scheduler)
+    if settings.encarte_refresh_enabled:
+        scheduler.add_job(
+            refresh_encarte_if_stale,
+            "interval",
+            seconds=settings.encarte_refresh_check_seconds,
+            next_run_time=datetime.now() + timedelta(seconds=10),
+            id="encarte_refresh_job",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+        )
+    if scheduler.get_jobs():
         scheduler.start()
-        # Rodar uma vez logo no início (em thread separada para não bloquear startup)
-        threading.Thread(target=sync_products_db, daemon=True).start()
-        logger.info("⏰ Scheduler iniciado: Sincronização de produtos agendada para cada 1 hora.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -1119,6 +1134,37 @@ async def root(): return {"status":"online", "ver":"1.7.0", "queue":"enabled"}
 @app.get("/health")
 async def health(): return {"status":"healthy", "ts":datetime.now().isoformat()}
 
+@app.get("/metrics")
+async def metrics():
+    """Contadores internos (cache de busca, circuit breakers) para dimensionamento."""
+    return {
+        "ts": datetime.now().isoformat(),
+        "search_cache": get_search_cache_stats(),
+        "circuit_breakers": await asyncio.to_thread(get_circuit_breaker_stats),
+    }
+
+def _check_admin_token(token: Optional[str]):
+    # Sem ADMIN_TOKEN configurado os endpoints /admin ficam fechados (o servidor é público)
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="admin endpoints disabled (ADMIN_TOKEN not set)")
+    if not token or not hmac.compare_digest(token.encode("utf-8"), settings.admin_token.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="invalid admin token")
+
+@app.get("/admin/catalog/sync")
+async def catalog_sync_status(x_admin_token: Optional[str] = Header(default=None)):
+    """Líder atual e último run do sync do catálogo."""
+    _check_admin_token(x_admin_token)
+    return await asyncio.to_thread(get_catalog_sync_status)
+
+@app.post("/admin/catalog/sync")
+async def catalog_sync_trigger(full: bool = False, x_admin_token: Optional[str] = Header(default=None)):
+    """Dispara o sync do catálogo agora (full=true: recarga completa via staging)."""
+    _check_admin_token(x_admin_token)
+    result = await asyncio.to_thread(trigger_catalog_sync, full)
+    if not result.get("accepted"):
+        return JSONResponse(status_code=409, content=result)
+    return JSONResponse(status_code=202, content=result)
+
 @app.get("/graph")
 async def graph():
     """
@@ -1362,10 +1408,13 @@ async def webhook(req: Request, tasks: BackgroundTasks):
         if push_message_to_buffer(num, txt, message_id=msg_id):
             if not buffer_sessions.get(num):
                 buffer_sessions[num] = True
+                # Perfil do cliente aquecido enquanto o buffer espera
+                prefetch_cliente(num)
                 # MUDANÇA: Em vez de Thread, enfileira job ARQ
                 asyncio.create_task(_enqueue_buffer_job(num))
         else:
             # Mensagem única (sem buffer) - enfileira diretamente
+            prefetch_cliente(num)
             await _enqueue_process_job(tel, txt, msg_id)
 
         return JSONResponse(content={"status":"buffering"})
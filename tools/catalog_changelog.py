@@ -0,0 +1,122 @@
+"""
+Leitura do change feed do catálogo gravado por `sync_products_db`.
+
+Cada run do sync que altera algo pega uma nova versão do catálogo e grava uma
+linha por produto adicionado/alterado/removido (com preço e estoque antes e
+depois) na tabela `<produtos>_changelog`. Consumidores (caches, embeddings,
+atributos derivados) guardam o último `seq` processado e leem só o que veio
+depois, em O(mudanças) em vez de reprocessar o catálogo inteiro:
+
+    changes, cursor = read_catalog_changes(cursor)
+    for c in changes: ...   # c["product_id"], c["change"], c["new_preco"], ...
+
+O changelog é podado após alguns dias. A poda avança uma marca explícita
+(`<produtos>_changelog_watermark.pruned_through_seq`, o maior `seq` já
+removido); um cursor abaixo dela indica que o consumidor perdeu mudanças e
+precisa de uma reconstrução completa (`catalog_changes_since_available`).
+Como `seq` é BIGSERIAL e pode ter buracos (rollbacks), comparar com o menor
+`seq` presente não serviria.
+
+A `version` das linhas é a mesma versão do catálogo publicada no Redis
+(`catalog:version`, tools.redis_tools) para invalidar os caches de busca.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools.db_search import _get_connection, _return_connection
+
+logger = setup_logger(__name__)
+
+
+def changelog_table_name() -> str:
+    return f"{settings.postgres_products_table_name or 'produtos-sp-queiroz'}_changelog"
+
+
+def changelog_watermark_table_name() -> str:
+    return f"{changelog_table_name()}_watermark"
+
+
+def _float_or_none(value) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+def read_catalog_changes(cursor: int = 0, limit: int = 1000) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Mudanças com seq > cursor, em ordem. Retorna (mudanças, novo cursor).
+    Em erro retorna ([], cursor) para o consumidor tentar de novo depois.
+    """
+    conn = None
+    try:
+        conn = _get_connection()
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                sql.SQL(
+                    """
+                    SELECT seq, version, synced_at, product_id, change,
+                           old_preco, new_preco, old_estoque, new_estoque
+                    FROM {table}
+                    WHERE seq > %s
+                    ORDER BY seq
+                    LIMIT %s
+                    """
+                ).format(table=sql.Identifier(changelog_table_name())),
+                (cursor, limit),
+            )
+            rows = cur.fetchall() or []
+        conn.rollback()
+    except Exception as e:
+        logger.error(f"Erro ao ler changelog do catálogo: {e}")
+        if conn is not None:
+            conn.rollback()
+        return [], cursor
+    finally:
+        if conn is not None:
+            _return_connection(conn)
+
+    changes = []
+    for r in rows:
+        changes.append({
+            "seq": r["seq"],
+            "version": r["version"],
+            "synced_at": r["synced_at"].isoformat() if r["synced_at"] else None,
+            "product_id": r["product_id"],
+            "change": r["change"],
+            "old_preco": _float_or_none(r["old_preco"]),
+            "new_preco": _float_or_none(r["new_preco"]),
+            "old_estoque": _float_or_none(r["old_estoque"]),
+            "new_estoque": _float_or_none(r["new_estoque"]),
+        })
+    return changes, (changes[-1]["seq"] if changes else cursor)
+
+
+def catalog_changes_since_available(cursor: int) -> Optional[bool]:
+    """
+    False se mudanças posteriores ao cursor já foram podadas (reconstrução completa
+    necessária); None se não foi possível verificar.
+    """
+    conn = None
+    try:
+        conn = _get_connection()
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("SELECT pruned_through_seq FROM {table}").format(
+                    table=sql.Identifier(changelog_watermark_table_name())
+                )
+            )
+            row = cur.fetchone()
+        conn.rollback()
+        # Tudo com seq > pruned_through_seq continua no changelog
+        return row is None or cursor >= row[0]
+    except Exception as e:
+        logger.error(f"Erro ao verificar changelog do catálogo: {e}")
+        if conn is not None:
+            conn.rollback()
+        return None
+    finally:
+        if conn is not None:
+            _return_connection(conn)
+
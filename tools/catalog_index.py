@@ -0,0 +1,349 @@
+"""
+Índice de catálogo em memória para a busca de produtos.
+
+Mantém o catálogo ativo em memória com:
+- índice invertido de tokens (nome + descrição)
+- postings de trigramas de caracteres (mesma ideia do pg_trgm)
+
+Retorna linhas no mesmo formato que o SQL de `search_products_db` devolve,
+para que `_format_results` e o re-ranking funcionem sem mudanças.
+Quando o índice não está carregado, `search_catalog_index` retorna None e a
+busca cai para a cascata SQL.
+"""
+import re
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools.product_attributes import ATTRIBUTE_COLUMNS, ensure_attributes
+
+logger = setup_logger(__name__)
+
+# Mesmos limiares da busca híbrida no Postgres
+SIMILARITY_THRESHOLD = 0.2
+
+_ROW_FIELDS = ("id", "nome", "descricao", "preco", "estoque", "unidade", "categoria")
+
+
+def _fold(text: str) -> str:
+    """Minúsculas e sem acentos (equivalente a lower(unaccent(x)))."""
+    if not text:
+        return ""
+    return "".join(
+        ch
+        for ch in unicodedata.normalize("NFKD", str(text).lower())
+        if not unicodedata.combining(ch)
+    )
+
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in re.split(r"[^a-z0-9]+", _fold(text)) if t]
+
+
+def _trigrams(text: str) -> Set[str]:
+    """Trigramas no estilo pg_trgm: cada palavra recebe '  ' no início e ' ' no fim."""
+    out: Set[str] = set()
+    for word in _tokens(text):
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            out.add(padded[i:i + 3])
+    return out
+
+
+class SearchableCatalog(ABC):
+    """
+    Busca híbrida (FTS + trigram + ILIKE) sobre um catálogo com postings.
+    Subclasses fornecem o acesso aos dados: em memória (CatalogIndex) ou
+    arquivo mapeado em memória (tools.catalog_snapshot.CatalogSnapshot).
+    """
+
+    built_at: float = 0.0
+
+    @abstractmethod
+    def _token_postings_for(self, token: str) -> Sequence[int]:
+        ...
+
+    @abstractmethod
+    def _trigram_postings_for(self, trigram: str) -> Sequence[int]:
+        ...
+
+    @abstractmethod
+    def _doc_token_count(self, doc_id: int) -> int:
+        ...
+
+    @abstractmethod
+    def _doc_name_trigram_count(self, doc_id: int) -> int:
+        ...
+
+    @abstractmethod
+    def _doc_folded_text(self, doc_id: int) -> str:
+        ...
+
+    @abstractmethod
+    def _doc_row(self, doc_id: int) -> Dict[str, Any]:
+        ...
+
+    def search(self, query: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """Equivalente em memória da consulta híbrida (FTS + trigram + ILIKE)."""
+        q_tokens = _tokens(query)
+        q_folded = _fold(query).strip()
+        if not q_tokens or not q_folded:
+            return []
+        q_trgms = _trigrams(query)
+
+        # Contagem de trigramas compartilhados por documento (uma passada nas postings)
+        shared: Counter = Counter()
+        for g in q_trgms:
+            for doc_id in self._trigram_postings_for(g):
+                shared[doc_id] += 1
+
+        # Documentos que contêm todos os tokens (plainto_tsquery = AND dos termos)
+        postings = [self._token_postings_for(t) for t in set(q_tokens)]
+        fts_docs: Set[int] = set()
+        if all(len(p) for p in postings):
+            postings.sort(key=len)
+            fts_docs = set(postings[0])
+            for p in postings[1:]:
+                fts_docs.intersection_update(p)
+                if not fts_docs:
+                    break
+
+        n_q = max(len(q_trgms), 1)
+        scored = []
+        for doc_id in fts_docs | set(shared):
+            common = shared.get(doc_id, 0)
+            word_sim = common / n_q
+            union = n_q + self._doc_name_trigram_count(doc_id) - common
+            sim = common / union if union > 0 else 0.0
+            trgm_score = max(word_sim, sim)
+            is_fts = doc_id in fts_docs
+            if not (is_fts or trgm_score > SIMILARITY_THRESHOLD or q_folded in self._doc_folded_text(doc_id)):
+                continue
+            rank = 0.0
+            if is_fts:
+                doc_len = self._doc_token_count(doc_id)
+                rank = len(q_tokens) / max(doc_len, len(q_tokens))
+            scored.append((0.70 * rank + 0.30 * trgm_score, doc_id))
+
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [self._doc_row(doc_id) for _, doc_id in scored[:limit]]
+
+
+class CatalogIndex(SearchableCatalog):
+    """Snapshot imutável do catálogo. Reconstruído por inteiro e trocado de forma atômica."""
+
+    def __init__(self, rows: List[Dict[str, Any]], catalog_version: Optional[int] = None):
+        # Versão do catálogo (catalog:version no Redis) lida antes de carregar as linhas
+        self.catalog_version = catalog_version
+        # Atributos derivados (colunas do sync ou calculados aqui) ficam prontos no snapshot
+        self.rows: List[Dict[str, Any]] = [
+            ensure_attributes({k: r.get(k) for k in _ROW_FIELDS + ATTRIBUTE_COLUMNS}) for r in rows
+        ]
+        self.built_at = time.time()
+        self._token_postings: Dict[str, List[int]] = {}
+        self._trigram_postings: Dict[str, List[int]] = {}
+        self._doc_tokens: List[Set[str]] = []
+        self._doc_text: List[str] = []
+        self._name_trigram_count: List[int] = []
+
+        for doc_id, row in enumerate(self.rows):
+            nome = row.get("nome") or ""
+            descricao = row.get("descricao") or ""
+            toks = set(_tokens(f"{nome} {descricao}"))
+            self._doc_tokens.append(toks)
+            self._doc_text.append(f"{_fold(nome)}\n{_fold(descricao)}")
+            for t in toks:
+                self._token_postings.setdefault(t, []).append(doc_id)
+
+            name_trgms = _trigrams(nome)
+            self._name_trigram_count.append(len(name_trgms))
+            for g in name_trgms | _trigrams(descricao):
+                self._trigram_postings.setdefault(g, []).append(doc_id)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _token_postings_for(self, token: str) -> Sequence[int]:
+        return self._token_postings.get(token, ())
+
+    def _trigram_postings_for(self, trigram: str) -> Sequence[int]:
+        return self._trigram_postings.get(trigram, ())
+
+    def _doc_token_count(self, doc_id: int) -> int:
+        return len(self._doc_tokens[doc_id])
+
+    def _doc_name_trigram_count(self, doc_id: int) -> int:
+        return self._name_trigram_count[doc_id]
+
+    def _doc_folded_text(self, doc_id: int) -> str:
+        return self._doc_text[doc_id]
+
+    def _doc_row(self, doc_id: int) -> Dict[str, Any]:
+        return dict(self.rows[doc_id])
+
+
+# Índice ativo (troca atômica por atribuição)
+_active_index: Optional[CatalogIndex] = None
+_build_lock = threading.Lock()
+_loading_lock = threading.Lock()
+_loading = False
+_last_load_attempt: Optional[float] = None
+_version_checked_at = 0.0
+# Intervalo mínimo entre tentativas de carga em background (evita tempestade se o DB cair)
+_LOAD_RETRY_SECONDS = 30
+
+
+def _load_rows(conn) -> List[Dict[str, Any]]:
+    """
+    Linhas ativas do catálogo. Com a tabela migrada, traz também os atributos derivados
+    gravados no sync (ATTRIBUTE_COLUMNS), e ensure_attributes não precisa recalculá-los.
+    """
+    table_name = settings.postgres_products_table_name or "produtos-sp-queiroz"
+    with conn.cursor() as cur:
+        cur.execute(
+            "select column_name from information_schema.columns where table_name = %s",
+            (table_name,),
+        )
+        columns = {r[0] for r in (cur.fetchall() or [])}
+    fields = _ROW_FIELDS + (ATTRIBUTE_COLUMNS if set(ATTRIBUTE_COLUMNS) <= columns else ())
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(
+            sql.SQL(
+                """
+                SELECT {fields}
+                FROM {table}
+                WHERE coalesce(ativo, true)
+                """
+            ).format(
+                fields=sql.SQL(", ").join(sql.Identifier(f) for f in fields),
+                table=sql.Identifier(table_name),
+            )
+        )
+        return cur.fetchall() or []
+
+
+def rebuild_catalog_index(conn=None, catalog_version: Optional[int] = None) -> bool:
+    """
+    Reconstrói o índice a partir da tabela de produtos e troca o índice ativo.
+    Se `conn` não for informado, abre uma conexão própria. `catalog_version` é a
+    versão que o sync vai publicar; sem ela, usa a versão atual do Redis.
+    """
+    global _active_index
+    if not settings.catalog_index_enabled:
+        return False
+
+    with _build_lock:
+        own_conn = conn is None
+        start = time.monotonic()
+        try:
+            if catalog_version is None:
+                from tools.redis_tools import get_catalog_version
+
+                # Lida antes das linhas: um sync que termina durante a carga gera outra recarga
+                catalog_version = get_catalog_version()
+            if own_conn:
+                conn = psycopg2.connect(settings.postgres_connection_string)
+            rows = _load_rows(conn)
+            if own_conn:
+                conn.rollback()
+            new_index = CatalogIndex(rows, catalog_version)
+            _active_index = new_index
+            logger.info(
+                f"🗂️ Índice de catálogo em memória carregado: {len(new_index)} produtos "
+                f"em {(time.monotonic() - start) * 1000:.0f}ms"
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Falha ao construir índice de catálogo em memória: {e}")
+            return False
+        finally:
+            if own_conn and conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def _schedule_background_load() -> None:
+    global _loading, _last_load_attempt
+    with _loading_lock:
+        now = time.monotonic()
+        if _loading or (_last_load_attempt is not None and now - _last_load_attempt < _LOAD_RETRY_SECONDS):
+            return
+        _loading = True
+        _last_load_attempt = now
+
+    def _run():
+        global _loading
+        try:
+            rebuild_catalog_index()
+        finally:
+            _loading = False
+
+    threading.Thread(target=_run, daemon=True).start()
+
+
+def _catalog_version_changed(index: CatalogIndex) -> bool:
+    """
+    True se o sync publicou outra versão do catálogo desde a carga do índice
+    (relida do Redis a cada catalog_index_version_check_seconds). Processos que não
+    rodam o sync (worker ARQ, réplicas) recarregam por aqui.
+    """
+    global _version_checked_at
+    now = time.monotonic()
+    if now - _version_checked_at < settings.catalog_index_version_check_seconds:
+        return False
+    _version_checked_at = now
+    from tools.redis_tools import get_catalog_version
+
+    remote = get_catalog_version()
+    return remote is not None and remote != index.catalog_version
+
+
+def get_catalog_index() -> Optional[CatalogIndex]:
+    """
+    Retorna o índice ativo ou None se ainda não carregado.
+    A primeira chamada, índices vencidos e mudança de versão do catálogo disparam
+    carga em background, para nunca bloquear a busca.
+    """
+    if not settings.catalog_index_enabled:
+        return None
+    index = _active_index
+    max_age = settings.catalog_index_refresh_seconds
+    if (
+        index is None
+        or (max_age > 0 and time.time() - index.built_at > max_age)
+        or _catalog_version_changed(index)
+    ):
+        _schedule_background_load()
+    return index
+
+
+def search_catalog_index(query: str, limit: int = 8) -> Optional[List[Dict[str, Any]]]:
+    """
+    Busca no snapshot mapeado (se habilitado) ou no índice em memória.
+    Retorna None quando nenhum dos dois está disponível.
+    """
+    index: Optional[SearchableCatalog] = None
+    if settings.catalog_snapshot_enabled:
+        from tools.catalog_snapshot import get_catalog_snapshot
+
+        index = get_catalog_snapshot()
+    if index is None:
+        index = get_catalog_index()
+    if index is None:
+        return None
+    try:
+        return index.search(query, limit)
+    except Exception as e:
+        logger.warning(f"Falha na busca em memória, usando SQL: {e}")
+        return None
@@ -0,0 +1,317 @@
+"""
+Snapshot binário do catálogo, compartilhado entre processos via mmap.
+
+O sync (`sync_products_db`) grava um arquivo compacto e versionado com as
+linhas do catálogo (id, nome, preço, estoque, atributos derivados), o texto
+normalizado de cada produto e as postings de tokens/trigramas. Cada worker
+mapeia o arquivo somente-leitura: não há parse na subida e as páginas ficam
+no page cache do SO, uma cópia só para todos os processos.
+
+Layout (little-endian):
+    cabeçalho   magic "CATSNAP1", versão do formato, built_at, contagens,
+                offsets das seções
+    docs        (n+1) u64 offsets + registros JSON (linha do produto)
+    textos      (n+1) u32 offsets + texto normalizado (nome\\ndescricao)
+    contagens   u16 tokens por doc, u16 trigramas do nome por doc
+    dicionários tokens e trigramas ordenados por bytes: (k+1) pares u32
+                (offset da string, offset da posting) + strings + postings u32
+
+A busca (`CatalogSnapshot.search`) é a mesma do índice em memória
+(tools.catalog_index.SearchableCatalog), com busca binária nos dicionários.
+Arquivo ausente/inválido -> None e a busca cai para o índice em memória/SQL.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools.catalog_index import CatalogIndex, SearchableCatalog, _load_rows
+
+logger = setup_logger(__name__)
+
+SNAPSHOT_MAGIC = b"CATSNAP1"
+SNAPSHOT_FORMAT_VERSION = 1
+
+# magic, versão, built_at, n_docs, n_tokens, n_trigramas + 9 offsets de seção
+_HEADER = struct.Struct("<8sId III 9Q")
+_U16_MAX = 0xFFFF
+
+# Troca do arquivo pelo sync (mtime/inode) checada a cada poucos segundos
+_RELOAD_CHECK_SECONDS = 2.0
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _u32_bytes(values: Sequence[int]) -> bytes:
+    arr = array("I", values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _u16_bytes(values: Sequence[int]) -> bytes:
+    arr = array("H", (min(v, _U16_MAX) for v in values))
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _dictionary_sections(postings: Dict[str, List[int]]) -> Tuple[bytes, bytes, bytes]:
+    """(pares offset_string/offset_posting, strings, postings) com chaves ordenadas por bytes."""
+    keys = sorted((k.encode("utf-8"), k) for k in postings)
+    pairs: List[int] = []
+    strings = bytearray()
+    posting_ids: List[int] = []
+    for raw, key in keys:
+        pairs.extend((len(strings), len(posting_ids)))
+        strings += raw
+        posting_ids.extend(postings[key])
+    pairs.extend((len(strings), len(posting_ids)))
+    return _u32_bytes(pairs), bytes(strings), _u32_bytes(posting_ids)
+
+
+def _serialize(index: CatalogIndex) -> bytes:
+    records = bytearray()
+    record_offsets: List[int] = []
+    for row in index.rows:
+        record_offsets.append(len(records))
+        records += json.dumps(row, ensure_ascii=False, default=_json_default, separators=(",", ":")).encode("utf-8")
+    record_offsets.append(len(records))
+
+    texts = bytearray()
+    text_offsets: List[int] = []
+    for text in index._doc_text:
+        text_offsets.append(len(texts))
+        texts += text.encode("utf-8")
+    text_offsets.append(len(texts))
+
+    offsets_arr = array("Q", record_offsets)
+    if sys.byteorder != "little":
+        offsets_arr.byteswap()
+
+    tok_pairs, tok_strings, tok_postings = _dictionary_sections(index._token_postings)
+    trg_pairs, trg_strings, trg_postings = _dictionary_sections(index._trigram_postings)
+
+    sections = [
+        offsets_arr.tobytes() + bytes(records),
+        _u32_bytes(text_offsets) + bytes(texts),
+        _u16_bytes([len(t) for t in index._doc_tokens]),
+        _u16_bytes(index._name_trigram_count),
+        tok_pairs,
+        tok_strings + b"\0" * (-len(tok_strings) % 4) + tok_postings,
+        trg_pairs,
+        trg_strings + b"\0" * (-len(trg_strings) % 4) + trg_postings,
+    ]
+    section_offsets = []
+    pos = _HEADER.size
+    for blob in sections:
+        # Seções alinhadas em 8 bytes para os casts de memoryview
+        pos += -pos % 8
+        section_offsets.append(pos)
+        pos += len(blob)
+    section_offsets.append(pos)  # fim do arquivo
+
+    out = bytearray(
+        _HEADER.pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_FORMAT_VERSION,
+            index.built_at,
+            len(index.rows),
+            len(index._token_postings),
+            len(index._trigram_postings),
+            *section_offsets,
+        )
+    )
+    for start, blob in zip(section_offsets, sections):
+        out += b"\0" * (start - len(out))
+        out += blob
+    return bytes(out)
+
+
+class _MappedDictionary:
+    """Dicionário ordenado (chave -> posting) lido direto do mmap por busca binária."""
+
+    def __init__(self, buf: memoryview, pairs_at: int, strings_at: int, count: int):
+        self._buf = buf
+        self._pairs = buf[pairs_at:pairs_at + (count + 1) * 8].cast("I")
+        self._count = count
+        self._strings_at = strings_at
+        strings_len = self._pairs[2 * count]
+        postings_at = strings_at + strings_len + (-strings_len % 4)
+        postings_len = self._pairs[2 * count + 1]
+        self._postings = buf[postings_at:postings_at + postings_len * 4].cast("I")
+
+    def _key(self, i: int) -> bytes:
+        start = self._strings_at + self._pairs[2 * i]
+        end = self._strings_at + self._pairs[2 * i + 2]
+        return bytes(self._buf[start:end])
+
+    def get(self, key: str) -> Sequence[int]:
+        target = key.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key(lo) == target:
+            return self._postings[self._pairs[2 * lo + 1]:self._pairs[2 * lo + 3]]
+        return ()
+
+
+class CatalogSnapshot(SearchableCatalog):
+    """Catálogo mapeado em memória (somente leitura). Mesma busca do CatalogIndex."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.file_id = (st.st_mtime_ns, st.st_ino, st.st_size)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if sys.byteorder != "little":
+            raise ValueError("snapshot do catálogo exige host little-endian")
+        if len(self._mm) < _HEADER.size:
+            raise ValueError("snapshot truncado")
+        (
+            magic, version, built_at, n_docs, n_tokens, n_trigrams,
+            docs_at, texts_at, tok_count_at, trg_count_at,
+            tok_pairs_at, tok_data_at, trg_pairs_at, trg_data_at, end_at,
+        ) = _HEADER.unpack_from(self._mm, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"formato de snapshot desconhecido ({magic!r} v{version})")
+        if end_at != len(self._mm):
+            raise ValueError("tamanho do snapshot não confere com o cabeçalho")
+
+        buf = memoryview(self._mm)
+        self.built_at = built_at
+        self._n_docs = n_docs
+        self._buf = buf
+        self._record_offsets = buf[docs_at:docs_at + (n_docs + 1) * 8].cast("Q")
+        self._records_at = docs_at + (n_docs + 1) * 8
+        self._text_offsets = buf[texts_at:texts_at + (n_docs + 1) * 4].cast("I")
+        self._texts_at = texts_at + (n_docs + 1) * 4
+        self._token_count = buf[tok_count_at:tok_count_at + n_docs * 2].cast("H")
+        self._name_trgm_count = buf[trg_count_at:trg_count_at + n_docs * 2].cast("H")
+        self._tokens = _MappedDictionary(buf, tok_pairs_at, tok_data_at, n_tokens)
+        self._trigrams = _MappedDictionary(buf, trg_pairs_at, trg_data_at, n_trigrams)
+
+    def __len__(self) -> int:
+        return self._n_docs
+
+    def _token_postings_for(self, token: str) -> Sequence[int]:
+        return self._tokens.get(token)
+
+    def _trigram_postings_for(self, trigram: str) -> Sequence[int]:
+        return self._trigrams.get(trigram)
+
+    def _doc_token_count(self, doc_id: int) -> int:
+        return self._token_count[doc_id]
+
+    def _doc_name_trigram_count(self, doc_id: int) -> int:
+        return self._name_trgm_count[doc_id]
+
+    def _doc_folded_text(self, doc_id: int) -> str:
+        start = self._texts_at + self._text_offsets[doc_id]
+        end = self._texts_at + self._text_offsets[doc_id + 1]
+        return bytes(self._buf[start:end]).decode("utf-8")
+
+    def _doc_row(self, doc_id: int) -> Dict[str, Any]:
+        start = self._records_at + self._record_offsets[doc_id]
+        end = self._records_at + self._record_offsets[doc_id + 1]
+        return json.loads(bytes(self._buf[start:end]))
+
+
+def write_catalog_snapshot(
+    conn=None,
+    rows: Optional[List[Dict[str, Any]]] = None,
+    path: Optional[str] = None,
+    if_missing: bool = False,
+) -> bool:
+    """
+    Gera o snapshot a partir da tabela de produtos (ou de `rows`) e troca o
+    arquivo de forma atômica (tmp + fsync + rename). Chamado no sync.
+    `if_missing`: só grava se ainda não houver arquivo (sync sem mudanças).
+    """
+    if not settings.catalog_snapshot_enabled and path is None:
+        return False
+    path = path or settings.catalog_snapshot_path
+    if if_missing and os.path.exists(path):
+        return False
+    start = time.monotonic()
+    tmp_path = None
+    try:
+        if rows is None:
+            rows = _load_rows(conn)
+        data = _serialize(CatalogIndex(rows))
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".catalog-", suffix=".snap.tmp", dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        tmp_path = None
+        logger.info(
+            f"💾 Snapshot do catálogo gravado: {len(rows)} produtos, {len(data) / 1024:.0f}KB "
+            f"em {(time.monotonic() - start) * 1000:.0f}ms ({path})"
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Falha ao gravar snapshot do catálogo: {e}")
+        return False
+    finally:
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+# Snapshot ativo (troca atômica por atribuição; o mmap antigo é liberado pelo GC)
+_active: Optional[CatalogSnapshot] = None
+_checked_at = 0.0
+_load_lock = threading.Lock()
+
+
+def get_catalog_snapshot() -> Optional[CatalogSnapshot]:
+    """Snapshot mapeado; reabre quando o sync troca o arquivo. None se ausente/desligado."""
+    global _active, _checked_at
+    if not settings.catalog_snapshot_enabled:
+        return None
+    now = time.monotonic()
+    if _checked_at and now - _checked_at < _RELOAD_CHECK_SECONDS:
+        return _active
+    if not _load_lock.acquire(blocking=False):
+        return _active
+    try:
+        _checked_at = now
+        path = settings.catalog_snapshot_path
+        try:
+            st = os.stat(path)
+        except OSError:
+            return _active
+        if _active is not None and _active.file_id == (st.st_mtime_ns, st.st_ino, st.st_size):
+            return _active
+        try:
+            _active = CatalogSnapshot(path)
+            logger.info(f"💾 Snapshot do catálogo mapeado: {len(_active)} produtos ({path})")
+        except Exception as e:
+            logger.warning(f"Snapshot do catálogo inválido, ignorando: {e}")
+    finally:
+        _load_lock.release()
+    return _active
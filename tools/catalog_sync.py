@@ -0,0 +1,159 @@
+"""
+Agendamento do sync do catálogo com um único líder entre réplicas.
+
+Cada processo web registra o job no APScheduler, mas só quem pega o lease
+no Redis (`lease:catalog_sync`) executa o `sync_products_db`. O último run
+fica gravado em `catalog_sync:last_run`; um tick que encontra um sync recente
+(feito por outra réplica ou antes do deploy) não faz nada. O primeiro tick
+sai com jitter após o startup, então deploys não disparam N syncs de uma vez.
+
+Também expõe o disparo manual e o status (GET/POST /admin/catalog/sync).
+"""
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools.redis_tools import acquire_lease, get_lease_holder, get_redis_client, release_lease, renew_lease
+
+logger = setup_logger(__name__)
+
+SYNC_LEASE_NAME = "catalog_sync"
+SYNC_LAST_RUN_KEY = "catalog_sync:last_run"
+SYNC_JOB_ID = "sync_products_job"
+
+# Último run deste processo (fallback sem Redis)
+_local_last_run: Optional[Dict[str, Any]] = None
+
+
+def get_last_sync_run() -> Optional[Dict[str, Any]]:
+    client = get_redis_client()
+    if client is not None:
+        try:
+            data = client.get(SYNC_LAST_RUN_KEY)
+            if data:
+                return json.loads(data)
+        except Exception as e:
+            logger.warning(f"Erro ao ler último sync do catálogo: {e}")
+    return _local_last_run
+
+
+def _save_last_sync_run(run: Dict[str, Any]) -> None:
+    global _local_last_run
+    _local_last_run = run
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.set(SYNC_LAST_RUN_KEY, json.dumps(run))
+    except Exception as e:
+        logger.warning(f"Erro ao gravar último sync do catálogo: {e}")
+
+
+def _sync_is_fresh() -> bool:
+    """Já houve sync bem-sucedido dentro do intervalo (descontado o jitter)?"""
+    last = get_last_sync_run()
+    if not last or not last.get("ok"):
+        return False
+    min_age = settings.catalog_sync_interval_seconds - settings.catalog_sync_jitter_seconds
+    return time.time() - float(last.get("finished_at") or 0) < max(min_age, 0)
+
+
+def _heartbeat(token: str, stop: threading.Event) -> None:
+    ttl = settings.catalog_sync_lease_seconds
+    while not stop.wait(max(ttl / 3, 1)):
+        if not renew_lease(SYNC_LEASE_NAME, token, ttl):
+            logger.warning("⚠️ Lease do sync do catálogo perdido durante a execução")
+            return
+
+
+def run_catalog_sync(full: bool = False, trigger: str = "schedule", force: bool = False) -> Dict[str, Any]:
+    """
+    Executa o sync se este processo conseguir o lease de líder.
+    `force` ignora o controle de último run (disparo manual), mas nunca o lease.
+    """
+    if not force and _sync_is_fresh():
+        logger.debug("Sync do catálogo recente; tick ignorado")
+        return {"started": False, "reason": "fresh"}
+
+    token = acquire_lease(SYNC_LEASE_NAME, settings.catalog_sync_lease_seconds)
+    if token is None:
+        holder = get_lease_holder(SYNC_LEASE_NAME)
+        logger.info(f"⏭️ Sync do catálogo já em execução em outra réplica ({holder})")
+        return {"started": False, "reason": "leased", "holder": holder}
+
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(token, stop), daemon=True).start()
+    try:
+        # Releitura sob o lease: outra réplica pode ter terminado entre o check e o SET NX
+        if not force and _sync_is_fresh():
+            return {"started": False, "reason": "fresh"}
+
+        from scripts.populate_products_db import sync_products_db
+
+        started_at = time.time()
+        logger.info(f"🔄 Sync do catálogo iniciado ({trigger}{', completo' if full else ''})")
+        try:
+            ok = bool(sync_products_db(full_reload=full))
+        except Exception as e:
+            logger.error(f"Sync do catálogo falhou: {e}")
+            ok = False
+        run = {
+            "ok": ok,
+            "full": full,
+            "trigger": trigger,
+            "owner": token,
+            "started_at": started_at,
+            "finished_at": time.time(),
+            "duration_seconds": round(time.time() - started_at, 1),
+        }
+        # Falha num disparo manual não apaga um sync recente bem-sucedido
+        if ok or not _sync_is_fresh():
+            _save_last_sync_run(run)
+        return {"started": True, **run}
+    finally:
+        stop.set()
+        release_lease(SYNC_LEASE_NAME, token)
+
+
+def trigger_catalog_sync(full: bool = False) -> Dict[str, Any]:
+    """Disparo manual em background. Retorna na hora; o resultado fica em get_last_sync_run()."""
+    holder = get_lease_holder(SYNC_LEASE_NAME)
+    if holder:
+        return {"accepted": False, "reason": "leased", "holder": holder}
+    threading.Thread(
+        target=run_catalog_sync, kwargs={"full": full, "trigger": "manual", "force": True}, daemon=True
+    ).start()
+    return {"accepted": True, "full": full}
+
+
+def get_catalog_sync_status() -> Dict[str, Any]:
+    return {"leader": get_lease_holder(SYNC_LEASE_NAME), "last_run": get_last_sync_run()}
+
+
+def schedule_catalog_sync(scheduler) -> None:
+    """
+    Registra o job periódico (intervalo + jitter). O primeiro tick sai após um atraso
+    aleatório em vez de imediatamente, e só sincroniza se o último run estiver vencido.
+    """
+    jitter = max(int(settings.catalog_sync_jitter_seconds), 0)
+    first_run = datetime.now() + timedelta(seconds=random.uniform(0, jitter) + 5)
+    scheduler.add_job(
+        run_catalog_sync,
+        "interval",
+        seconds=settings.catalog_sync_interval_seconds,
+        jitter=jitter or None,
+        next_run_time=first_run,
+        id=SYNC_JOB_ID,
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+    )
+    logger.info(
+        f"⏰ Sync do catálogo agendado a cada {settings.catalog_sync_interval_seconds}s "
+        f"(jitter {jitter}s, líder via Redis); primeiro tick às {first_run:%H:%M:%S}"
+    )
@@ -1,9 +1,11 @@
 
 import json
+import os
 import re
+import time
 import unicodedata
 import difflib
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import threading
 
 import psycopg2
@@ -14,6 +16,16 @@ from psycopg2.extras import RealDictCursor
 from config.settings import settings
 from config.logger import setup_logger
 from tools.redis_tools import save_suggestions
+from tools.catalog_index import search_catalog_index
+from tools.search_cache import get_cached_search, set_cached_search
+from tools.reranker import QueryScorer, char_index
+from tools.spell_corrector import correct_query
+from tools.product_attributes import (
+    ATTRIBUTE_COLUMNS,
+    ensure_attributes,
+    strip_accents as _strip_accents,
+    tokenize_for_match as _tokenize_for_match,
+)
 
 logger = setup_logger(__name__)
 
@@ -54,6 +66,7 @@ def _return_connection(conn):
         except Exception:
             pass
     # Se pool não disponível, fecha diretamente
+    _forget_prepared(conn)
     try:
         conn.close()
     except Exception:
@@ -61,6 +74,13 @@ def _return_connection(conn):
 
 
 _TERM_TRANSLATIONS_CACHE: Optional[Dict[str, str]] = None
+# Trie de tokens com as chaves multi-palavra (nó: {token: filho, None: tradução})
+_TERM_TRIE: Dict[Optional[str], Any] = {}
+_TERM_TRANSLATIONS_MTIME: Optional[float] = None
+_TERM_TRANSLATIONS_CHECKED_AT = 0.0
+_TERM_TRANSLATIONS_LOCK = threading.Lock()
+# Intervalo mínimo entre os os.stat() do arquivo de traduções (recarga a quente)
+_TERM_TRANSLATIONS_CHECK_SECONDS = 2.0
 
 _UNIT_NORMALIZATION = {
     "lts": "l",
@@ -115,44 +135,101 @@ def _extract_unit_token(query: str) -> Optional[str]:
     return f"{num}{unit}"
 
 
-def _text_has_unit(text: str, unit_token: str) -> bool:
-    if not text or not unit_token:
-        return False
-    m = re.match(r"^(\d+(?:\.\d+)?)(l|kg|g|ml)$", unit_token)
-    if not m:
-        return False
-    num = re.escape(m.group(1))
-    unit = re.escape(m.group(2))
-    pattern = re.compile(rf"\b{num}\s*{unit}\b", re.IGNORECASE)
-    return bool(pattern.search(text))
-
-
 def _normalize_query_text(text: str) -> str:
     text = (text or "").strip()
     text = re.sub(r"\s+", " ", text)
     return text
 
 
+def _build_term_trie(translations: Dict[str, str]) -> Dict[Optional[str], Any]:
+    trie: Dict[Optional[str], Any] = {}
+    for key, value in translations.items():
+        key_tokens = key.split()
+        if len(key_tokens) < 2:
+            continue
+        node = trie
+        for tok in key_tokens:
+            node = node.setdefault(tok, {})
+        node[None] = value
+    return trie
+
+
 def _load_term_translations() -> Dict[str, str]:
-    global _TERM_TRANSLATIONS_CACHE
-    if _TERM_TRANSLATIONS_CACHE is not None:
+    """
+    Carrega prompts/term_translations.json e compila a trie de chaves multi-palavra.
+    Recarrega sozinho quando o mtime do arquivo muda (checado a cada poucos segundos).
+    """
+    global _TERM_TRANSLATIONS_CACHE, _TERM_TRIE, _TERM_TRANSLATIONS_MTIME, _TERM_TRANSLATIONS_CHECKED_AT
+    now = time.monotonic()
+    if _TERM_TRANSLATIONS_CACHE is not None and now - _TERM_TRANSLATIONS_CHECKED_AT < _TERM_TRANSLATIONS_CHECK_SECONDS:
         return _TERM_TRANSLATIONS_CACHE
-    path = getattr(settings, "term_translations_path", "") or ""
-    if not path:
-        _TERM_TRANSLATIONS_CACHE = {}
+
+    with _TERM_TRANSLATIONS_LOCK:
+        if _TERM_TRANSLATIONS_CACHE is not None and now - _TERM_TRANSLATIONS_CHECKED_AT < _TERM_TRANSLATIONS_CHECK_SECONDS:
+            return _TERM_TRANSLATIONS_CACHE
+        _TERM_TRANSLATIONS_CHECKED_AT = now
+
+        path = getattr(settings, "term_translations_path", "") or ""
+        try:
+            mtime = os.stat(path).st_mtime if path else None
+        except OSError:
+            mtime = None
+        if _TERM_TRANSLATIONS_CACHE is not None and mtime == _TERM_TRANSLATIONS_MTIME:
+            return _TERM_TRANSLATIONS_CACHE
+
+        translations: Dict[str, str] = {}
+        if mtime is not None:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    translations = {
+                        str(k).strip().lower(): str(v).strip() for k, v in data.items() if k and v
+                    }
+            except Exception as e:
+                logger.warning(f"Falha ao carregar traduções de termos ({path}): {e}")
+                if _TERM_TRANSLATIONS_CACHE is not None:
+                    # JSON no meio de uma edição: mantém a versão anterior e tenta de novo depois
+                    return _TERM_TRANSLATIONS_CACHE
+
+        _TERM_TRIE = _build_term_trie(translations)
+        _TERM_TRANSLATIONS_CACHE = translations
+        if _TERM_TRANSLATIONS_MTIME is not None:
+            logger.info(f"🔁 Traduções de termos recarregadas: {len(translations)} entradas")
+        _TERM_TRANSLATIONS_MTIME = mtime
         return _TERM_TRANSLATIONS_CACHE
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, dict):
-            _TERM_TRANSLATIONS_CACHE = {
-                str(k).strip().lower(): str(v).strip() for k, v in data.items() if k and v
-            }
+
+
+def _translate_tokens(tokens: List[str], translations: Dict[str, str], trie: Dict[Optional[str], Any]) -> List[str]:
+    """
+    Passada única sobre os tokens:
+    - FASE 1: maior chave multi-palavra que casa a partir da posição (ex: "frango inteiro" → "frango abatido")
+    - FASE 2: tradução de palavra individual, inclusive nas palavras vindas da fase 1
+    O custo depende do tamanho da consulta, não do tamanho do dicionário.
+    """
+    out: List[str] = []
+    i = 0
+    n = len(tokens)
+    while i < n:
+        node = trie
+        match = None
+        match_end = i
+        j = i
+        while j < n:
+            node = node.get(tokens[j])
+            if node is None:
+                break
+            j += 1
+            if None in node:
+                match = node[None]
+                match_end = j
+        if match is not None:
+            out.extend(translations.get(w, w) for w in match.split())
+            i = match_end
         else:
-            _TERM_TRANSLATIONS_CACHE = {}
-    except Exception:
-        _TERM_TRANSLATIONS_CACHE = {}
-    return _TERM_TRANSLATIONS_CACHE
+            out.append(translations.get(tokens[i], tokens[i]))
+            i += 1
+    return out
 
 
 def _apply_term_translations(query: str) -> str:
@@ -192,54 +269,11 @@ def _apply_term_translations(query: str) -> str:
     if not translations:
         return " ".join(cleaned_tokens).strip() or q
 
-    # FASE 1: Substituições multi-palavra (ex: "frango inteiro" → "frango abatido")
-    # Checar pares e trios de tokens contra o dicionário
-    multi_keys = {k for k in translations if " " in k}
-    joined = " ".join(cleaned_tokens)
-    for mk in sorted(multi_keys, key=len, reverse=True):  # mais longo primeiro
-        if mk in joined:
-            joined = joined.replace(mk, translations[mk])
-    
-    # FASE 2: Substituições de palavra individual para tokens restantes
-    final_tokens = joined.split(" ")
-    replaced = [translations.get(w, w) for w in final_tokens if w]
+    replaced = _translate_tokens(cleaned_tokens, translations, _TERM_TRIE)
     out = " ".join(replaced).strip()
     return out or q
 
 
-def _strip_accents(text: str) -> str:
-    if not text:
-        return ""
-    return "".join(
-        ch
-        for ch in unicodedata.normalize("NFKD", text)
-        if not unicodedata.combining(ch)
-    )
-
-
-def _tokenize_for_match(text: str) -> List[str]:
-    t = _strip_accents((text or "").lower())
-    t = re.sub(r"[^a-z0-9]+", " ", t)
-    tokens = [x for x in t.split(" ") if x]
-    drop_tokens = {
-        "de",
-        "da",
-        "do",
-        "das",
-        "dos",
-        "a",
-        "o",
-        "as",
-        "os",
-        "um",
-        "uma",
-        "uns",
-        "umas",
-        "e",
-    }
-    return [t for t in tokens if t and t not in drop_tokens]
-
-
 def _score_match(query: str, name: str, category: str) -> float:
     q_tokens = _tokenize_for_match(_normalize_units_in_text(query))
     if not q_tokens:
@@ -256,6 +290,38 @@ def _score_match(query: str, name: str, category: str) -> float:
     return round(0.6 * overlap + 0.4 * ratio, 4)
 
 
+# Features de re-ranking por produto: id -> (nome, categoria, (tokens, nome_norm, char_index))
+_MATCH_FEATURES_CACHE: Dict[str, Tuple[str, str, Tuple[frozenset, str, Dict]]] = {}
+_MATCH_FEATURES_MAX = 50000
+
+
+def _product_match_features(row: Dict[str, Any]) -> Tuple[frozenset, str, Dict]:
+    """Tokens (nome + categoria), nome normalizado e índice de caracteres, cacheados por id do produto."""
+    name = row.get("nome") or ""
+    category = row.get("categoria") or ""
+    pid = str(row.get("id") or "")
+    cached = _MATCH_FEATURES_CACHE.get(pid) if pid else None
+    if cached is not None and cached[0] == name and cached[1] == category:
+        return cached[2]
+
+    # nome_norm vem pronto do sync (atributos derivados); senão tokeniza aqui
+    name_norm = row.get("nome_norm")
+    name_tokens = name_norm.split() if name_norm is not None else _tokenize_for_match(name)
+    name_norm = " ".join(name_tokens)
+    features = (frozenset(name_tokens + _tokenize_for_match(category)), name_norm, char_index(name_norm))
+    if pid:
+        if len(_MATCH_FEATURES_CACHE) >= _MATCH_FEATURES_MAX:
+            _MATCH_FEATURES_CACHE.clear()
+        _MATCH_FEATURES_CACHE[pid] = (name, category, features)
+    return features
+
+
+def _score_candidates(query: str, rows: List[Dict[str, Any]]) -> List[float]:
+    """Mesma semântica de _score_match para o lote: consulta tokenizada uma única vez."""
+    scorer = QueryScorer(_tokenize_for_match(_normalize_units_in_text(query)))
+    return scorer.score_many([_product_match_features(r) for r in rows])
+
+
 def _safe_float(v: Any, default: float = 0.0) -> float:
     try:
         if v is None:
@@ -268,34 +334,23 @@ def _safe_float(v: Any, default: float = 0.0) -> float:
 def _format_results(rows: List[Dict[str, Any]]) -> str:
     output: List[Dict[str, Any]] = []
     for row in rows:
+        ensure_attributes(row)
         estoque_val = _safe_float(row.get("estoque"), 0.0)
-        categoria = row.get("categoria") or ""
-        # Frigorífico e Hortifruti sempre disponíveis (vendido por peso ou variável)
-        # Palavras-chave que indicam produtos que não devem validar estoque zerado
-        keywords_ignore = ["frigori", "acougue", "açougue", "bovinos", "horti", "legume", "verdura", "fruta", "aves", "frios", "embutidos", "flv"]
-        nome_lower = (row.get("nome") or "").lower()
-        is_ignora_estoque = any(k in categoria.lower() for k in keywords_ignore)
-        
-        # Fallback: se o nome termina com "kg" e categoria não é limpeza/higiene/bebida/mercearia, provavelmente é produto fresco
-        if not is_ignora_estoque and nome_lower.strip().endswith("kg"):
-            categorias_excluidas = ["limpeza", "higiene", "bebida", "mercearia"]
-            if not any(c in categoria.lower() for c in categorias_excluidas):
-                is_ignora_estoque = True
-        
-        # Se for um desses itens e estoque vier zerado/negativo, forçamos um valor positivo
+        # Frigorífico/Hortifruti/pesáveis (ignore_stock, calculado no sync) sempre disponíveis:
+        # se o estoque vier zerado/negativo, forçamos um valor positivo
+        is_ignora_estoque = bool(row.get("ignore_stock"))
         if is_ignora_estoque and estoque_val <= 0:
-             estoque_val = 100.0
-             
-        sem_estoque = estoque_val <= 0 and not is_ignora_estoque
-        
+            estoque_val = 100.0
+
         # Produtos sem estoque são completamente omitidos dos resultados
-        if sem_estoque:
+        if estoque_val <= 0 and not is_ignora_estoque:
             continue
-        
+
         item = {
             "id": row.get("id"),
             "nome": row.get("nome") or "Produto sem nome",
-            "categoria": categoria,
+            "categoria": row.get("categoria") or "",
+            "familia": row.get("familia") or "",
             "preco": _safe_float(row.get("preco"), 0.0),
             "estoque": estoque_val,
             "unidade": row.get("unidade") or "UN",
@@ -306,297 +361,734 @@ def _format_results(rows: List[Dict[str, Any]]) -> str:
     return json.dumps(output, ensure_ascii=False)
 
 
-def search_products_db(query: str, limit: int = 8, telefone: Optional[str] = None) -> str:
-    """Busca produtos no Postgres.
+# Busca híbrida original: calcula unaccent()/to_tsvector() por linha (seq scan)
+_HYBRID_SQL = """
+    SELECT {select}
+    FROM {table}
+    WHERE {active}(
+        to_tsvector('simple', unaccent(coalesce(nome,'') || ' ' || coalesce(descricao,'')))
+            @@ plainto_tsquery('simple', unaccent(%(q)s))
+        OR unaccent(nome) ILIKE unaccent(%(like)s)
+        OR unaccent(descricao) ILIKE unaccent(%(like)s)
+        OR word_similarity(unaccent(%(q)s), unaccent(nome)) > 0.2
+        OR word_similarity(unaccent(%(q)s), unaccent(descricao)) > 0.2
+        OR similarity(unaccent(nome), unaccent(%(q)s)) > 0.2
+        OR similarity(unaccent(descricao), unaccent(%(q)s)) > 0.2
+    )
+    ORDER BY {unit_first}(
+        0.70 * ts_rank_cd(
+            to_tsvector('simple', unaccent(coalesce(nome,'') || ' ' || coalesce(descricao,''))),
+            plainto_tsquery('simple', unaccent(%(q)s))
+        )
+        + 0.30 * GREATEST(
+            word_similarity(unaccent(%(q)s), unaccent(nome)),
+            word_similarity(unaccent(%(q)s), unaccent(descricao)),
+            similarity(unaccent(nome), unaccent(%(q)s)),
+            similarity(unaccent(descricao), unaccent(%(q)s))
+        )
+    ) DESC
+    LIMIT %(limit)s
+"""
+
+# Mesma semântica, escrita para os índices criados por migrate_search_schema:
+# - search_tsv (tsvector gerado/armazenado) com GIN
+# - GIN gin_trgm_ops em immutable_unaccent(nome) / immutable_unaccent(descricao)
+# Os operadores % e <% usam os limiares da sessão, fixados em 0.2 (_TRGM_THRESHOLD_SQL).
+# Os argumentos são constantes no plano (funções IMMUTABLE), então o planner usa BitmapOr nos índices.
+_TRGM_THRESHOLD_SQL = """
+    SET LOCAL pg_trgm.similarity_threshold = 0.2;
+    SET LOCAL pg_trgm.word_similarity_threshold = 0.2;
+"""
+
+_INDEXED_HYBRID_SQL = """
+    SELECT {select}
+    FROM {table}
+    WHERE {active}(
+        search_tsv @@ plainto_tsquery('simple', immutable_unaccent(%(q)s))
+        OR immutable_unaccent(nome) ILIKE immutable_unaccent(%(like)s)
+        OR immutable_unaccent(descricao) ILIKE immutable_unaccent(%(like)s)
+        OR immutable_unaccent(%(q)s) <%% immutable_unaccent(nome)
+        OR immutable_unaccent(%(q)s) <%% immutable_unaccent(descricao)
+        OR immutable_unaccent(nome) %% immutable_unaccent(%(q)s)
+        OR immutable_unaccent(descricao) %% immutable_unaccent(%(q)s)
+    )
+    ORDER BY {unit_first}(
+        0.70 * ts_rank_cd(search_tsv, plainto_tsquery('simple', immutable_unaccent(%(q)s)))
+        + 0.30 * GREATEST(
+            word_similarity(immutable_unaccent(%(q)s), immutable_unaccent(nome)),
+            word_similarity(immutable_unaccent(%(q)s), immutable_unaccent(descricao)),
+            similarity(immutable_unaccent(nome), immutable_unaccent(%(q)s)),
+            similarity(immutable_unaccent(descricao), immutable_unaccent(%(q)s))
+        )
+    ) DESC
+    LIMIT %(limit)s
+"""
 
-    Estratégia (tentativas em cascata):
-    1) Busca híbrida (FTS + trigram + ILIKE) se extensões existirem
-    2) Fallback para ILIKE com unaccent
-    3) Fallback final para ILIKE simples (sem unaccent)
 
-    Retorna SEMPRE um JSON (lista) para manter o contrato da tool.
+_BASE_COLUMNS = ("id", "nome", "preco", "estoque", "unidade", "categoria")
+
+
+# Embalagem pedida na ordenação: parâmetro na busca simples, coluna do unnest no lote
+_SINGLE_UNIT_EXPR = "%(unit)s"
+_BATCH_UNIT_EXPR = "b.unit"
+
+
+def _format_search_sql(
+    template: str,
+    table_ident: sql.Identifier,
+    with_attributes: bool = False,
+    with_active: bool = False,
+    unit_expr: str = _SINGLE_UNIT_EXPR,
+) -> sql.Composed:
+    """
+    Preenche {table}, {select}, o filtro de ativos e a ordenação por embalagem de um template de busca.
+    Com os atributos derivados (colunas do sync), a consulta já traz ignore_stock/
+    familia/... e ordena primeiro os produtos com a embalagem pedida (unit_tokens).
+    Com a coluna `ativo`, produtos desativados pelo sync (sumiram do feed) ficam de fora.
+    `unit_expr` é a embalagem comparada: _SINGLE_UNIT_EXPR ou _BATCH_UNIT_EXPR (lote).
     """
+    columns = _BASE_COLUMNS + (ATTRIBUTE_COLUMNS if with_attributes else ())
+    unit_match = f"coalesce({unit_expr} = ANY(unit_tokens), false) DESC"
+    return sql.SQL(template).format(
+        table=table_ident,
+        active=sql.SQL("coalesce(ativo, true) AND " if with_active else ""),
+        select=sql.SQL(", ").join(sql.Identifier(c) for c in columns),
+        unit_first=sql.SQL(unit_match + ", " if with_attributes else ""),
+        unit_order=sql.SQL("ORDER BY " + unit_match if with_attributes else ""),
+    )
+
+
+# Variantes da busca, da melhor para a mais simples. Cada uma declara do que precisa:
+# extensões, colunas e se existe o schema indexado (search_tsv + immutable_unaccent).
+# Todas usam os mesmos parâmetros nomeados: q, like, like_na (sem acentos), unit, limit.
+_SEARCH_VARIANTS = [
+    {
+        # 1a) Busca híbrida servida pelos índices GIN (migração de populate_products_db)
+        "name": "hibrida_indexada",
+        "needs_ext": {"unaccent", "pg_trgm"},
+        "needs_cols": {"nome", "descricao", "search_tsv"},
+        "needs_indexed": True,
+        "prefix": _TRGM_THRESHOLD_SQL,
+        "sql": _INDEXED_HYBRID_SQL,
+        "batch": True,
+    },
+    {
+        # 1b) Híbrida sem índices (tabelas ainda não migradas)
+        "name": "hibrida",
+        "needs_ext": {"unaccent", "pg_trgm"},
+        "needs_cols": {"nome", "descricao"},
+        "sql": _HYBRID_SQL,
+        "batch": True,
+    },
+    {
+        "name": "trigram",
+        "needs_ext": {"unaccent", "pg_trgm"},
+        "needs_cols": {"nome", "descricao"},
+        "sql": """
+            SELECT {select}
+            FROM {table}
+            WHERE {active}(
+                word_similarity(unaccent(%(q)s), unaccent(nome)) > 0.2
+                OR word_similarity(unaccent(%(q)s), unaccent(descricao)) > 0.2
+            )
+            ORDER BY {unit_first}GREATEST(
+                word_similarity(unaccent(%(q)s), unaccent(nome)),
+                word_similarity(unaccent(%(q)s), unaccent(descricao))
+            ) DESC
+            LIMIT %(limit)s
+        """,
+    },
+    {
+        # 2) ILIKE com unaccent (mais simples, ainda bem útil)
+        "name": "ilike_unaccent",
+        "needs_ext": {"unaccent"},
+        "needs_cols": {"nome", "descricao"},
+        "sql": """
+            SELECT {select}
+            FROM {table}
+            WHERE {active}(
+                unaccent(nome) ILIKE unaccent(%(like)s)
+                OR unaccent(descricao) ILIKE unaccent(%(like)s)
+            )
+            {unit_order}
+            LIMIT %(limit)s
+        """,
+    },
+    {
+        # 3) ILIKE sem unaccent (fallback se a extensão unaccent não existir)
+        "name": "ilike",
+        "needs_ext": set(),
+        "needs_cols": {"nome", "descricao"},
+        "sql": """
+            SELECT {select}
+            FROM {table}
+            WHERE {active}(
+                nome ILIKE %(like)s
+                OR descricao ILIKE %(like)s
+                OR nome ILIKE %(like_na)s
+                OR descricao ILIKE %(like_na)s
+            )
+            {unit_order}
+            LIMIT %(limit)s
+        """,
+    },
+    {
+        # 4) Só por nome (se a tabela não tiver coluna descricao)
+        "name": "ilike_nome",
+        "needs_ext": set(),
+        "needs_cols": {"nome"},
+        "sql": """
+            SELECT {select}
+            FROM {table}
+            WHERE {active}(
+                nome ILIKE %(like)s
+                OR nome ILIKE %(like_na)s
+            )
+            {unit_order}
+            LIMIT %(limit)s
+        """,
+    },
+]
+
+# Plano de busca resolvido (tabela + variante). Sondado uma vez; refeito após sync ou erro.
+_search_plan: Optional[Dict[str, Any]] = None
+_plan_lock = threading.Lock()
+_plan_seq = 0
+
+# Statements preparados no servidor (PREPARE/EXECUTE), por conexão do pool:
+# id(conn) -> (backend_pid, nomes preparados). O pid evita confundir conexões recriadas.
+_prepared: Dict[int, Tuple[int, set]] = {}
+_prepared_lock = threading.Lock()
+_PARAM_TYPES = {
+    "q": "text", "like": "text", "like_na": "text", "unit": "text", "limit": "int",
+    "qs": "text[]", "likes": "text[]", "units": "text[]",
+}
+_NAMED_PARAM_RE = re.compile(r"%\((\w+)\)s")
+
+
+def _prepared_spec(conn, name: str, query: sql.Composable) -> Dict[str, Any]:
+    """
+    Converte a consulta com parâmetros nomeados para o texto do PREPARE:
+    cada nome vira um único $n (q aparece 8x na híbrida, mas é enviado uma vez).
+    """
+    order: List[str] = []
+
+    def repl(m: re.Match) -> str:
+        param = m.group(1)
+        if param not in order:
+            order.append(param)
+        return f"${order.index(param) + 1}"
+
+    text = _NAMED_PARAM_RE.sub(repl, query.as_string(conn)).replace("%%", "%")
+    types = ", ".join(_PARAM_TYPES.get(p, "text") for p in order)
+    return {
+        "name": name,
+        "prepare": f"PREPARE {name} ({types}) AS {text}",
+        "params": order,
+    }
+
+
+def _prepared_names(conn) -> set:
+    pid = conn.get_backend_pid()
+    with _prepared_lock:
+        entry = _prepared.get(id(conn))
+        if entry is None or entry[0] != pid:
+            entry = (pid, set())
+            _prepared[id(conn)] = entry
+        return entry[1]
+
+
+def _forget_prepared(conn) -> None:
+    with _prepared_lock:
+        _prepared.pop(id(conn), None)
+
+
+def _reset_prepared(conn) -> None:
+    """Descarta os statements preparados da conexão (após erro ou troca de plano)."""
+    _forget_prepared(conn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DEALLOCATE ALL")
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+
+def _execute_plan(conn, cursor, plan: Dict[str, Any], kind: str, params: Dict[str, Any]) -> None:
+    """
+    Executa a consulta do plano (kind = "single" ou "batch").
+    Com search_prepared_statements, prepara uma vez por conexão e depois só envia
+    EXECUTE com os parâmetros deduplicados; senão, SQL ad-hoc.
+    """
+    if not settings.search_prepared_statements:
+        cursor.execute(plan["sql"] if kind == "single" else plan["batch_sql"], params)
+        return
+
+    spec = plan["stmts"][kind]
+    prepared = _prepared_names(conn)
+    if spec["name"] not in prepared:
+        cursor.execute(spec["prepare"])
+        prepared.add(spec["name"])
+    placeholders = ", ".join(["%s"] * len(spec["params"]))
+    cursor.execute(
+        f"{plan['prefix']}EXECUTE {spec['name']} ({placeholders})",
+        [params[p] for p in spec["params"]],
+    )
+
+
+def _candidate_table_names(name: str) -> List[str]:
+    base = (name or "").strip() or "produtos-sp-queiroz"
+    variants = [base]
+    if "produtos-" in base:
+        variants.append(base.replace("produtos-", "produto-", 1))
+    if "produto-" in base:
+        variants.append(base.replace("produto-", "produtos-", 1))
+    out: List[str] = []
+    seen = set()
+    for t in variants:
+        if t and t not in seen:
+            out.append(t)
+            seen.add(t)
+    return out
+
+
+def _search_params(q: str, limit: int) -> Dict[str, Any]:
+    return {
+        "q": q,
+        "like": f"%{q}%",
+        "like_na": f"%{_strip_accents(q)}%",
+        "unit": _extract_unit_token(q),
+        "limit": limit,
+    }
+
+
+def _probe_search_plan(conn) -> Optional[Dict[str, Any]]:
+    """
+    Sonda extensões, tabela real e colunas, e valida as variantes em ordem.
+    Retorna o plano da primeira variante que executa sem erro.
+    """
+    global _plan_seq
+    with conn.cursor() as cur:
+        cur.execute("select extname from pg_extension where extname in ('unaccent','pg_trgm')")
+        available_exts = {r[0] for r in (cur.fetchall() or [])}
+        cur.execute("select 1 from pg_proc where proname = 'immutable_unaccent' limit 1")
+        has_indexed_fn = cur.fetchone() is not None
+    conn.rollback()
+
+    configured_table_name = settings.postgres_products_table_name or "produtos-sp-queiroz"
+    for table_name in _candidate_table_names(configured_table_name):
+        with conn.cursor() as cur:
+            cur.execute(
+                "select column_name from information_schema.columns where table_name = %s",
+                (table_name,),
+            )
+            columns = {r[0] for r in (cur.fetchall() or [])}
+        conn.rollback()
+        if not columns:
+            continue
+
+        table_ident = sql.Identifier(table_name)
+        with_attributes = set(ATTRIBUTE_COLUMNS) <= columns
+        with_active = "ativo" in columns
+        for variant in _SEARCH_VARIANTS:
+            if not variant["needs_ext"] <= available_exts or not variant["needs_cols"] <= columns:
+                continue
+            if variant.get("needs_indexed") and not has_indexed_fn:
+                continue
+
+            prefix = variant.get("prefix", "")
+            query_sql = _format_search_sql(prefix + variant["sql"], table_ident, with_attributes, with_active)
+            try:
+                # Execução real (sem linhas) para garantir que o plano funciona
+                with conn.cursor() as cur:
+                    cur.execute(query_sql, _search_params("a", 0))
+                    cur.fetchall()
+            except Exception as e:
+                logger.debug(f"Variante de busca '{variant['name']}' em '{table_name}' falhou: {e}")
+                continue
+            finally:
+                conn.rollback()
+
+            _plan_seq += 1
+            body = _format_search_sql(variant["sql"], table_ident, with_attributes, with_active)
+            batch_body = (
+                _format_search_sql(
+                    _as_batch_sql(variant["sql"]), table_ident, with_attributes, with_active, _BATCH_UNIT_EXPR
+                )
+                if variant.get("batch")
+                else None
+            )
+            plan = {
+                "name": variant["name"],
+                "table": table_name,
+                "prefix": prefix,
+                "sql": query_sql,
+                "batch_sql": sql.SQL(prefix) + batch_body if batch_body is not None else None,
+                "stmts": {
+                    "single": _prepared_spec(conn, f"busca_produtos_{_plan_seq}", body),
+                    "batch": (
+                        _prepared_spec(conn, f"busca_produtos_lote_{_plan_seq}", batch_body)
+                        if batch_body is not None
+                        else None
+                    ),
+                },
+            }
+            plan["with_attributes"] = with_attributes
+            logger.info(
+                f"🧭 Plano de busca fixado: variante '{plan['name']}' na tabela '{table_name}'"
+                f"{' (com atributos derivados)' if with_attributes else ''}"
+            )
+            return plan
 
+    logger.error(
+        f"Nenhuma variante de busca funcionou (tabela '{configured_table_name}', extensões {sorted(available_exts)})"
+    )
+    return None
+
+
+def _get_search_plan(conn, force: bool = False) -> Optional[Dict[str, Any]]:
+    global _search_plan
+    plan = _search_plan
+    if plan is not None and not force:
+        return plan
+    with _plan_lock:
+        if _search_plan is not None and not force:
+            return _search_plan
+        _search_plan = _probe_search_plan(conn)
+        return _search_plan
+
+
+def invalidate_search_plan() -> None:
+    """Descarta o plano fixado; a próxima busca sonda de novo."""
+    global _search_plan
+    _search_plan = None
+
+
+def refresh_search_plan(conn=None) -> bool:
+    """Sonda e fixa o plano de busca (chamado após o sync, que pode migrar o schema)."""
+    own_conn = conn is None
+    try:
+        if own_conn:
+            conn = _get_connection()
+        return _get_search_plan(conn, force=True) is not None
+    except Exception as e:
+        logger.warning(f"Falha ao sondar plano de busca: {e}")
+        invalidate_search_plan()
+        return False
+    finally:
+        if own_conn and conn is not None:
+            _return_connection(conn)
+
+
+def _search_rows_sql(q: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    Executa a busca com o plano fixado (uma única instrução).
+    Em erro, sonda o plano de novo e tenta mais uma vez. Retorna None se falhar.
+    """
+    params = _search_params(q, limit)
+
+    conn = None
+    try:
+        conn = _get_connection()
+        last_error: Optional[Exception] = None
+        for attempt in range(2):
+            plan = _get_search_plan(conn, force=attempt > 0)
+            if plan is None:
+                break
+            try:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    _execute_plan(conn, cursor, plan, "single", params)
+                    return cursor.fetchall() or []
+            except Exception as e:
+                last_error = e
+                # Transação abortada: limpar antes de sondar de novo
+                conn.rollback()
+                _reset_prepared(conn)
+                logger.warning(f"Plano de busca '{plan['name']}' falhou, sondando de novo: {e}")
+
+        logger.error(f"Erro na busca DB (nenhum plano funcionou): {last_error}")
+        return None
+    finally:
+        if conn is not None:
+            try:
+                _return_connection(conn)
+            except Exception:
+                pass
+
+
+def _prepare_search_query(query: str) -> Tuple[str, Optional[str]]:
+    """Normaliza a consulta (traduções + correção ortográfica + unidades). Retorna (q, unidade_desejada)."""
     q = _normalize_query_text(query)
     q = _apply_term_translations(q)
+    # Depois das traduções: entradas manuais do JSON têm prioridade sobre o corretor
+    q = correct_query(q)
 
     q = _normalize_units_in_text(q)
     q = re.sub(r"\s+", " ", q).strip()
     desired_unit = _extract_unit_token(q)
-    if len(q) < 2:
-        return "[]"
+    return q, desired_unit
+
+
+def _rank_results(q: str, desired_unit: Optional[str], results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Filtro de unidade, re-score (_score_candidates) e priorizações sobre as linhas do banco."""
+    for r in results:
+        ensure_attributes(r)
+
+    if desired_unit and results:
+        filtered = [r for r in results if desired_unit in (r.get("unit_tokens") or ())]
+        if filtered:
+            results = filtered
+
+    if results:
+        for r, score in zip(results, _score_candidates(q, results)):
+            r["match_score"] = score
+            r["match_ok"] = score >= 0.55
+        results = sorted(results, key=lambda r: r.get("match_score", 0.0), reverse=True)
+
+        # PRIORIZAÇÃO 1: Frango → abatido sempre primeiro
+        PRIORITY_BOOST = {
+            "frango": "abatido",
+            "calabresa": "kg",
+            "moida": "primeira",
+            "moido": "primeira",
+            "kisuki": "refresco",
+            "refresco": "po",
+            "creme leite": "creme",
+            "alho": "kg",
+            "abacaxi": "kg",
+            "laranja": "kg",
+        }
+        q_lower = q.lower()
+        for termo, boost_word in PRIORITY_BOOST.items():
+            if termo in q_lower:
+                boosted = [r for r in results if boost_word in (r.get("nome") or "").lower()]
+                others = [r for r in results if boost_word not in (r.get("nome") or "").lower()]
+                if boosted:
+                    results = boosted + others
+                    logger.info(f"⬆️ Priorização: '{boost_word}' movido para o topo da busca '{q}'")
+                break
 
-    raw_for_fts = q
-    q_no_accents = _strip_accents(q)
+        # PRIORIZAÇÃO 2: Frutas/Legumes/Verduras — produtos com "KG" no nome vêm primeiro
+        # Ex: "TOMATE KG", "MELANCIA KG", "CEBOLA KG" devem aparecer antes de versões industrializadas
+        if any(r.get("is_hortifruti") for r in results):
+            kg_boosted = [r for r in results if r.get("is_weighted")]
+            kg_others = [r for r in results if not r.get("is_weighted")]
+            if kg_boosted:
+                results = kg_boosted + kg_others
+                logger.info(f"⬆️ Priorização Horti: {len(kg_boosted)} produto(s) KG movido(s) para o topo")
+
+    return results
+
+
+def _suggestions_for(q: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "nome": r.get("nome") or "",
+            "preco": _safe_float(r.get("preco"), 0.0),
+            "termo_busca": q,
+            "match_ok": bool(r.get("match_ok")),
+        }
+        for r in results
+    ]
 
-    configured_table_name = settings.postgres_products_table_name or "produtos-sp-queiroz"
-    limit = max(1, min(int(limit or 8), 25))
 
-    conn = None
-    is_pool_conn = True
-    cursor = None
+def _save_search_suggestions(telefone: str, q: str, results: List[Dict[str, Any]]) -> None:
     try:
-        conn = _get_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        save_suggestions(telefone, _suggestions_for(q, results))
+    except Exception as e:
+        logger.warning(f"Falha ao salvar sugestões no Redis: {e}")
 
-        cursor.execute(
-            "select extname from pg_extension where extname in ('unaccent','pg_trgm')"
-        )
-        available_exts = {r["extname"] for r in (cursor.fetchall() or [])}
-        has_unaccent = "unaccent" in available_exts
-        has_trgm = "pg_trgm" in available_exts
-
-        like_term = f"%{q}%"
-        like_term_no_accents = f"%{q_no_accents}%"
-
-        def candidate_table_names(name: str) -> List[str]:
-            base = (name or "").strip() or "produtos-sp-queiroz"
-            variants = [base]
-            if "produtos-" in base:
-                variants.append(base.replace("produtos-", "produto-", 1))
-            if "produto-" in base:
-                variants.append(base.replace("produto-", "produtos-", 1))
-            out: List[str] = []
-            seen = set()
-            for t in variants:
-                if t and t not in seen:
-                    out.append(t)
-                    seen.add(t)
-            return out
-
-        results: List[Dict[str, Any]] = []
-        last_error: Optional[Exception] = None
 
-        for table_name in candidate_table_names(configured_table_name):
-            table_ident = sql.Identifier(table_name)
-            queries = []
-
-            # 1) Híbrida: FTS + trigram + ILIKE (melhor relevância quando disponível)
-            if has_unaccent and has_trgm:
-                queries.append(
-                    (
-                        sql.SQL(
-                            """
-                            WITH q AS (
-                                SELECT plainto_tsquery('simple', unaccent(%s)) AS tsq
-                            )
-                            SELECT id, nome, preco, estoque, unidade, categoria
-                            FROM {table}
-                            CROSS JOIN q
-                            WHERE (
-                                to_tsvector('simple', unaccent(coalesce(nome,'') || ' ' || coalesce(descricao,''))) @@ q.tsq
-                                OR unaccent(nome) ILIKE unaccent(%s)
-                                OR unaccent(descricao) ILIKE unaccent(%s)
-                                OR word_similarity(unaccent(%s), unaccent(nome)) > 0.2
-                                OR word_similarity(unaccent(%s), unaccent(descricao)) > 0.2
-                                OR similarity(unaccent(nome), unaccent(%s)) > 0.2
-                                OR similarity(unaccent(descricao), unaccent(%s)) > 0.2
-                            )
-                            ORDER BY (
-                                0.70 * ts_rank_cd(
-                                    to_tsvector('simple', unaccent(coalesce(nome,'') || ' ' || coalesce(descricao,''))),
-                                    q.tsq
-                                )
-                                + 0.30 * GREATEST(
-                                    word_similarity(unaccent(%s), unaccent(nome)),
-                                    word_similarity(unaccent(%s), unaccent(descricao)),
-                                    similarity(unaccent(nome), unaccent(%s)),
-                                    similarity(unaccent(descricao), unaccent(%s))
-                                )
-                            ) DESC
-                            LIMIT %s
-                            """
-                        ).format(table=table_ident),
-                        (
-                            raw_for_fts,
-                            like_term,
-                            like_term,
-                            q,
-                            q,
-                            q,
-                            q,
-                            q,
-                            q,
-                            q,
-                            q,
-                            limit,
-                        ),
-                    )
-                )
+def save_search_suggestions(telefone: str, results_by_query: Dict[str, List[Dict[str, Any]]]) -> None:
+    """
+    Salva as sugestões de várias buscas em UMA escrita no Redis.
+    Usado quando o chamador escolhe entre variantes da consulta (busca original x relaxada)
+    e só o conjunto vencedor deve virar sugestão.
+    """
+    products: List[Dict[str, Any]] = []
+    for query, results in results_by_query.items():
+        q, _unit = _prepare_search_query(query)
+        products.extend(_suggestions_for(q, [r for r in results if r.get("id") != "AVISO_AMBIGUIDADE"]))
+    if not products:
+        return
+    try:
+        save_suggestions(telefone, products)
+    except Exception as e:
+        logger.warning(f"Falha ao salvar sugestões no Redis: {e}")
 
-                queries.append(
-                    (
-                        sql.SQL(
-                            """
-                            SELECT id, nome, preco, estoque, unidade, categoria
-                            FROM {table}
-                            WHERE (
-                                word_similarity(unaccent(%s), unaccent(nome)) > 0.2
-                                OR word_similarity(unaccent(%s), unaccent(descricao)) > 0.2
-                            )
-                            ORDER BY GREATEST(
-                                word_similarity(unaccent(%s), unaccent(nome)),
-                                word_similarity(unaccent(%s), unaccent(descricao))
-                            ) DESC
-                            LIMIT %s
-                            """
-                        ).format(table=table_ident),
-                        (q, q, q, q, limit),
-                    )
-                )
 
-            # 2) ILIKE com unaccent (mais simples, ainda bem útil)
-            if has_unaccent:
-                queries.append(
-                    (
-                        sql.SQL(
-                            """
-                            SELECT id, nome, preco, estoque, unidade, categoria
-                            FROM {table}
-                            WHERE unaccent(nome) ILIKE unaccent(%s)
-                               OR unaccent(descricao) ILIKE unaccent(%s)
-                            LIMIT %s
-                            """
-                        ).format(table=table_ident),
-                        (like_term, like_term, limit),
-                    )
-                )
+def search_products_db(query: str, limit: int = 8, telefone: Optional[str] = None) -> str:
+    """Busca produtos no Postgres.
 
-            # 3) ILIKE sem unaccent (fallback final se a extensão unaccent não existir)
-            queries.append(
-                (
-                    sql.SQL(
-                        """
-                        SELECT id, nome, preco, estoque, unidade, categoria
-                        FROM {table}
-                        WHERE nome ILIKE %s
-                           OR descricao ILIKE %s
-                           OR nome ILIKE %s
-                           OR descricao ILIKE %s
-                        LIMIT %s
-                        """
-                    ).format(table=table_ident),
-                    (like_term, like_term, like_term_no_accents, like_term_no_accents, limit),
-                )
-            )
+    Ordem: cache de resultados -> índice de catálogo em memória -> SQL.
+    O SQL usa o plano fixado por _probe_search_plan (melhor variante disponível:
+    híbrida indexada, híbrida, trigram, ILIKE com/sem unaccent, só nome).
 
-            # 4) Só por nome (se a tabela não tiver coluna descricao)
-            queries.append(
-                (
-                    sql.SQL(
-                        """
-                        SELECT id, nome, preco, estoque, unidade, categoria
-                        FROM {table}
-                        WHERE nome ILIKE %s
-                           OR nome ILIKE %s
-                        LIMIT %s
-                        """
-                    ).format(table=table_ident),
-                    (like_term, like_term_no_accents, limit),
-                )
-            )
+    Retorna SEMPRE um JSON (lista) para manter o contrato da tool.
+    """
 
-            for query_sql, params in queries:
-                try:
-                    cursor.execute(query_sql, params)
-                    results = cursor.fetchall() or []
-                    last_error = None
-                    break
-                except Exception as e:
-                    last_error = e
-                    continue
+    q, desired_unit = _prepare_search_query(query)
+    if len(q) < 2:
+        return "[]"
 
-            if last_error is None:
-                break
+    limit = max(1, min(int(limit or 8), 25))
 
-        if last_error is not None:
-            logger.error(f"Erro na busca DB (todas tentativas falharam): {last_error}")
-            return "[]"
-
-        if desired_unit and results:
-            filtered = [
-                r
-                for r in results
-                if _text_has_unit(r.get("nome") or "", desired_unit)
-                or _text_has_unit(r.get("descricao") or "", desired_unit)
-            ]
-            if filtered:
-                results = filtered
-
-        if results:
-            for r in results:
-                score = _score_match(q, r.get("nome") or "", r.get("categoria") or "")
-                r["match_score"] = score
-                r["match_ok"] = score >= 0.55
-            results = sorted(results, key=lambda r: r.get("match_score", 0.0), reverse=True)
-
-            # PRIORIZAÇÃO 1: Frango → abatido sempre primeiro
-            PRIORITY_BOOST = {
-                "frango": "abatido",
-                "calabresa": "kg",
-                "moida": "primeira",
-                "moido": "primeira",
-                "kisuki": "refresco",
-                "refresco": "po",
-                "creme leite": "creme",
-                "alho": "kg",
-                "abacaxi": "kg",
-                "laranja": "kg",
-            }
-            q_lower = q.lower()
-            for termo, boost_word in PRIORITY_BOOST.items():
-                if termo in q_lower:
-                    boosted = [r for r in results if boost_word in (r.get("nome") or "").lower()]
-                    others = [r for r in results if boost_word not in (r.get("nome") or "").lower()]
-                    if boosted:
-                        results = boosted + others
-                        logger.info(f"⬆️ Priorização: '{boost_word}' movido para o topo da busca '{q}'")
-                    break
-
-            # PRIORIZAÇÃO 2: Frutas/Legumes/Verduras — produtos com "KG" no nome vêm primeiro
-            # Ex: "TOMATE KG", "MELANCIA KG", "CEBOLA KG" devem aparecer antes de versões industrializadas
-            HORTI_CATEGORIES = ["horti", "fruta", "legume", "verdura", "flv"]
-            has_horti_results = any(
-                any(k in (r.get("categoria") or "").lower() for k in HORTI_CATEGORIES)
-                for r in results
-            )
-            if has_horti_results:
-                kg_boosted = [r for r in results if (r.get("nome") or "").upper().strip().endswith("KG")]
-                kg_others = [r for r in results if not (r.get("nome") or "").upper().strip().endswith("KG")]
-                if kg_boosted:
-                    results = kg_boosted + kg_others
-                    logger.info(f"⬆️ Priorização Horti: {len(kg_boosted)} produto(s) KG movido(s) para o topo")
+    try:
+        results = get_cached_search(q, limit)
+        if results is None:
+            results = search_catalog_index(q, limit)
+            if results is None:
+                results = _search_rows_sql(q, limit)
+                if results is None:
+                    return "[]"
+
+            results = _rank_results(q, desired_unit, results)
+            set_cached_search(q, limit, results)
 
         json_str = _format_results(results)
 
         if telefone:
-            try:
-                products_for_cache = []
-                for r in results:
-                    products_for_cache.append(
-                        {
-                            "nome": r.get("nome") or "",
-                            "preco": _safe_float(r.get("preco"), 0.0),
-                            "termo_busca": q,
-                            "match_ok": bool(r.get("match_ok")),
-                        }
-                    )
-                save_suggestions(telefone, products_for_cache)
-            except Exception as e:
-                logger.warning(f"Falha ao salvar sugestões no Redis: {e}")
+            _save_search_suggestions(telefone, q, results)
 
         return json_str
     except Exception as e:
         logger.error(f"Erro na busca DB: {e}")
         return "[]"
-    finally:
-        try:
-            if cursor is not None:
-                cursor.close()
-        except Exception:
-            pass
+
+
+def _as_batch_sql(single_sql: str) -> str:
+    """
+    Transforma o template de uma busca em template de lote:
+    unnest(array de termos) + LATERAL com a busca ranqueada por termo.
+    A ordenação por embalagem entra depois, em _format_search_sql com _BATCH_UNIT_EXPR.
+    """
+    inner = single_sql.replace("%(q)s", "b.q").replace("%(like)s", "b.like_term")
+    return f"""
+    SELECT b.ord, r.*
+    FROM unnest(%(qs)s::text[], %(likes)s::text[], %(units)s::text[]) WITH ORDINALITY AS b(q, like_term, unit, ord)
+    CROSS JOIN LATERAL ({inner}) r
+    """
+
+
+def _batch_search_params(terms: List[str], limit: int) -> Dict[str, Any]:
+    """Parâmetros nomeados da consulta de lote (_as_batch_sql)."""
+    return {
+        "qs": terms,
+        "likes": [f"%{t}%" for t in terms],
+        "units": [_extract_unit_token(t) for t in terms],
+        "limit": limit,
+    }
+
+
+def _search_rows_sql_many(terms: List[str], limit: int) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """
+    Executa a busca de vários termos em UMA instrução SQL usando o plano fixado.
+    Retorna {termo: linhas} ou None se o plano não suportar lote (ou falhar),
+    para o chamador cair na busca termo a termo.
+    """
+    params = _batch_search_params(terms, limit)
+
+    conn = None
+    try:
+        conn = _get_connection()
+        plan = _get_search_plan(conn)
+        if plan is None or plan.get("batch_sql") is None:
+            return None
         try:
-            if conn is not None:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                _execute_plan(conn, cursor, plan, "batch", params)
+                rows = cursor.fetchall() or []
+        except Exception as e:
+            logger.warning(f"Busca em lote falhou com o plano '{plan['name']}': {e}")
+            conn.rollback()
+            _reset_prepared(conn)
+            return None
+
+        grouped: Dict[str, List[Dict[str, Any]]] = {t: [] for t in terms}
+        for row in rows:
+            ord_idx = int(row.pop("ord")) - 1
+            grouped[terms[ord_idx]].append(row)
+        return grouped
+    finally:
+        if conn is not None:
+            try:
                 _return_connection(conn)
-        except Exception:
-            pass
+            except Exception:
+                pass
+
+
+def search_products_db_many(queries: List[str], limit: int = 8, telefone: Optional[str] = None) -> Dict[str, str]:
+    """
+    Busca vários produtos de uma vez (listas do tipo "arroz | feijão | óleo").
+
+    Todos os termos são resolvidos em uma única ida ao banco (unnest + LATERAL).
+    Cada termo recebe o mesmo pós-processamento de search_products_db
+    (filtro de unidade, _score_candidates e priorizações).
+
+    Retorna {consulta_original: JSON (lista)}, no mesmo formato de search_products_db.
+    """
+    limit = max(1, min(int(limit or 8), 25))
+
+    prepared: Dict[str, Tuple[str, Optional[str]]] = {}
+    for query in queries or []:
+        if query in prepared:
+            continue
+        prepared[query] = _prepare_search_query(query)
+
+    terms: List[str] = []
+    for q, _unit in prepared.values():
+        if len(q) >= 2 and q not in terms:
+            terms.append(q)
+
+    ranked_by_term: Dict[str, List[Dict[str, Any]]] = {}
+    try:
+        pending = []
+        for q in terms:
+            cached = get_cached_search(q, limit)
+            if cached is not None:
+                ranked_by_term[q] = cached
+                continue
+            results = search_catalog_index(q, limit)
+            if results is None:
+                pending.append(q)
+            else:
+                ranked_by_term[q] = _rank_results(q, _extract_unit_token(q), results)
+                set_cached_search(q, limit, ranked_by_term[q])
+
+        if pending:
+            batch = _search_rows_sql_many(pending, limit) if len(pending) > 1 else None
+            if batch is None:
+                batch = {}
+                for q in pending:
+                    results = _search_rows_sql(q, limit)
+                    if results is None:
+                        # Falha de banco: não cacheia, devolve vazio só nesta chamada
+                        ranked_by_term[q] = []
+                    else:
+                        batch[q] = results
+            for q, results in batch.items():
+                ranked_by_term[q] = _rank_results(q, _extract_unit_token(q), results)
+                set_cached_search(q, limit, ranked_by_term[q])
+    except Exception as e:
+        logger.error(f"Erro na busca DB em lote: {e}")
+
+    output: Dict[str, str] = {}
+    for query, (q, _unit) in prepared.items():
+        if len(q) < 2:
+            output[query] = "[]"
+            continue
+        try:
+            # Cópia por consulta: o mesmo termo pode aparecer para consultas diferentes
+            results = [dict(r) for r in ranked_by_term.get(q, [])]
+            output[query] = _format_results(results)
+            if telefone:
+                _save_search_suggestions(telefone, q, results)
+        except Exception as e:
+            logger.error(f"Erro ao formatar busca em lote '{query}': {e}")
+            output[query] = "[]"
+
+    logger.info(f"📦 Busca em lote: {len(prepared)} consulta(s), {len(terms)} termo(s) distintos")
+    return output
@@ -0,0 +1,200 @@
+"""
+Clientes HTTP compartilhados (pool de conexões + keep-alive) para as APIs do
+ERP/dashboard.
+
+`requests.get/post` sem sessão abre uma conexão TCP (e TLS) nova a cada
+chamada. Aqui cada host upstream tem uma `requests.Session` própria com pool
+(`http_pool_maxsize` conexões reaproveitadas entre threads), e cada endpoint
+tem seu orçamento de timeout (connect, read):
+
+    resp = http_request("GET", url, endpoint="estoque", service=SERVICE_ERP, headers=get_auth_headers())
+
+Com `service`, a chamada passa pelo circuit breaker compartilhado
+(tools.redis_tools): bloqueada com o circuito aberto (CircuitOpenError) e
+registrada com latência (timeout/erro de rede/5xx contam como falha).
+
+Variante asyncio (worker ARQ / FastAPI) com httpx.AsyncClient por host e por
+event loop:
+
+    resp = await async_http_request("GET", url, endpoint="cliente")
+
+`close_async_clients()` fecha os clientes async no shutdown do worker.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.settings import settings
+from config.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Timeout de leitura por endpoint (segundos); o connect usa settings.http_connect_timeout
+ENDPOINT_TIMEOUTS: Dict[str, float] = {
+    "estoque": 10,
+    "estoque_preco": 10,
+    "cliente": 5,
+    "pedidos": 10,
+    "alterar": 10,
+    "encarte": 10,
+}
+DEFAULT_TIMEOUT = 10
+
+# Serviços do circuit breaker (um por upstream)
+SERVICE_ERP = "supermercado_api"
+SERVICE_ESTOQUE = "estoque_api"
+
+TimeoutSpec = Union[float, Tuple[float, float]]
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_pid: Optional[int] = None
+_sessions_lock = threading.Lock()
+
+_async_clients: Dict[Tuple[int, str], "httpx.AsyncClient"] = {}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Chamada não feita: circuit breaker do serviço aberto (ou sem probe livre)."""
+
+    def __init__(self, service: str):
+        super().__init__(f"circuit breaker aberto para {service}")
+        self.service = service
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _timeout_for(endpoint: Optional[str], timeout: Optional[TimeoutSpec]) -> Tuple[float, float]:
+    if isinstance(timeout, tuple):
+        return timeout
+    read = float(timeout) if timeout is not None else ENDPOINT_TIMEOUTS.get(endpoint or "", DEFAULT_TIMEOUT)
+    return min(settings.http_connect_timeout, read), read
+
+
+def get_session(url: str) -> requests.Session:
+    """Sessão com pool de conexões para o host da URL (uma por processo)."""
+    global _sessions_pid
+    key = _host_key(url)
+    pid = os.getpid()
+    session = _sessions.get(key) if _sessions_pid == pid else None
+    if session is not None:
+        return session
+    with _sessions_lock:
+        if _sessions_pid != pid:
+            # Processo filho (fork): não reaproveitar sockets do pai
+            _sessions.clear()
+            _sessions_pid = pid
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=max(1, settings.http_pool_maxsize),
+                max_retries=0,  # retries ficam por conta de quem chama
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+            logger.debug(f"🔌 Pool HTTP criado para {key}")
+        return session
+
+
+def http_request(
+    method: str,
+    url: str,
+    endpoint: Optional[str] = None,
+    timeout: Optional[TimeoutSpec] = None,
+    service: Optional[str] = None,
+    **kwargs,
+) -> requests.Response:
+    """
+    requests.request pelo pool do host. `timeout` numérico vira (connect, read);
+    sem timeout usa o orçamento do endpoint (ENDPOINT_TIMEOUTS).
+    Com `service`, aplica o circuit breaker (pode levantar CircuitOpenError).
+    """
+    if service is None:
+        return get_session(url).request(method, url, timeout=_timeout_for(endpoint, timeout), **kwargs)
+
+    from tools.redis_tools import check_circuit_open, report_failure, report_success
+
+    if check_circuit_open(service):
+        raise CircuitOpenError(service)
+    start = time.monotonic()
+    try:
+        resp = get_session(url).request(method, url, timeout=_timeout_for(endpoint, timeout), **kwargs)
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+        report_failure(service, time.monotonic() - start)
+        raise
+    if resp.status_code >= 500:
+        report_failure(service, time.monotonic() - start)
+    else:
+        # 4xx é erro do pedido, não do serviço
+        report_success(service, time.monotonic() - start)
+    return resp
+
+
+def _get_async_client(url: str):
+    import httpx
+
+    key = (id(asyncio.get_running_loop()), _host_key(url))
+    client = _async_clients.get(key)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(
+            max_connections=max(1, settings.http_pool_maxsize),
+            max_keepalive_connections=max(1, settings.http_pool_maxsize),
+        )
+        client = httpx.AsyncClient(limits=limits)
+        _async_clients[key] = client
+    return client
+
+
+async def async_http_request(
+    method: str,
+    url: str,
+    endpoint: Optional[str] = None,
+    timeout: Optional[TimeoutSpec] = None,
+    service: Optional[str] = None,
+    **kwargs,
+):
+    """Versão asyncio de http_request (httpx.AsyncClient por host e por event loop)."""
+    import httpx
+
+    connect, read = _timeout_for(endpoint, timeout)
+    client = _get_async_client(url)
+    if service is None:
+        return await client.request(method, url, timeout=httpx.Timeout(read, connect=connect), **kwargs)
+
+    from tools.redis_tools import check_circuit_open, report_failure, report_success
+
+    if check_circuit_open(service):
+        raise CircuitOpenError(service)
+    start = time.monotonic()
+    try:
+        resp = await client.request(method, url, timeout=httpx.Timeout(read, connect=connect), **kwargs)
+    except httpx.TransportError:
+        report_failure(service, time.monotonic() - start)
+        raise
+    if resp.status_code >= 500:
+        report_failure(service, time.monotonic() - start)
+    else:
+        report_success(service, time.monotonic() - start)
+    return resp
+
+
+async def close_async_clients() -> None:
+    """Fecha os clientes async do event loop atual (shutdown do worker)."""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [k for k in _async_clients if k[0] == loop_id]:
+        client = _async_clients.pop(key)
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning(f"Erro ao fechar cliente HTTP async {key[1]}: {e}")
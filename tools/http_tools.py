@@ -1,18 +1,42 @@
 """
 Ferramentas HTTP para interação com a API do Supermercado
 """
+import hashlib
 import requests
 import json
-from typing import Dict, Any, Optional
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait, TimeoutError as FuturesTimeout
+from typing import Dict, Any, List, Optional, Tuple
 from config.settings import settings
 from config.logger import setup_logger
+from tools.http_client import SERVICE_ERP, SERVICE_ESTOQUE, http_request
 
 
 logger = setup_logger(__name__)
 
 
+# Headers de auth em cache (evita reler o .env e logar o token a cada requisição)
+_auth_headers_cache: Optional[Tuple[float, Dict[str, str]]] = None
+_auth_headers_lock = threading.Lock()
+
+
 def get_auth_headers() -> Dict[str, str]:
-    """Retorna os headers de autenticação para as requisições"""
+    """Retorna os headers de autenticação para as requisições (cache de http_auth_headers_ttl_seconds)"""
+    global _auth_headers_cache
+    cached = _auth_headers_cache
+    if cached is not None and time.monotonic() - cached[0] < settings.http_auth_headers_ttl_seconds:
+        return dict(cached[1])
+    with _auth_headers_lock:
+        cached = _auth_headers_cache
+        if cached is None or time.monotonic() - cached[0] >= settings.http_auth_headers_ttl_seconds:
+            cached = (time.monotonic(), _build_auth_headers())
+            _auth_headers_cache = cached
+    return dict(cached[1])
+
+
+def _build_auth_headers() -> Dict[str, str]:
     token = settings.supermercado_auth_token or ""
     
     # Fallback: Tentar ler TOKEN_SUPERMERCADO direto do environment caso o settings esteja vazio
@@ -50,6 +74,7 @@ def get_auth_headers() -> Dict[str, str]:
 def estoque(url: str) -> str:
     """
     Consulta o estoque e preço de produtos no sistema do supermercado.
+    Consultas simultâneas à mesma URL (vários workers) viram uma só chamada à API.
     
     Args:
         url: URL completa para consulta (ex: .../api/produtos/consulta?nome=arroz)
@@ -57,14 +82,20 @@ def estoque(url: str) -> str:
     Returns:
         JSON string com informações do produto ou mensagem de erro
     """
+    from tools.redis_tools import singleflight
+
+    return singleflight(_singleflight_url_key("estoque", url), lambda: _consultar_estoque(url), wait_seconds=12)
+
+
+def _singleflight_url_key(kind: str, url: str) -> str:
+    return f"{kind}:{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+
+
+def _consultar_estoque(url: str) -> str:
     logger.info(f"Consultando estoque: {url}")
     
     try:
-        response = requests.get(
-            url,
-            headers=get_auth_headers(),
-            timeout=10
-        )
+        response = http_request("GET", url, endpoint="estoque", service=SERVICE_ERP, headers=get_auth_headers())
         response.raise_for_status()
         
         data = response.json()
@@ -122,26 +153,121 @@ def estoque(url: str) -> str:
 def consultar_cliente(telefone: str) -> Optional[Dict[str, Any]]:
     """
     Consulta dados cadastrais de um cliente pelo telefone no dashboard.
+
+    Perfil em cache no Redis (cliente_perfil:{telefone}, cliente_perfil_ttl_seconds;
+    "não encontrado" por cliente_perfil_negative_ttl_seconds). O cache é invalidado
+    quando um pedido é enviado ou o endereço é salvo, e aquecido pelo webhook
+    (prefetch_cliente) antes do turno do agente.
     
     Returns:
         Dict com {nome, endereco, bairro, cidade, total_pedidos} ou None se não encontrado.
     """
-    base = settings.supermercado_base_url.rstrip("/")
+    from tools.redis_tools import singleflight
+
     # Normalizar telefone para apenas dígitos
     digits = "".join(c for c in telefone if c.isdigit())
+    hit, data = _read_cliente_cache(digits)
+    if hit:
+        return data
+    # Prefetch do webhook em andamento: espera o resultado dele em vez de chamar de novo
+    _, data = singleflight(f"cliente:{digits}", lambda: _buscar_cliente(digits), wait_seconds=6)
+    return data
+
+
+def _buscar_cliente(digits: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """(resposta definitiva?, dados). Erros transitórios não vão para o cache."""
+    base = settings.supermercado_base_url.rstrip("/")
     url = f"{base}/pedidos/cliente/{digits}"
     
     try:
-        response = requests.get(url, headers=get_auth_headers(), timeout=5)
+        response = http_request("GET", url, endpoint="cliente", service=SERVICE_ERP, headers=get_auth_headers())
         if response.status_code == 404:
-            return None
+            _write_cliente_cache(digits, None)
+            return True, None
         response.raise_for_status()
         data = response.json()
         logger.info(f"👤 Cliente encontrado: {data.get('nome', '?')} ({data.get('total_pedidos', 0)} pedidos)")
-        return data
+        _write_cliente_cache(digits, data)
+        return True, data
     except Exception as e:
-        logger.warning(f"⚠️ Erro ao consultar cliente {telefone}: {e}")
-        return None
+        logger.warning(f"⚠️ Erro ao consultar cliente {digits}: {e}")
+        return False, None
+
+
+def _cliente_cache_key(digits: str) -> str:
+    return f"cliente_perfil:{digits}"
+
+
+def _read_cliente_cache(digits: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    from tools.redis_tools import get_redis_client
+
+    client = get_redis_client()
+    if client is None or not digits:
+        return False, None
+    try:
+        raw = client.get(_cliente_cache_key(digits))
+        if raw:
+            return True, json.loads(raw).get("data")
+    except Exception:
+        pass
+    return False, None
+
+
+def _write_cliente_cache(digits: str, data: Optional[Dict[str, Any]]) -> None:
+    from tools.redis_tools import get_redis_client
+
+    client = get_redis_client()
+    if client is None or not digits:
+        return
+    ttl = settings.cliente_perfil_ttl_seconds if data else settings.cliente_perfil_negative_ttl_seconds
+    try:
+        client.set(_cliente_cache_key(digits), json.dumps({"data": data}, ensure_ascii=False), ex=ttl)
+    except Exception:
+        pass
+
+
+def invalidate_cliente_cache(telefone: str) -> None:
+    """Descarta o perfil em cache (pedido enviado, endereço novo)."""
+    from tools.redis_tools import get_redis_client
+
+    digits = "".join(c for c in str(telefone or "") if c.isdigit())
+    client = get_redis_client()
+    if client is None or not digits:
+        return
+    try:
+        client.delete(_cliente_cache_key(digits))
+    except Exception:
+        pass
+
+
+# Prefetches em andamento neste processo
+_cliente_prefetching: set = set()
+_cliente_prefetching_lock = threading.Lock()
+
+
+def prefetch_cliente(telefone: str) -> None:
+    """
+    Aquece o cache do perfil em background (chamado pelo webhook ao bufferizar a
+    primeira mensagem), para o turno do agente não esperar o dashboard.
+    """
+    digits = "".join(c for c in str(telefone or "") if c.isdigit())
+    if not digits:
+        return
+    with _cliente_prefetching_lock:
+        if digits in _cliente_prefetching:
+            return
+        _cliente_prefetching.add(digits)
+
+    def _run():
+        try:
+            consultar_cliente(digits)
+        except Exception as e:
+            logger.warning(f"Falha no prefetch do cliente {digits}: {e}")
+        finally:
+            with _cliente_prefetching_lock:
+                _cliente_prefetching.discard(digits)
+
+    threading.Thread(target=_run, daemon=True).start()
 
 
 def pedidos(json_body: str) -> str:
@@ -170,15 +296,13 @@ def pedidos(json_body: str) -> str:
         data = json.loads(json_body)
         logger.debug(f"Dados do pedido: {data}")
         
-        response = requests.post(
-            url,
-            headers=get_auth_headers(),
-            json=data,
-            timeout=10
-        )
+        response = http_request("POST", url, endpoint="pedidos", service=SERVICE_ERP, headers=get_auth_headers(), json=data)
         response.raise_for_status()
         
         result = response.json()
+        # Total de pedidos/endereço do cliente mudaram no dashboard
+        if isinstance(data, dict):
+            invalidate_cliente_cache(data.get("telefone"))
         success_msg = f"✅ Pedido enviado com sucesso!\n\nResposta do servidor:\n{json.dumps(result, indent=2, ensure_ascii=False)}"
         logger.info("Pedido enviado com sucesso")
         
@@ -229,7 +353,7 @@ def alterar(telefone: str, json_body: str) -> str:
         # 1. BUSCAR PEDIDO ATUAL (GET)
         # Precisamos da lista atual para não apagar o que já existe
         try:
-            get_response = requests.get(base_url, headers=get_auth_headers(), timeout=10)
+            get_response = http_request("GET", base_url, endpoint="alterar", service=SERVICE_ERP, headers=get_auth_headers())
             get_response.raise_for_status()
             pedido_atual = get_response.json()
             
@@ -255,12 +379,7 @@ def alterar(telefone: str, json_body: str) -> str:
         data_update["itens"] = itens_finais
         
         # 3. ENVIAR ATUALIZAÇÃO (PUT)
-        response = requests.put(
-            base_url,
-            headers=get_auth_headers(),
-            json=data_update,
-            timeout=10
-        )
+        response = http_request("PUT", base_url, endpoint="alterar", service=SERVICE_ERP, headers=get_auth_headers(), json=data_update)
         response.raise_for_status()
         
         result = response.json()
@@ -304,12 +423,7 @@ def overwrite_order(telefone: str, json_body: str) -> str:
         data = json.loads(json_body)
         
         # ENVIAR ATUALIZAÇÃO (PUT)
-        response = requests.put(
-            base_url,
-            headers=get_auth_headers(),
-            json=data,
-            timeout=10
-        )
+        response = http_request("PUT", base_url, endpoint="alterar", service=SERVICE_ERP, headers=get_auth_headers(), json=data)
         response.raise_for_status()
         
         result = response.json()
@@ -333,6 +447,32 @@ def overwrite_order(telefone: str, json_body: str) -> str:
 
 
 
+_CIRCUIT_OPEN_MSG = "⚠️ O sistema de estoque está instável no momento. Tente novamente em alguns minutos."
+
+# Tentativas da API de EAN (_consultar_ean_api): resultado classificado de cada uma
+_EAN_OK = "ok"
+_EAN_RETRY = "retry"  # timeout/5xx/rede: tenta de novo dentro do prazo
+_EAN_FAIL = "fail"  # 4xx/resposta inválida: não repete
+_EAN_FAIL_CACHE = "fail_cache"  # circuito aberto: não repete, pode usar cache
+_EAN_MAX_ATTEMPTS = 4
+_EAN_MIN_ATTEMPT_SECONDS = 1.0
+_EAN_MIN_HEDGE_DELAY_SECONDS = 0.3
+_EAN_RETRY_PAUSE_SECONDS = 0.3
+
+# Latências recentes das respostas boas (percentil para o hedge)
+_ean_latencies: deque = deque(maxlen=200)
+_ean_latency_lock = threading.Lock()
+# Tentativas em voo. requests síncrono não tem cancelamento: a thread fica no recv
+# do socket até o timeout, e fechar a Session compartilhada derrubaria as outras
+# chamadas do pool. Por isso cada tentativa nasce com timeout = prazo restante da
+# consulta, e as abandonadas terminam sozinhas até o fim do orçamento.
+_ean_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="ean_hedge")
+
+# Refreshes em background em andamento neste processo (um por EAN)
+_estoque_refreshing: set = set()
+_estoque_refreshing_lock = threading.Lock()
+
+
 def estoque_preco(ean: str) -> str:
     """
     Consulta preço e disponibilidade pelo EAN.
@@ -340,9 +480,11 @@ def estoque_preco(ean: str) -> str:
     Monta a URL completa concatenando o EAN ao final de settings.estoque_ean_base_url.
     Exemplo: {base}/7891149103300
     
-    MELHORIAS:
-    - Retry automático com backoff exponencial (3 tentativas)
-    - Timeouts progressivos para lidar com API lenta
+    CACHE EM CAMADAS (estoque_preco_cache:{ean}, gravado com o horário da consulta):
+    - fresco (< estoque_preco_fresh_seconds): responde do cache, sem chamar a API
+    - velho (< estoque_preco_stale_seconds): responde do cache e atualiza em background
+    - sem entrada utilizável: consulta a API (prazo total com hedge, ver _consultar_ean_api)
+    Cada item da resposta traz `idade_dados_segundos` (idade do preço/estoque).
 
     Args:
         ean: Código EAN do produto (apenas dígitos).
@@ -350,19 +492,14 @@ def estoque_preco(ean: str) -> str:
     Returns:
         JSON string com informações do produto ou mensagem de erro amigável.
     """
-    import time
-    
     base = (settings.estoque_ean_base_url or "").strip().rstrip("/")
     if not base:
         msg = "Erro: ESTOQUE_EAN_BASE_URL não configurado no .env"
         logger.error(msg)
         return msg
 
-    # CIRCUIT BREAKER CHECK
-    from tools.redis_tools import check_circuit_open, report_failure, report_success
-    from tools.redis_tools import get_redis_client
-    SERVICE_NAME = "estoque_api"
-    CACHE_TTL = 21600
+    # CIRCUIT BREAKER CHECK (só consulta; o portão com probes fica em http_request)
+    from tools.redis_tools import is_circuit_open
     
     # manter apenas dígitos no EAN
     ean_digits = "".join(ch for ch in ean if ch.isdigit())
@@ -371,284 +508,623 @@ def estoque_preco(ean: str) -> str:
         logger.error(msg)
         return msg
 
-    cache_key = f"estoque_preco_cache:{ean_digits}"
-
-    if check_circuit_open(SERVICE_NAME):
-        client = get_redis_client()
-        if client is not None:
-            try:
-                cached = client.get(cache_key)
-                if cached:
-                    logger.warning(f"Circuit Breaker ativo; retornando cache para EAN {ean_digits}")
-                    return cached if isinstance(cached, str) else str(cached)
-            except Exception:
-                pass
-        msg = "⚠️ O sistema de estoque está instável no momento. Tente novamente em alguns minutos."
-        logger.warning(f"Circuit Breaker impediu chamada para {ean_digits}")
-        return msg
+    cached = _read_estoque_preco_cache(ean_digits)
+    served = _serve_estoque_from_cache(base, ean_digits, cached)
+    if served is not None:
+        return served
 
-    url = f"{base}/{ean_digits}"
-    
-    headers = {
-        "Accept": "application/json",
-    }
-    
-    # RETRY CONFIG
-    MAX_RETRIES = 3
-    TIMEOUTS = [10, 15, 20]  # Timeouts aumentados para evitar "Problema Técnico" em redes lentas
-    
-    last_error = None
-    
-    for attempt in range(MAX_RETRIES):
-        timeout = TIMEOUTS[min(attempt, len(TIMEOUTS) - 1)]
-        
-        try:
-            if attempt > 0:
-                logger.info(f"🔄 Retry #{attempt + 1} para EAN {ean_digits} (timeout: {timeout}s)")
-            else:
-                logger.info(f"Consultando estoque_preco por EAN: {url}")
-            
-            resp = requests.get(url, headers=headers, timeout=timeout)
-            resp.raise_for_status()
-
-            # SUCESSO DO CIRCUIT BREAKER
-            report_success(SERVICE_NAME)
-
-            # resposta esperada: lista de objetos
-            try:
-                items = resp.json()
-            except json.JSONDecodeError:
-                txt = resp.text
-                logger.warning("Resposta não é JSON válido; retornando texto bruto")
-                return txt
-
-            # Se vier um único objeto, normalizar para lista
-            items = items if isinstance(items, list) else ([items] if isinstance(items, dict) else [])
-
-            # Heurística de extração de preço
-            PRICE_KEYS = (
-                "vl_produto",
-                "vl_produto_normal",
-                "preco",
-                "preco_venda",
-                "valor",
-                "valor_unitario",
-                "preco_unitario",
-                "atacadoPreco",
-            )
-
-            # Chaves de quantidade em ordem de prioridade
-            STOCK_QTY_KEYS = [
-                "qtd_produto",  # Chave principal do sistema
-                # "qtd_movimentacao", # REMOVIDO: Cliente confirmou que este campo não serve para estoque (gera falso positivo)
-                "estoque", "qtd", "qtde", "qtd_estoque", "quantidade", "quantidade_disponivel",
-                "quantidadeDisponivel", "qtdDisponivel", "qtdEstoque", "estoqueAtual", "saldo",
-                "qty", "quantity", "stock", "amount"
-            ]
+    if is_circuit_open(SERVICE_ESTOQUE):
+        return _circuit_open_response(ean_digits, cached)
+
+    out, msg, use_cache = _consultar_ean_coalescido(base, ean_digits)
+    if out is not None:
+        _write_estoque_preco_cache(ean_digits, out)
+        return _with_data_age(out, 0.0)
+
+    if use_cache and cached is not None:
+        logger.warning(f"Falha consultando EAN {ean_digits}; retornando cache")
+        return _with_data_age(*cached)
+    return msg
+
+
+def estoque_preco_many(eans: List[str]) -> Dict[str, str]:
+    """
+    Consulta preço e disponibilidade de vários EANs (ex.: conferir um carrinho).
+
+    - EANs repetidos (mesmos dígitos) são consultados uma vez
+    - o cache é lido num único MGET e segue as mesmas camadas de `estoque_preco`
+    - o restante é consultado em paralelo (no máximo estoque_preco_max_concurrency
+      ao mesmo tempo) dentro de um prazo único (estoque_preco_batch_deadline_seconds);
+      quem não responder a tempo recebe o cache velho ou uma mensagem de erro
+    - respeita o circuit breaker (checado antes do lote e antes de cada consulta)
 
-            # Possíveis indicadores de disponibilidade
-            STATUS_KEYS = ("situacao", "situacaoEstoque", "status", "statusEstoque")
+    Returns:
+        {ean informado: resposta no mesmo formato de estoque_preco}
+    """
+    from tools.redis_tools import is_circuit_open
 
-            def _parse_float(val) -> Optional[float]:
+    base = (settings.estoque_ean_base_url or "").strip().rstrip("/")
+    if not base:
+        msg = "Erro: ESTOQUE_EAN_BASE_URL não configurado no .env"
+        logger.error(msg)
+        return {ean: msg for ean in eans}
+
+    digits_of = {ean: "".join(ch for ch in str(ean) if ch.isdigit()) for ean in eans}
+    unique = list(dict.fromkeys(d for d in digits_of.values() if d))
+    results: Dict[str, str] = {"": "Erro: EAN inválido. Informe apenas números."}
+
+    cached_all = _read_estoque_preco_cache_many(unique)
+    pending = []
+    for d in unique:
+        served = _serve_estoque_from_cache(base, d, cached_all.get(d))
+        if served is not None:
+            results[d] = served
+        else:
+            pending.append(d)
+
+    if pending and is_circuit_open(SERVICE_ESTOQUE):
+        for d in pending:
+            results[d] = _circuit_open_response(d, cached_all.get(d))
+        pending = []
+
+    if pending:
+        logger.info(f"📦 Consultando {len(pending)} EAN(s) em paralelo ({len(unique) - len(pending)} do cache)")
+        deadline = time.monotonic() + settings.estoque_preco_batch_deadline_seconds
+        pool = ThreadPoolExecutor(
+            max_workers=max(1, min(len(pending), settings.estoque_preco_max_concurrency)),
+            thread_name_prefix="estoque_preco",
+        )
+        futures = {pool.submit(_consultar_ean_com_circuito, base, d, deadline): d for d in pending}
+        try:
+            for fut in as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+                d = futures[fut]
                 try:
-                    s = str(val).strip()
-                    if not s:
-                        return None
-                    # aceita formato brasileiro
-                    s = s.replace(".", "").replace(",", ".") if s.count(",") == 1 and s.count(".") > 1 else s.replace(",", ".")
-                    return float(s)
-                except Exception:
-                    return None
-
-            def _has_positive_qty(d: Dict[str, Any]) -> bool:
-                # Tenta encontrar qualquer chave que tenha valor > 0
-                for k in STOCK_QTY_KEYS:
-                    if k in d:
-                        v = d.get(k)
-                        try:
-                            n = float(str(v).replace(",", "."))
-                            if n > 0:
-                                return True
-                        except Exception:
-                            # ignore não numérico
-                            pass
-                return False
-
-            def _extract_price(d: Dict[str, Any]) -> Optional[float]:
-                best_price = None
-                for k in PRICE_KEYS:
-                    if k in d:
-                        val = _parse_float(d.get(k))
-                        if val is not None:
-                            if val > 0:
-                                return val
-                            elif best_price is None:
-                                best_price = val
-                return best_price
-
-            def _extract_qty(d: Dict[str, Any]) -> Optional[float]:
-                for k in STOCK_QTY_KEYS:
-                    if k in d:
-                        val = _parse_float(d.get(k))
-                        if val is not None:
-                            return val
-                return None
+                    out, msg, use_cache = fut.result()
+                except Exception as e:
+                    out, msg, use_cache = None, f"Erro ao consultar EAN: {e}", True
+                results[d] = _resolve_estoque_result(d, out, msg, use_cache, cached_all.get(d))
+        except FuturesTimeout:
+            missing = sum(1 for d in pending if d not in results)
+            logger.warning(f"⏱️ Prazo do lote de EANs esgotado; {missing} EAN(s) sem resposta")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        for d in pending:
+            if d not in results:
+                msg = "Erro: API lenta. Não foi possível consultar EAN dentro do prazo."
+                results[d] = _resolve_estoque_result(d, None, msg, True, cached_all.get(d))
+
+    return {ean: results[digits_of[ean]] for ean in eans}
+
+
+def _serve_estoque_from_cache(base: str, ean_digits: str, cached) -> Optional[str]:
+    """Resposta a partir do cache fresco/velho (velho agenda refresh), ou None se precisa da API."""
+    if cached is None:
+        return None
+    data, age = cached
+    if age is not None and age < settings.estoque_preco_fresh_seconds:
+        logger.info(f"EAN {ean_digits}: cache fresco ({age:.0f}s)")
+        return _with_data_age(data, age)
+    if age is not None and age < settings.estoque_preco_stale_seconds:
+        logger.info(f"EAN {ean_digits}: cache de {age:.0f}s; atualizando em background")
+        _refresh_estoque_preco_async(base, ean_digits)
+        return _with_data_age(data, age)
+    return None
+
+
+def _circuit_open_response(ean_digits: str, cached) -> str:
+    if cached is not None:
+        logger.warning(f"Circuit Breaker ativo; retornando cache para EAN {ean_digits}")
+        return _with_data_age(*cached)
+    logger.warning(f"Circuit Breaker impediu chamada para {ean_digits}")
+    return _CIRCUIT_OPEN_MSG
+
+
+def _resolve_estoque_result(ean_digits: str, out, msg, use_cache: bool, cached) -> str:
+    if out is not None:
+        _write_estoque_preco_cache(ean_digits, out)
+        return _with_data_age(out, 0.0)
+    if use_cache and cached is not None:
+        logger.warning(f"Falha consultando EAN {ean_digits}; retornando cache")
+        return _with_data_age(*cached)
+    return msg
 
-            def _is_available(d: Dict[str, Any]) -> bool:
-                # 1. Verificar se está ativo (se a flag existir)
-                is_active = d.get("ativo", True)
-                if not is_active:
-                    logger.debug(f"Item filtrado: ativo=False")
-                    return False
 
-                # 2. Verificar Estoque
-                qty = _extract_qty(d)
-                
-                # Categorias que NÃO verificam estoque (produção própria ou pesagem)
-                # PADARIA: produtos feitos na hora, não têm controle de quantidade
-                # FRIGORIFICO/AÇOUGUE: vendem antes de dar entrada na nota
-                # HORTI/LEGUMES: idem, produção variável
-                cat1 = str(d.get("classificacao01", "") or "")
-                cat2 = str(d.get("classificacao02", "") or "")
-                cat3 = str(d.get("classificacao03", "") or "")
-                cat = f"{cat1} {cat2} {cat3}".upper()
-                name_upper = str(d.get("produto") or d.get("nome") or "").upper()
-                
-                # Lista expandida de termos que IGNORAM estoque
-                keywords_ignore_stock = [
-                    "PADARIA", "FRIGORIFICO", "HORTI", "AÇOUGUE", "ACOUGUE", 
-                    "LEGUMES", "VERDURAS", "AVES", "CARNES", "FLV", "FRUTA",
-                    "FRANGO", "LINGUICA", "RESFRIADO", "CONGELADO", "BIFE", "MOIDA", "PICADINHO"
-                ]
-                
-                ignora_estoque = any(x in cat for x in keywords_ignore_stock) or \
-                                 any(x in name_upper for x in keywords_ignore_stock)
-                
-                if ignora_estoque:
-                    # Regra de Exceção: Setor INDUSTRIAL (ex: Padaria Industrial)
-                    # Produtos industrializados/embalados DEVEM respeitar o estoque do sistema
-                    # MAS se for FRIGORIFICO ou CARNE, ignora sempre (regra do cliente)
-                    is_meat = any(x in cat for x in ["FRIGORIFICO", "AVES", "CARNES"]) or \
-                              any(x in name_upper for x in ["FRANGO", "CARNE", "LINGUICA", "BIFE"])
-                              
-                    if "INDUSTRIAL" in cat and not is_meat:
-                        logger.debug(f"Item de {cat}: Setor Industrial detectado, forçando verificação de estoque.")
-                        # Continua para o check de quantidade lá embaixo...
-                    else:
-                        logger.debug(f"Item de {cat}/{name_upper}: ignorando verificação de estoque (ativo={is_active})")
-                        return True
-                
-                # REGRAS ESPECIAIS DE PESAGEM (KG) E PLU (Códigos curtos)
-                ean_str = str(d.get("cod_barra") or d.get("id") or "").strip()
-                
-                is_weighted = "KG" in name_upper.split() or name_upper.endswith("KG")
-                is_plu = len(ean_str) > 0 and len(ean_str) <= 5 and ean_str.isdigit()
-                
-                if is_weighted or is_plu:
-                     logger.debug(f"Item PESADO/PLU detectado ({name_upper} [{ean_str}]): ignorando verificação de estoque.")
-                     return True
+def _consultar_ean_com_circuito(base: str, ean_digits: str, deadline: float):
+    from tools.redis_tools import is_circuit_open
 
-                # Para os demais (Mercearia, Bebidas, INDUSTRIAL, etc), estoque deve ser POSITIVO
-                if qty is not None and qty > 0:
-                    return True
-                
-                # Se chegou aqui, ou é 0, ou é negativo em categoria que não pode
-                logger.debug(f"Item filtrado: quantidade={qty} (Categoria: {cat})")
-                return False
+    # O circuito pode abrir no meio do lote (falhas das consultas anteriores)
+    if is_circuit_open(SERVICE_ESTOQUE):
+        return None, _CIRCUIT_OPEN_MSG, True
+    return _consultar_ean_coalescido(base, ean_digits, deadline)
 
-            # [OTIMIZAÇÃO] Filtro estrito para saída
-            sanitized: list[Dict[str, Any]] = []
-            for it in items:
-                if not isinstance(it, dict):
-                    continue
-                if not _is_available(it):
-                    continue  # manter apenas itens com estoque/disponibilidade
 
-                # Cria dict limpo apenas com campos úteis para o agente
-                clean: Dict[str, Any] = {}
+def _consultar_ean_coalescido(
+    base: str, ean_digits: str, deadline: Optional[float] = None
+) -> Tuple[Optional[str], Optional[str], bool]:
+    """
+    _consultar_ean_api com singleflight por EAN: quando vários clientes perguntam pelo
+    mesmo produto ao mesmo tempo (ex.: encarte recém-enviado), só um worker chama o ERP
+    e os demais recebem o resultado dele.
+    """
+    from tools.redis_tools import singleflight
 
-                # ID da Loja e Identificadores
-                if "id_loja" in it:
-                    clean["id_loja"] = it["id_loja"]
-                if "id" in it:
-                    clean["id"] = it["id"]
+    # Espera até o orçamento completo do líder ou até o prazo do lote
+    budget = settings.estoque_preco_budget_seconds
+    wait_seconds = budget if deadline is None else max(0.0, min(budget, deadline - time.monotonic()))
+    out, msg, use_cache = singleflight(
+        f"ean:{ean_digits}",
+        lambda: _consultar_ean_api(f"{base}/{ean_digits}", ean_digits, deadline),
+        wait_seconds=wait_seconds,
+        lock_ttl=int(budget) + 5,
+    )
+    return out, msg, use_cache
 
-                produto_nome = it.get("produto") or it.get("nome") or it.get("descricao")
-                if produto_nome:
-                    clean["produto"] = produto_nome
 
-                price = _extract_price(it)
-                if price is not None:
-                    clean["preco"] = price
-                    clean["vl_produto"] = price
+def _estoque_cache_key(ean_digits: str) -> str:
+    return f"estoque_preco_cache:{ean_digits}"
 
-                preco_normal = _parse_float(it.get("vl_produto_normal"))
-                if preco_normal is not None:
-                    clean["vl_produto_normal"] = preco_normal
 
-                qtd_prod = _parse_float(it.get("qtd_produto"))
-                if qtd_prod is not None:
-                    clean["qtd_produto"] = qtd_prod
+def _read_estoque_preco_cache(ean_digits: str) -> Optional[Tuple[str, Optional[float]]]:
+    """(JSON dos itens, idade em segundos) ou None. Entradas antigas sem horário têm idade None."""
+    from tools.redis_tools import get_redis_client
 
-                for k in ["dt_cadastro", "classificacao01", "classificacao02", "classificacao03", "fracionado", "ativo", "fracionamento", "emb"]:
-                    if k in it:
-                        clean[k] = it.get(k)
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        raw = client.get(_estoque_cache_key(ean_digits))
+    except Exception:
+        return None
+    return _parse_estoque_cache_entry(raw)
 
-                clean["disponibilidade"] = True
 
-                sanitized.append(clean)
+def _read_estoque_preco_cache_many(eans_digits: List[str]) -> Dict[str, Tuple[str, Optional[float]]]:
+    from tools.redis_tools import get_redis_client
 
-            logger.info(f"EAN {ean_digits}: {len(sanitized)} item(s) disponíveis após filtragem")
+    client = get_redis_client()
+    if client is None or not eans_digits:
+        return {}
+    try:
+        raws = client.mget([_estoque_cache_key(d) for d in eans_digits])
+    except Exception:
+        return {}
+    out = {}
+    for d, raw in zip(eans_digits, raws):
+        entry = _parse_estoque_cache_entry(raw)
+        if entry is not None:
+            out[d] = entry
+    return out
+
+
+def _parse_estoque_cache_entry(raw) -> Optional[Tuple[str, Optional[float]]]:
+    if not raw:
+        return None
+    try:
+        entry = json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(entry, dict) and "fetched_at" in entry:
+        return entry.get("data") or "[]", max(0.0, time.time() - float(entry["fetched_at"]))
+    # Formato antigo (só a lista): só serve de fallback quando a API falha
+    return (raw if isinstance(raw, str) else str(raw)), None
 
-            out = json.dumps(sanitized, indent=2, ensure_ascii=False)
-            client = get_redis_client()
-            if client is not None:
-                try:
-                    client.set(cache_key, out, ex=CACHE_TTL)
-                except Exception:
-                    pass
-            return out
 
-        except requests.exceptions.Timeout:
-            last_error = f"Timeout (tentativa {attempt + 1}/{MAX_RETRIES})"
-            logger.warning(f"⏱️ {last_error}")
-            
-            # FALHA DO CIRCUIT BREAKER (TIMEOUT)
-            report_failure(SERVICE_NAME)
-            
-            if attempt < MAX_RETRIES - 1:
-                time.sleep(0.5)  # Pequena pausa antes de retry
-                continue
-        except requests.exceptions.HTTPError as e:
-            status = getattr(e.response, "status_code", "?")
-            body = getattr(e.response, "text", "")
-            msg = f"Erro HTTP ao consultar EAN: {status} - {body}"
-            logger.error(msg)
-            
-            # FALHA DO CIRCUIT BREAKER (Erro Servidor 500+)
-            if str(status).startswith("5"):
-                report_failure(SERVICE_NAME)
-            
-            return msg
-        except requests.exceptions.RequestException as e:
-            msg = f"Erro ao consultar EAN: {str(e)}"
-            logger.error(msg)
-            report_failure(SERVICE_NAME)
-            return msg
-    
+def _write_estoque_preco_cache(ean_digits: str, data: str) -> None:
+    from tools.redis_tools import get_redis_client
+
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.set(
+            _estoque_cache_key(ean_digits),
+            json.dumps({"fetched_at": time.time(), "data": data}, ensure_ascii=False),
+            ex=settings.estoque_preco_stale_seconds,
+        )
+    except Exception:
+        pass
+
+
+def _with_data_age(data: str, age: Optional[float]) -> str:
+    """Anota em cada item a idade dos dados (None = desconhecida)."""
+    try:
+        items = json.loads(data)
+    except (TypeError, ValueError):
+        return data
+    if isinstance(items, list):
+        for it in items:
+            if isinstance(it, dict):
+                it["idade_dados_segundos"] = int(age) if age is not None else None
+    return json.dumps(items, indent=2, ensure_ascii=False)
+
+
+def _refresh_estoque_preco_async(base: str, ean_digits: str) -> None:
+    """Atualiza o cache do EAN em background (um refresh por EAN entre processos)."""
+    from tools.redis_tools import get_redis_client, is_circuit_open
+
+    with _estoque_refreshing_lock:
+        if ean_digits in _estoque_refreshing:
+            return
+        _estoque_refreshing.add(ean_digits)
+
     client = get_redis_client()
     if client is not None:
         try:
-            cached = client.get(cache_key)
-            if cached:
-                logger.warning(f"Falha consultando EAN {ean_digits}; retornando cache")
-                return cached if isinstance(cached, str) else str(cached)
+            if not client.set(f"estoque_preco_refresh:{ean_digits}", "1", nx=True, ex=30):
+                with _estoque_refreshing_lock:
+                    _estoque_refreshing.discard(ean_digits)
+                return
         except Exception:
             pass
 
-    msg = f"Erro: API lenta. Não foi possível consultar EAN após {MAX_RETRIES} tentativas."
+    def _run():
+        try:
+            if is_circuit_open(SERVICE_ESTOQUE):
+                return
+            out, _, _ = _consultar_ean_coalescido(base, ean_digits)
+            if out is not None:
+                _write_estoque_preco_cache(ean_digits, out)
+        except Exception as e:
+            logger.warning(f"Falha no refresh em background do EAN {ean_digits}: {e}")
+        finally:
+            with _estoque_refreshing_lock:
+                _estoque_refreshing.discard(ean_digits)
+
+    threading.Thread(target=_run, daemon=True).start()
+
+
+def _consultar_ean_api(
+    url: str, ean_digits: str, deadline: Optional[float] = None
+) -> Tuple[Optional[str], Optional[str], bool]:
+    """
+    Consulta a API de EAN dentro de um orçamento total e devolve
+    (itens JSON, mensagem de erro, usar cache?).
+
+    - orçamento único por consulta (estoque_preco_budget_seconds, ou o `deadline`
+      do chamador se vier antes): nenhuma tentativa passa do prazo
+    - hedge: se a primeira tentativa demora mais que o percentil recente de
+      latência da API, dispara uma segunda em paralelo; vale a primeira que
+      responder e a outra é abandonada (sem registro no circuit breaker: só conta o
+      resultado das tentativas que esta função consumiu)
+    - falhas classificadas: timeout/5xx/rede tentam de novo enquanto houver prazo;
+      4xx e resposta inválida não repetem; circuito aberto para na hora
+    O terceiro campo diz se a falha é transitória, caso em que o chamador pode
+    responder com cache velho.
+    """
+    start = time.monotonic()
+    budget_end = start + settings.estoque_preco_budget_seconds
+    if deadline is not None:
+        budget_end = min(budget_end, deadline)
+
+    logger.info(f"Consultando estoque_preco por EAN: {url}")
+    cancel = threading.Event()
+    in_flight = set()
+    attempts = 0
+    hedged = False
+    last_msg = None
+    next_attempt_at = start
+
+    try:
+        while True:
+            now = time.monotonic()
+            remaining = budget_end - now
+            if remaining < _EAN_MIN_ATTEMPT_SECONDS and not in_flight:
+                break
+
+            # Nova tentativa: nada em voo (retry) ou hedge da tentativa lenta
+            launch = False
+            if not in_flight and attempts < _EAN_MAX_ATTEMPTS and now >= next_attempt_at:
+                launch = True
+            elif in_flight and not hedged and attempts < _EAN_MAX_ATTEMPTS and now >= next_attempt_at:
+                launch = remaining >= _EAN_MIN_ATTEMPT_SECONDS
+                hedged = launch
+            if launch and remaining >= _EAN_MIN_ATTEMPT_SECONDS:
+                attempts += 1
+                if attempts > 1:
+                    logger.info(
+                        f"{'🔀 Hedge' if in_flight else '🔄 Retry'} #{attempts} para EAN {ean_digits} "
+                        f"(prazo restante {remaining:.1f}s)"
+                    )
+                in_flight.add(_ean_hedge_pool.submit(_ean_attempt, url, remaining, cancel))
+                # Próxima tentativa só se esta passar do percentil de latência (hedge)
+                next_attempt_at = time.monotonic() + _ean_hedge_delay()
+
+            if not in_flight:
+                if attempts >= _EAN_MAX_ATTEMPTS:
+                    break
+                time.sleep(max(0.0, min(next_attempt_at, budget_end) - time.monotonic()))
+                continue
+
+            wait_until = budget_end if (hedged or attempts >= _EAN_MAX_ATTEMPTS) else min(next_attempt_at, budget_end)
+            done, _ = wait(in_flight, timeout=max(0.0, wait_until - time.monotonic()), return_when=FIRST_COMPLETED)
+            for fut in done:
+                in_flight.discard(fut)
+                kind, payload, msg, outcome = fut.result()
+                _report_ean_outcome(outcome)
+                if kind == _EAN_OK:
+                    return _sanitize_ean_items(payload, ean_digits), None, False
+                if kind == _EAN_FAIL:
+                    return None, msg, False
+                if kind == _EAN_FAIL_CACHE:
+                    return None, msg, True
+                # Transitória: retry após uma pausa curta (se nada mais estiver em voo)
+                last_msg = msg
+                if not in_flight:
+                    hedged = False
+                    next_attempt_at = time.monotonic() + _EAN_RETRY_PAUSE_SECONDS
+            if not done and time.monotonic() >= budget_end:
+                break
+    finally:
+        # Tentativas ainda em voo são abandonadas: resultado descartado e não reportado
+        cancel.set()
+
+    if last_msg and last_msg != "Timeout":
+        return None, last_msg, True
+    msg = (
+        f"Erro: API lenta. Não foi possível consultar EAN em {settings.estoque_preco_budget_seconds:.0f}s "
+        f"({attempts} tentativa(s))."
+    )
     logger.error(msg)
-    return msg
+    return None, msg, True
+
+
+def _ean_attempt(
+    url: str, timeout: float, cancel: threading.Event
+) -> Tuple[str, Any, Optional[str], Optional[Tuple[bool, float]]]:
+    """
+    Uma tentativa HTTP classificada: (resultado, itens, mensagem, desfecho).
+    O desfecho (sucesso?, latência) para o circuit breaker fica com o chamador,
+    que só o reporta se consumir a tentativa (hedge perdedor não conta).
+    """
+    from tools.redis_tools import check_circuit_open
+
+    if check_circuit_open(SERVICE_ESTOQUE):
+        return _EAN_FAIL_CACHE, None, _CIRCUIT_OPEN_MSG, None
+    start = time.monotonic()
+    try:
+        resp = http_request(
+            "GET", url, endpoint="estoque_preco",
+            headers={"Accept": "application/json"}, timeout=timeout,
+        )
+    except requests.exceptions.Timeout:
+        if not cancel.is_set():
+            logger.warning(f"⏱️ Timeout consultando EAN ({timeout:.1f}s)")
+        return _EAN_RETRY, None, "Timeout", (False, time.monotonic() - start)
+    except requests.exceptions.RequestException as e:
+        msg = f"Erro ao consultar EAN: {str(e)}"
+        if not cancel.is_set():
+            logger.error(msg)
+        return _EAN_RETRY, None, msg, (False, time.monotonic() - start)
+
+    elapsed = time.monotonic() - start
+    if resp.status_code >= 400:
+        msg = f"Erro HTTP ao consultar EAN: {resp.status_code} - {resp.text}"
+        if not cancel.is_set():
+            logger.error(msg)
+        # 5xx conta como falha do serviço e tenta de novo; 4xx é erro do pedido e definitivo
+        if resp.status_code >= 500:
+            return _EAN_RETRY, None, msg, (False, elapsed)
+        return _EAN_FAIL, None, msg, (True, elapsed)
+
+    _record_ean_latency(elapsed)
+    # resposta esperada: lista de objetos
+    try:
+        return _EAN_OK, resp.json(), None, (True, elapsed)
+    except ValueError:
+        logger.warning("Resposta não é JSON válido; retornando texto bruto")
+        return _EAN_FAIL, None, resp.text, (True, elapsed)
+
+
+def _report_ean_outcome(outcome: Optional[Tuple[bool, float]]) -> None:
+    """Registra no circuit breaker o desfecho de uma tentativa consumida."""
+    if outcome is None:
+        return
+    from tools.redis_tools import report_failure, report_success
+
+    ok, latency = outcome
+    if ok:
+        report_success(SERVICE_ESTOQUE, latency)
+    else:
+        report_failure(SERVICE_ESTOQUE, latency)
+
+
+def _record_ean_latency(seconds: float) -> None:
+    with _ean_latency_lock:
+        _ean_latencies.append(seconds)
+
+
+def _ean_hedge_delay() -> float:
+    """Espera antes do hedge: percentil recente das respostas boas da API de EAN."""
+    with _ean_latency_lock:
+        samples = sorted(_ean_latencies)
+    if len(samples) < 20:
+        return settings.estoque_preco_hedge_delay_seconds
+    idx = min(len(samples) - 1, int(settings.estoque_preco_hedge_percentile * (len(samples) - 1)))
+    return min(max(samples[idx], _EAN_MIN_HEDGE_DELAY_SECONDS), settings.estoque_preco_budget_seconds / 2)
+
+
+def _sanitize_ean_items(items: Any, ean_digits: str) -> str:
+    """Filtra itens disponíveis e mantém só os campos úteis (preço/estoque normalizados)."""
+    # Se vier um único objeto, normalizar para lista
+    items = items if isinstance(items, list) else ([items] if isinstance(items, dict) else [])
+
+    # Heurística de extração de preço
+    PRICE_KEYS = (
+        "vl_produto",
+        "vl_produto_normal",
+        "preco",
+        "preco_venda",
+        "valor",
+        "valor_unitario",
+        "preco_unitario",
+        "atacadoPreco",
+    )
+
+    # Chaves de quantidade em ordem de prioridade
+    STOCK_QTY_KEYS = [
+        "qtd_produto",  # Chave principal do sistema
+        # "qtd_movimentacao", # REMOVIDO: Cliente confirmou que este campo não serve para estoque (gera falso positivo)
+        "estoque", "qtd", "qtde", "qtd_estoque", "quantidade", "quantidade_disponivel",
+        "quantidadeDisponivel", "qtdDisponivel", "qtdEstoque", "estoqueAtual", "saldo",
+        "qty", "quantity", "stock", "amount"
+    ]
+
+    # Possíveis indicadores de disponibilidade
+    STATUS_KEYS = ("situacao", "situacaoEstoque", "status", "statusEstoque")
+
+    def _parse_float(val) -> Optional[float]:
+        try:
+            s = str(val).strip()
+            if not s:
+                return None
+            # aceita formato brasileiro
+            s = s.replace(".", "").replace(",", ".") if s.count(",") == 1 and s.count(".") > 1 else s.replace(",", ".")
+            return float(s)
+        except Exception:
+            return None
+
+    def _has_positive_qty(d: Dict[str, Any]) -> bool:
+        # Tenta encontrar qualquer chave que tenha valor > 0
+        for k in STOCK_QTY_KEYS:
+            if k in d:
+                v = d.get(k)
+                try:
+                    n = float(str(v).replace(",", "."))
+                    if n > 0:
+                        return True
+                except Exception:
+                    # ignore não numérico
+                    pass
+        return False
+
+    def _extract_price(d: Dict[str, Any]) -> Optional[float]:
+        best_price = None
+        for k in PRICE_KEYS:
+            if k in d:
+                val = _parse_float(d.get(k))
+                if val is not None:
+                    if val > 0:
+                        return val
+                    elif best_price is None:
+                        best_price = val
+        return best_price
+
+    def _extract_qty(d: Dict[str, Any]) -> Optional[float]:
+        for k in STOCK_QTY_KEYS:
+            if k in d:
+                val = _parse_float(d.get(k))
+                if val is not None:
+                    return val
+        return None
+
+    def _is_available(d: Dict[str, Any]) -> bool:
+        # 1. Verificar se está ativo (se a flag existir)
+        is_active = d.get("ativo", True)
+        if not is_active:
+            logger.debug(f"Item filtrado: ativo=False")
+            return False
+
+        # 2. Verificar Estoque
+        qty = _extract_qty(d)
+
+        # Categorias que NÃO verificam estoque (produção própria ou pesagem)
+        # PADARIA: produtos feitos na hora, não têm controle de quantidade
+        # FRIGORIFICO/AÇOUGUE: vendem antes de dar entrada na nota
+        # HORTI/LEGUMES: idem, produção variável
+        cat1 = str(d.get("classificacao01", "") or "")
+        cat2 = str(d.get("classificacao02", "") or "")
+        cat3 = str(d.get("classificacao03", "") or "")
+        cat = f"{cat1} {cat2} {cat3}".upper()
+        name_upper = str(d.get("produto") or d.get("nome") or "").upper()
+
+        # Lista expandida de termos que IGNORAM estoque
+        keywords_ignore_stock = [
+            "PADARIA", "FRIGORIFICO", "HORTI", "AÇOUGUE", "ACOUGUE", 
+            "LEGUMES", "VERDURAS", "AVES", "CARNES", "FLV", "FRUTA",
+            "FRANGO", "LINGUICA", "RESFRIADO", "CONGELADO", "BIFE", "MOIDA", "PICADINHO"
+        ]
+
+        ignora_estoque = any(x in cat for x in keywords_ignore_stock) or \
+                         any(x in name_upper for x in keywords_ignore_stock)
+
+        if ignora_estoque:
+            # Regra de Exceção: Setor INDUSTRIAL (ex: Padaria Industrial)
+            # Produtos industrializados/embalados DEVEM respeitar o estoque do sistema
+            # MAS se for FRIGORIFICO ou CARNE, ignora sempre (regra do cliente)
+            is_meat = any(x in cat for x in ["FRIGORIFICO", "AVES", "CARNES"]) or \
+                      any(x in name_upper for x in ["FRANGO", "CARNE", "LINGUICA", "BIFE"])
+
+            if "INDUSTRIAL" in cat and not is_meat:
+                logger.debug(f"Item de {cat}: Setor Industrial detectado, forçando verificação de estoque.")
+                # Continua para o check de quantidade lá embaixo...
+            else:
+                logger.debug(f"Item de {cat}/{name_upper}: ignorando verificação de estoque (ativo={is_active})")
+                return True
+
+        # REGRAS ESPECIAIS DE PESAGEM (KG) E PLU (Códigos curtos)
+        ean_str = str(d.get("cod_barra") or d.get("id") or "").strip()
+
+        is_weighted = "KG" in name_upper.split() or name_upper.endswith("KG")
+        is_plu = len(ean_str) > 0 and len(ean_str) <= 5 and ean_str.isdigit()
+
+        if is_weighted or is_plu:
+             logger.debug(f"Item PESADO/PLU detectado ({name_upper} [{ean_str}]): ignorando verificação de estoque.")
+             return True
+
+        # Para os demais (Mercearia, Bebidas, INDUSTRIAL, etc), estoque deve ser POSITIVO
+        if qty is not None and qty > 0:
+            return True
+
+        # Se chegou aqui, ou é 0, ou é negativo em categoria que não pode
+        logger.debug(f"Item filtrado: quantidade={qty} (Categoria: {cat})")
+        return False
+
+    # [OTIMIZAÇÃO] Filtro estrito para saída
+    sanitized: list[Dict[str, Any]] = []
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        if not _is_available(it):
+            continue  # manter apenas itens com estoque/disponibilidade
+
+        # Cria dict limpo apenas com campos úteis para o agente
+        clean: Dict[str, Any] = {}
+
+        # ID da Loja e Identificadores
+        if "id_loja" in it:
+            clean["id_loja"] = it["id_loja"]
+        if "id" in it:
+            clean["id"] = it["id"]
+
+        produto_nome = it.get("produto") or it.get("nome") or it.get("descricao")
+        if produto_nome:
+            clean["produto"] = produto_nome
+
+        price = _extract_price(it)
+        if price is not None:
+            clean["preco"] = price
+            clean["vl_produto"] = price
+
+        preco_normal = _parse_float(it.get("vl_produto_normal"))
+        if preco_normal is not None:
+            clean["vl_produto_normal"] = preco_normal
+
+        qtd_prod = _parse_float(it.get("qtd_produto"))
+        if qtd_prod is not None:
+            clean["qtd_produto"] = qtd_prod
+
+        for k in ["dt_cadastro", "classificacao01", "classificacao02", "classificacao03", "fracionado", "ativo", "fracionamento", "emb"]:
+            if k in it:
+                clean[k] = it.get(k)
+
+        clean["disponibilidade"] = True
+
+        sanitized.append(clean)
+
+    logger.info(f"EAN {ean_digits}: {len(sanitized)} item(s) disponíveis após filtragem")
+
+    return json.dumps(sanitized, ensure_ascii=False)
 
 
 # ============================================
@@ -660,26 +1136,136 @@ def estoque_preco(ean: str) -> str:
 
 
 
+ENCARTE_CACHE_KEY = "encarte:payload"
+ENCARTE_REFRESH_LOCK_KEY = "encarte:refresh_lock"
+
+# Um refresh disparado por leitura por processo (acquire não bloqueante)
+_encarte_refresh_lock = threading.Lock()
+
+
 def consultar_encarte() -> str:
     """
     Consulta o encarte atual do supermercado.
     Suporta múltiplos encartes via campo active_encartes_urls.
+
+    Responde do cache no Redis (payload já com as URLs reescritas), mantido por um
+    job em background (refresh_encarte_if_stale a cada encarte_refresh_check_seconds,
+    com GET condicional via ETag/Last-Modified). Perguntas sobre o encarte não chamam a
+    API; só a primeira consulta sem cache busca na hora (coalescida entre workers).
     
     Returns:
         JSON string com a URL (ou lista de URLs) do encarte ou mensagem de erro.
     """
+    from tools.redis_tools import singleflight
+
+    cached = _read_encarte_cache()
+    if cached is not None:
+        if time.time() - cached["fetched_at"] >= settings.encarte_refresh_seconds:
+            _refresh_encarte_async()
+        return cached["body"]
+
+    return singleflight(_singleflight_url_key("encarte", _encarte_url()), refresh_encarte_cache, wait_seconds=12)
+
+
+def _encarte_url() -> str:
     # Remove trailing slash from base to ensure correct path
     base = settings.supermercado_base_url.rstrip("/")
-    url = f"{base}/encarte/"
-    
+    return f"{base}/encarte/"
+
+
+def _read_encarte_cache() -> Optional[Dict[str, Any]]:
+    from tools.redis_tools import get_redis_client
+
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        raw = client.get(ENCARTE_CACHE_KEY)
+        entry = json.loads(raw) if raw else None
+        if isinstance(entry, dict) and entry.get("body"):
+            return entry
+    except Exception:
+        pass
+    return None
+
+
+def _write_encarte_cache(entry: Dict[str, Any]) -> None:
+    from tools.redis_tools import get_redis_client
+
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.set(ENCARTE_CACHE_KEY, json.dumps(entry, ensure_ascii=False), ex=settings.encarte_cache_max_age_seconds)
+    except Exception:
+        pass
+
+
+def refresh_encarte_if_stale() -> None:
+    """
+    Job do scheduler: atualiza o cache que vence antes do próximo tick (uma réplica por
+    vez, lock no Redis). Com o job a cada encarte_refresh_check_seconds, o payload
+    servido nunca passa de encarte_refresh_seconds.
+    """
+    from tools.redis_tools import get_redis_client
+
+    cached = _read_encarte_cache()
+    refresh_at = settings.encarte_refresh_seconds - settings.encarte_refresh_check_seconds
+    if cached is not None and time.time() - cached["fetched_at"] < refresh_at:
+        return
+    client = get_redis_client()
+    if client is not None:
+        try:
+            if not client.set(ENCARTE_REFRESH_LOCK_KEY, "1", nx=True, ex=60):
+                return
+        except Exception:
+            pass
+    refresh_encarte_cache()
+
+
+def _refresh_encarte_async() -> None:
+    if not _encarte_refresh_lock.acquire(blocking=False):
+        return
+
+    def _run():
+        try:
+            refresh_encarte_if_stale()
+        except Exception as e:
+            logger.warning(f"Falha no refresh do encarte em background: {e}")
+        finally:
+            _encarte_refresh_lock.release()
+
+    try:
+        threading.Thread(target=_run, daemon=True).start()
+    except Exception:
+        _encarte_refresh_lock.release()
+        raise
+
+
+def refresh_encarte_cache() -> str:
+    """
+    Busca o encarte na API (GET condicional quando há cache), reescreve as URLs uma
+    vez e grava no cache. Retorna o JSON do encarte ou mensagem de erro; em erro o
+    cache anterior continua valendo.
+    """
+    url = _encarte_url()
+    cached = _read_encarte_cache()
+    headers = get_auth_headers()
+    if cached is not None:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
     logger.info(f"Consultando encarte: {url}")
     
     try:
-        response = requests.get(
-            url,
-            headers=get_auth_headers(),
-            timeout=10
-        )
+        response = http_request("GET", url, endpoint="encarte", service=SERVICE_ERP, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            cached["fetched_at"] = time.time()
+            _write_encarte_cache(cached)
+            logger.info("Encarte sem alterações (304)")
+            return cached["body"]
         response.raise_for_status()
         
         data = response.json()
@@ -716,7 +1302,14 @@ def consultar_encarte() -> str:
                 data["encarte_url"] = ""
                 data["active_encartes_urls"] = []
             
-        return json.dumps(data, indent=2, ensure_ascii=False)
+        body = json.dumps(data, indent=2, ensure_ascii=False)
+        _write_encarte_cache({
+            "fetched_at": time.time(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body": body,
+        })
+        return body
         
     except requests.exceptions.Timeout:
         error_msg = "Erro: Timeout ao consultar encarte. Tente novamente."
@@ -0,0 +1,131 @@
+"""
+Atributos derivados de cada produto, calculados uma vez no sync.
+
+Antes, cada busca recalculava por linha: tokens normalizados do nome,
+tamanho/unidade da embalagem, família da categoria (LIMPEZA/HIGIENE/...),
+se é vendido por peso (nome termina em KG) e se o estoque deve ser ignorado
+(frigorífico, hortifruti...). Agora `sync_products_db` grava isso em colunas
+e a busca só consulta os campos. As mesmas funções servem de fallback para
+linhas ainda sem as colunas.
+"""
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+# Colunas gravadas na tabela de produtos (ordem usada no upsert)
+ATTRIBUTE_COLUMNS = (
+    "nome_norm",
+    "pack_size",
+    "pack_unit",
+    "unit_tokens",
+    "familia",
+    "is_weighted",
+    "is_hortifruti",
+    "ignore_stock",
+)
+
+ATTRIBUTE_COLUMNS_DDL = {
+    "nome_norm": "TEXT",
+    "pack_size": "NUMERIC(12, 3)",
+    "pack_unit": "TEXT",
+    "unit_tokens": "TEXT[]",
+    "familia": "TEXT",
+    "is_weighted": "BOOLEAN",
+    "is_hortifruti": "BOOLEAN",
+    "ignore_stock": "BOOLEAN",
+}
+
+_DROP_TOKENS = {"de", "da", "do", "das", "dos", "a", "o", "as", "os", "um", "uma", "uns", "umas", "e"}
+
+# Frigorífico e Hortifruti sempre disponíveis (vendido por peso ou variável)
+_IGNORE_STOCK_KEYWORDS = ["frigori", "acougue", "açougue", "bovinos", "horti", "legume", "verdura", "fruta", "aves", "frios", "embutidos", "flv"]
+_KG_EXCLUDED_CATEGORIES = ["limpeza", "higiene", "bebida", "mercearia"]
+_HORTI_KEYWORDS = ["horti", "fruta", "legume", "verdura", "flv"]
+
+_UNIT_IN_TEXT_RE = re.compile(r"\b(\d+(?:\.\d+)?)\s*(l|kg|g|ml)\b", re.IGNORECASE)
+
+
+def strip_accents(text: str) -> str:
+    if not text:
+        return ""
+    return "".join(
+        ch
+        for ch in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(ch)
+    )
+
+
+def tokenize_for_match(text: str) -> List[str]:
+    t = strip_accents((text or "").lower())
+    t = re.sub(r"[^a-z0-9]+", " ", t)
+    return [x for x in t.split(" ") if x and x not in _DROP_TOKENS]
+
+
+def unit_tokens(*texts: str) -> List[str]:
+    """Todas as embalagens citadas no texto, no formato de _extract_unit_token ("5kg", "1.5l")."""
+    out: List[str] = []
+    for text in texts:
+        for num, unit in _UNIT_IN_TEXT_RE.findall(text or ""):
+            token = f"{num}{unit.lower()}"
+            if token not in out:
+                out.append(token)
+    return out
+
+
+def category_family(categoria: str) -> str:
+    """Simplifica a categoria em famílias (evita falsos positivos como MERCEARIA DOCE vs SALGADA)."""
+    cat = (categoria or "").upper()
+    if "LIMPEZA" in cat:
+        return "LIMPEZA"
+    if "HIGIENE" in cat:
+        return "HIGIENE"
+    if "BEBIDAS" in cat:
+        return "BEBIDAS"
+    if "AÇOUGUE" in cat or "CARNE" in cat:
+        return "AÇOUGUE"
+    if "HORTIFRUTI" in cat or "LEGUMES" in cat:
+        return "HORTIFRUTI"
+    return cat
+
+
+def is_ignore_stock(nome: str, categoria: str) -> bool:
+    """Produtos que não devem ser ocultados por estoque zerado."""
+    cat_lower = (categoria or "").lower()
+    if any(k in cat_lower for k in _IGNORE_STOCK_KEYWORDS):
+        return True
+    # Fallback: nome termina com "kg" e categoria não é limpeza/higiene/bebida/mercearia -> produto fresco
+    if (nome or "").lower().strip().endswith("kg"):
+        return not any(c in cat_lower for c in _KG_EXCLUDED_CATEGORIES)
+    return False
+
+
+def derive_attributes(nome: str, descricao: str, categoria: str) -> Dict[str, Any]:
+    nome = nome or ""
+    units = unit_tokens(nome, descricao or "")
+    pack_size: Optional[float] = None
+    pack_unit: Optional[str] = None
+    name_units = unit_tokens(nome)
+    if name_units:
+        m = re.match(r"^(\d+(?:\.\d+)?)(l|kg|g|ml)$", name_units[0])
+        if m:
+            pack_size, pack_unit = float(m.group(1)), m.group(2)
+    return {
+        "nome_norm": " ".join(tokenize_for_match(nome)),
+        "pack_size": pack_size,
+        "pack_unit": pack_unit,
+        "unit_tokens": units,
+        "familia": category_family(categoria),
+        "is_weighted": nome.upper().strip().endswith("KG"),
+        "is_hortifruti": any(k in (categoria or "").lower() for k in _HORTI_KEYWORDS),
+        "ignore_stock": is_ignore_stock(nome, categoria),
+    }
+
+
+def ensure_attributes(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Completa a linha com os atributos derivados se ela veio sem as colunas (tabela não migrada)."""
+    if row.get("ignore_stock") is None or row.get("unit_tokens") is None:
+        derived = derive_attributes(row.get("nome") or "", row.get("descricao") or "", row.get("categoria") or "")
+        for k, v in derived.items():
+            if row.get(k) is None:
+                row[k] = v
+    return row
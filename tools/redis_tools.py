@@ -2,10 +2,13 @@
 Ferramentas Redis para buffer de mensagens e cooldown
 Apenas funcionalidades essenciais mantidas
 """
+import json
+import os
 import redis
+import socket
 import time
 import uuid
-from typing import Optional, Dict, List, Tuple
+from typing import Any, Callable, Optional, Dict, List, Tuple
 from config.settings import settings
 from config.logger import setup_logger
 
@@ -1151,71 +1154,360 @@ def clear_suggestions(telefone: str) -> bool:
         return False
 
 # ============================================
-# Circuit Breaker (Disjuntor de API)
+# Versão do Catálogo (invalidação de caches de busca)
 # ============================================
 
-def circuit_failure_key(service: str) -> str:
-    return f"circuit:failures:{service}"
+CATALOG_VERSION_KEY = "catalog:version"
 
-def circuit_open_key(service: str) -> str:
-    return f"circuit:open:{service}"
+def get_catalog_version() -> Optional[int]:
+    """Versão atual do catálogo (0 se nunca sincronizado, None se Redis indisponível)."""
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        value = client.get(CATALOG_VERSION_KEY)
+        return int(value) if value else 0
+    except Exception as e:
+        logger.warning(f"Erro ao ler versão do catálogo: {e}")
+        return None
 
-def check_circuit_open(service: str) -> bool:
+def bump_catalog_version(version: Optional[int] = None) -> Optional[int]:
     """
-    Verifica se o disjuntor está ABERTO (serviço fora do ar).
-    Retorna True se estiver aberto (não deve chamar o serviço).
+    Publica a versão do catálogo após um sync que mudou algo (invalida caches de busca).
+    `version` é a versão do changelog do catálogo (sequence no Postgres, fonte única;
+    os syncs são serializados pelo lease). Sem versão, só incrementa.
     """
     client = get_redis_client()
-    if client is None: return False
-    
+    if client is None:
+        return None
     try:
-        # Se a chave circuit:open existir, o circuito está aberto
-        is_open = client.get(circuit_open_key(service))
-        if is_open:
-            logger.warning(f"⚡ Circuit Breaker ABERTO para {service}. Bloqueando chamada.")
-            return True
+        if version is None:
+            version = int(client.incr(CATALOG_VERSION_KEY))
+        else:
+            version = int(version)
+            client.set(CATALOG_VERSION_KEY, version)
+        logger.info(f"🗂️ Versão do catálogo atualizada para {version}")
+        return version
+    except Exception as e:
+        logger.error(f"Erro ao atualizar versão do catálogo: {e}")
+        return None
+
+# ============================================
+# Lease de líder (tarefas que só uma réplica deve executar)
+# ============================================
+
+def lease_key(name: str) -> str:
+    return f"lease:{name}"
+
+def acquire_lease(name: str, ttl_seconds: int) -> Optional[str]:
+    """
+    Tenta virar líder de `name` (SET NX com TTL). Retorna o token do lease ou None
+    se outra réplica já é líder. Sem Redis, retorna "NOLOCK" (processo único).
+    """
+    client = get_redis_client()
+    if client is None:
+        return "NOLOCK"
+    token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    try:
+        if client.set(lease_key(name), token, nx=True, ex=max(1, int(ttl_seconds))):
+            return token
+    except Exception as e:
+        logger.warning(f"Erro ao adquirir lease {name}: {e}")
+    return None
+
+def renew_lease(name: str, token: str, ttl_seconds: int) -> bool:
+    """Estende o lease se ainda for nosso (heartbeat do líder)."""
+    if token == "NOLOCK":
+        return True
+    client = get_redis_client()
+    if client is None:
+        return False
+    script = """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("expire", KEYS[1], ARGV[2])
+    else
+        return 0
+    end
+    """
+    try:
+        return bool(client.eval(script, 1, lease_key(name), token, max(1, int(ttl_seconds))))
+    except Exception:
         return False
-    except:
+
+def release_lease(name: str, token: str) -> bool:
+    if token == "NOLOCK":
+        return True
+    client = get_redis_client()
+    if client is None:
         return False
+    return _release_lock(client, lease_key(name), token)
+
+def get_lease_holder(name: str) -> Optional[str]:
+    client = get_redis_client()
+    if client is None:
+        return None
+    try:
+        return client.get(lease_key(name))
+    except Exception:
+        return None
+
+# ============================================
+# Singleflight (uma chamada upstream por chave entre workers)
+# ============================================
+
+SINGLEFLIGHT_POLL_SECONDS = 0.05
 
-def report_failure(service: str, threshold: int = 15, cooldown: int = 30) -> None:
+def singleflight_lock_key(key: str) -> str:
+    return f"singleflight:lock:{key}"
+
+def singleflight_result_key(key: str, token: str) -> str:
+    return f"singleflight:result:{key}:{token}"
+
+def singleflight(key: str, fn: Callable[[], Any], wait_seconds: float = 15, lock_ttl: int = 30, result_ttl: int = 10) -> Any:
     """
-    Reporta uma falha no serviço. Se atingir o threshold, abre o circuito.
-    Aumentado threshold (5->15) e reduzido cooldown (60->30) para evitar falsos positivos de "sistema fora".
+    Coalesce chamadas iguais feitas ao mesmo tempo por vários workers.
+
+    O primeiro a pegar `singleflight:lock:{key}` (SET NX) executa `fn` e publica o
+    resultado (JSON) em `singleflight:result:{key}:{token}`; os demais leem o token
+    do lock e esperam esse resultado por até `wait_seconds`. Assim o upstream recebe
+    uma chamada por produto distinto, não uma por cliente.
+
+    Se o líder sumir sem publicar (crash/lock expirado) outro worker assume; se a
+    espera estourar, o próprio worker chama `fn`. Sem Redis, chama `fn` direto.
+    O resultado de quem espera volta de JSON (tuplas viram listas).
     """
+    client = get_redis_client()
+    if client is None:
+        return fn()
+
+    lock_key = singleflight_lock_key(key)
+    deadline = time.monotonic() + max(0.0, wait_seconds)
+    while True:
+        token = uuid.uuid4().hex
+        try:
+            acquired = client.set(lock_key, token, nx=True, ex=max(1, int(lock_ttl)))
+            leader = None if acquired else client.get(lock_key)
+        except Exception:
+            return fn()
+
+        if acquired:
+            try:
+                result = fn()
+                try:
+                    client.set(singleflight_result_key(key, token), json.dumps(result, ensure_ascii=False), ex=result_ttl)
+                except Exception as e:
+                    logger.warning(f"Singleflight {key}: erro ao publicar resultado: {e}")
+                return result
+            finally:
+                _release_lock(client, lock_key, token)
+
+        # Outro worker já está chamando o upstream: esperar o resultado dele
+        if leader:
+            result_key = singleflight_result_key(key, leader)
+            while time.monotonic() < deadline:
+                try:
+                    raw = client.get(result_key)
+                    if raw is not None:
+                        logger.debug(f"Singleflight {key}: resultado compartilhado")
+                        return json.loads(raw)
+                    if client.get(lock_key) != leader:
+                        # O líder terminou sem publicar ou o lock expirou: verifica o resultado mais uma vez
+                        raw = client.get(result_key)
+                        if raw is not None:
+                            return json.loads(raw)
+                        break
+                except Exception:
+                    return fn()
+                time.sleep(SINGLEFLIGHT_POLL_SECONDS)
+
+        if time.monotonic() >= deadline:
+            logger.warning(f"Singleflight {key}: espera esgotada, chamando upstream diretamente")
+            return fn()
+
+# ============================================
+# Circuit Breaker (Disjuntor de API)
+# ============================================
+#
+# Estados (hash circuit:state:{service}, compartilhado entre workers):
+#   closed     chamadas liberadas; cada resultado entra numa janela deslizante
+#              (circuit:calls:{service}) com sucesso/falha e latência
+#   open       chamadas bloqueadas por circuit_open_seconds; abre quando, com pelo
+#              menos circuit_min_calls na janela, a taxa de erro, a taxa de chamadas
+#              lentas ou o p95 de latência passam do limite
+#   half_open  depois do cooldown, só circuit_half_open_probes chamadas de teste
+#              passam; todas boas -> closed, qualquer falha/lentidão -> open de novo
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+CIRCUIT_SERVICES_KEY = "circuit:services"
+CIRCUIT_WINDOW_MAX_CALLS = 500
+
+def circuit_state_key(service: str) -> str:
+    return f"circuit:state:{service}"
+
+def circuit_calls_key(service: str) -> str:
+    return f"circuit:calls:{service}"
+
+def circuit_probes_key(service: str) -> str:
+    return f"circuit:probes:{service}"
+
+def circuit_probe_ok_key(service: str) -> str:
+    return f"circuit:probe_ok:{service}"
+
+def _circuit_state(client: redis.Redis, service: str) -> Dict[str, str]:
+    return client.hgetall(circuit_state_key(service)) or {}
+
+def _open_circuit(client: redis.Redis, service: str, reason: str) -> None:
+    client.hset(circuit_state_key(service), mapping={
+        "state": CIRCUIT_OPEN,
+        "opened_at": f"{time.time():.3f}",
+        "reason": reason,
+    })
+    client.delete(circuit_probes_key(service), circuit_probe_ok_key(service))
+    logger.critical(f"⚡⚡ CIRCUIT BREAKER ABERTO: {service} ({reason}). Pausando por {settings.circuit_open_seconds}s.")
+
+def _close_circuit(client: redis.Redis, service: str) -> None:
+    client.hset(circuit_state_key(service), mapping={"state": CIRCUIT_CLOSED, "opened_at": "0", "reason": ""})
+    # Janela nova: as falhas que abriram o circuito não contam mais
+    client.delete(circuit_probes_key(service), circuit_probe_ok_key(service), circuit_calls_key(service))
+    logger.info(f"✅ Circuit Breaker FECHADO para {service} (probes ok)")
+
+def _window_calls(client: redis.Redis, service: str, now: float) -> List[Tuple[bool, float]]:
+    calls = []
+    for member in client.zrangebyscore(circuit_calls_key(service), now - settings.circuit_window_seconds, "+inf"):
+        try:
+            _, ok, latency, _ = member.split(":")
+            calls.append((ok == "1", float(latency)))
+        except ValueError:
+            continue
+    return calls
+
+def _window_stats(calls: List[Tuple[bool, float]]) -> Dict[str, Any]:
+    n = len(calls)
+    if not n:
+        return {"calls": 0, "error_rate": 0.0, "slow_rate": 0.0, "p95_seconds": 0.0}
+    latencies = sorted(lat for _, lat in calls)
+    errors = sum(1 for ok, _ in calls if not ok)
+    slow = sum(1 for lat in latencies if lat >= settings.circuit_slow_call_seconds)
+    return {
+        "calls": n,
+        "error_rate": round(errors / n, 3),
+        "slow_rate": round(slow / n, 3),
+        "p95_seconds": round(latencies[min(n - 1, int(0.95 * (n - 1) + 0.5))], 3),
+    }
+
+def _trip_reason(stats: Dict[str, Any]) -> Optional[str]:
+    if stats["calls"] < settings.circuit_min_calls:
+        return None
+    if stats["error_rate"] >= settings.circuit_error_rate:
+        return f"erro {stats['error_rate']:.0%} em {stats['calls']} chamadas"
+    if stats["slow_rate"] >= settings.circuit_slow_call_rate:
+        return f"lentas {stats['slow_rate']:.0%} (>= {settings.circuit_slow_call_seconds}s)"
+    if stats["p95_seconds"] >= settings.circuit_p95_seconds:
+        return f"p95 {stats['p95_seconds']:.1f}s"
+    return None
+
+def _record_call(service: str, ok: bool, latency_seconds: Optional[float]) -> None:
     client = get_redis_client()
     if client is None: return
 
+    latency = max(0.0, float(latency_seconds or 0.0))
+    now = time.time()
     try:
-        fkey = circuit_failure_key(service)
-        # Incrementa contador de falhas (TTL 60s para janela de falhas)
-        failures = client.incr(fkey)
-        if failures == 1:
-            client.expire(fkey, 60) # Janela de 1 min para acumular falhas
-            
-        if failures >= threshold:
-            # Abre o circuito!
-            okey = circuit_open_key(service)
-            client.set(okey, "1", ex=cooldown)
-            logger.critical(f"⚡⚡ CIRCUIT BREAKER DISPARADO: {service} falhou {failures}x. Pausando por {cooldown}s.")
-            # Limpa contador para reiniciar ciclo após cooldown
-            client.delete(fkey)
-            
+        key = circuit_calls_key(service)
+        pipe = client.pipeline()
+        pipe.zadd(key, {f"{now:.6f}:{int(ok)}:{latency:.3f}:{uuid.uuid4().hex[:6]}": now})
+        pipe.zremrangebyscore(key, "-inf", now - settings.circuit_window_seconds)
+        pipe.zremrangebyrank(key, 0, -CIRCUIT_WINDOW_MAX_CALLS - 1)
+        pipe.expire(key, max(1, int(settings.circuit_window_seconds * 2)))
+        pipe.sadd(CIRCUIT_SERVICES_KEY, service)
+        pipe.execute()
+
+        state = _circuit_state(client, service).get("state", CIRCUIT_CLOSED)
+        slow = latency >= settings.circuit_slow_call_seconds
+        if state == CIRCUIT_HALF_OPEN:
+            if not ok or slow:
+                _open_circuit(client, service, "probe falhou" if not ok else f"probe lento ({latency:.1f}s)")
+            elif client.incr(circuit_probe_ok_key(service)) >= settings.circuit_half_open_probes:
+                _close_circuit(client, service)
+            return
+        if state == CIRCUIT_CLOSED:
+            reason = _trip_reason(_window_stats(_window_calls(client, service, now)))
+            if reason:
+                _open_circuit(client, service, reason)
     except Exception as e:
-        logger.error(f"Erro no circuit breaker (fail): {e}")
+        logger.error(f"Erro no circuit breaker ({'success' if ok else 'fail'}): {e}")
+
+def is_circuit_open(service: str) -> bool:
+    """Só consulta (não consome probe): True enquanto aberto e dentro do cooldown."""
+    client = get_redis_client()
+    if client is None: return False
+    try:
+        state = _circuit_state(client, service)
+        if state.get("state") != CIRCUIT_OPEN:
+            return False
+        return time.time() - float(state.get("opened_at") or 0) < settings.circuit_open_seconds
+    except Exception:
+        return False
 
-def report_success(service: str) -> None:
+def check_circuit_open(service: str) -> bool:
     """
-    Reporta sucesso. Se o circuito estava instável, reseta contadores.
+    Portão antes de chamar o serviço. Retorna True se a chamada deve ser bloqueada.
+    Aberto e vencido o cooldown -> half_open; em half_open libera só os probes.
     """
     client = get_redis_client()
-    if client is None: return
+    if client is None: return False
+    
+    try:
+        state = _circuit_state(client, service)
+        current = state.get("state", CIRCUIT_CLOSED)
+        if current == CIRCUIT_CLOSED:
+            return False
+        if current == CIRCUIT_OPEN:
+            opened_at = state.get("opened_at") or "0"
+            if time.time() - float(opened_at) < settings.circuit_open_seconds:
+                logger.warning(f"⚡ Circuit Breaker ABERTO para {service}. Bloqueando chamada.")
+                return True
+            # Um worker faz a transição por abertura do circuito
+            if client.set(f"circuit:half_open:{service}:{opened_at}", "1", nx=True, ex=max(1, settings.circuit_open_seconds * 4)):
+                client.delete(circuit_probes_key(service), circuit_probe_ok_key(service))
+                client.hset(circuit_state_key(service), "state", CIRCUIT_HALF_OPEN)
+                logger.warning(f"🟡 Circuit Breaker MEIO-ABERTO para {service}: liberando {settings.circuit_half_open_probes} probe(s)")
+        # half_open: probes limitados (contador expira para não travar se um probe sumir)
+        probes = client.incr(circuit_probes_key(service))
+        if probes == 1:
+            client.expire(circuit_probes_key(service), max(1, settings.circuit_open_seconds))
+        if probes <= settings.circuit_half_open_probes:
+            return False
+        logger.warning(f"⚡ Circuit Breaker MEIO-ABERTO para {service}: probes esgotados, bloqueando.")
+        return True
+    except Exception:
+        return False
 
+def report_failure(service: str, latency_seconds: Optional[float] = None) -> None:
+    """Registra falha (timeout/5xx/rede) na janela; pode abrir o circuito."""
+    _record_call(service, False, latency_seconds)
+
+def report_success(service: str, latency_seconds: Optional[float] = None) -> None:
+    """Registra sucesso com latência (chamadas lentas também contam para abrir)."""
+    _record_call(service, True, latency_seconds)
+
+def get_circuit_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """Estado e métricas da janela de cada serviço (para /metrics)."""
+    client = get_redis_client()
+    if client is None: return {}
+    out = {}
     try:
-        # Se houve sucesso, podemos limpar a contagem de falhas recente
-        # Isso implementa uma recuperação "Half-Open" implícita: se passar uma, zera as falhas.
-        fkey = circuit_failure_key(service)
-        if client.exists(fkey):
-            client.delete(fkey)
+        now = time.time()
+        for service in sorted(client.smembers(CIRCUIT_SERVICES_KEY) or []):
+            state = _circuit_state(client, service)
+            current = state.get("state", CIRCUIT_CLOSED)
+            info = {"state": current, **_window_stats(_window_calls(client, service, now))}
+            if current != CIRCUIT_CLOSED:
+                info["opened_at"] = float(state.get("opened_at") or 0)
+                info["reason"] = state.get("reason") or ""
+            out[service] = info
     except Exception as e:
-        logger.error(f"Erro no circuit breaker (success): {e}")
+        logger.error(f"Erro ao ler métricas do circuit breaker: {e}")
+    return out
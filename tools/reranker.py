@@ -0,0 +1,86 @@
+"""
+Kernel de similaridade para o re-ranking da busca de produtos.
+
+Reproduz exatamente difflib.SequenceMatcher(None, consulta, nome).ratio()
+(Ratcliff/Obershelp), mas sem o custo por par do difflib:
+- o índice de posições por caractere do nome (b2j) é montado uma vez por
+  produto e reaproveitado entre consultas (cache em db_search)
+- sem heurística de junk/autojunk (irrelevante para nomes < 200 caracteres),
+  sem namedtuples nem ordenação de blocos: só a soma dos tamanhos
+
+scripts/check_reranker_parity.py compara com o _score_match original.
+"""
+import difflib
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# Acima disso o difflib ativa autojunk; delega para manter a mesma semântica
+_AUTOJUNK_MIN_LEN = 200
+
+
+def char_index(text: str) -> Dict[str, Tuple[int, ...]]:
+    """Posições de cada caractere no texto (equivalente ao b2j do difflib sem junk)."""
+    index: Dict[str, List[int]] = {}
+    for i, ch in enumerate(text):
+        index.setdefault(ch, []).append(i)
+    return {ch: tuple(pos) for ch, pos in index.items()}
+
+
+def matched_chars(a: str, b: str, b_index: Dict[str, Tuple[int, ...]]) -> int:
+    """Total de caracteres nos blocos casados por Ratcliff/Obershelp (mesmo desempate do difflib)."""
+    total = 0
+    queue = [(0, len(a), 0, len(b))]
+    while queue:
+        alo, ahi, blo, bhi = queue.pop()
+        besti, bestj, bestsize = alo, blo, 0
+        j2len: Dict[int, int] = {}
+        for i in range(alo, ahi):
+            new_j2len: Dict[int, int] = {}
+            for j in b_index.get(a[i], ()):
+                if j < blo:
+                    continue
+                if j >= bhi:
+                    break
+                k = new_j2len[j] = j2len.get(j - 1, 0) + 1
+                if k > bestsize:
+                    besti, bestj, bestsize = i - k + 1, j - k + 1, k
+            j2len = new_j2len
+        if bestsize:
+            total += bestsize
+            if alo < besti and blo < bestj:
+                queue.append((alo, besti, blo, bestj))
+            if besti + bestsize < ahi and bestj + bestsize < bhi:
+                queue.append((besti + bestsize, ahi, bestj + bestsize, bhi))
+    return total
+
+
+class QueryScorer:
+    """Consulta pré-processada uma vez; pontua vários candidatos (0.6·overlap + 0.4·ratio)."""
+
+    __slots__ = ("tokens", "token_set", "norm")
+
+    def __init__(self, q_tokens: Sequence[str]):
+        self.tokens = list(q_tokens)
+        self.token_set = set(self.tokens)
+        self.norm = " ".join(self.tokens)
+
+    def ratio(self, name_norm: str, name_index: Dict[str, Tuple[int, ...]]) -> float:
+        total = len(self.norm) + len(name_norm)
+        if total == 0:
+            return 1.0
+        if len(name_norm) >= _AUTOJUNK_MIN_LEN:
+            return difflib.SequenceMatcher(None, self.norm, name_norm).ratio()
+        return 2.0 * matched_chars(self.norm, name_norm, name_index) / total
+
+    def score(self, candidate_tokens: Iterable[str], name_norm: str, name_index: Dict[str, Tuple[int, ...]]) -> float:
+        if not self.tokens:
+            return 0.0
+        overlap = len(self.token_set.intersection(candidate_tokens)) / max(len(self.token_set), 1)
+        if not name_norm:
+            return round(overlap, 4)
+        return round(0.6 * overlap + 0.4 * self.ratio(name_norm, name_index), 4)
+
+    def score_many(self, candidates: Sequence[tuple]) -> List[float]:
+        """candidates: [(tokens_nome_e_categoria, nome_normalizado, char_index(nome)), ...]"""
+        if not self.tokens:
+            return [0.0] * len(candidates)
+        return [self.score(tokens, name_norm, name_index) for tokens, name_norm, name_index in candidates]
@@ -0,0 +1,178 @@
+"""
+Cache de resultados da busca de produtos.
+
+Duas camadas:
+- LRU local em memória (por processo)
+- Redis (compartilhado entre API e worker)
+
+A chave é a consulta já normalizada (_prepare_search_query) + limit + tabela,
+prefixada pela versão do catálogo. `sync_products_db` publica a versão do
+changelog do catálogo (tools.catalog_changelog) após um upsert que mudou algo,
+o que invalida todas as entradas de uma vez.
+Resultados vazios também são cacheados (TTL menor).
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools.redis_tools import get_redis_client, get_catalog_version, bump_catalog_version
+
+logger = setup_logger(__name__)
+
+_lock = threading.Lock()
+# chave -> (expira_em, resultados)
+_local: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+
+# Versão do catálogo (relida do Redis a cada search_cache_version_check_seconds)
+_version: int = 0
+_version_checked_at: float = 0.0
+
+_stats: Dict[str, int] = {
+    "local_hits": 0,
+    "redis_hits": 0,
+    "negative_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "evictions": 0,
+    "errors": 0,
+}
+
+
+def _incr(name: str) -> None:
+    with _lock:
+        _stats[name] += 1
+
+
+def _json_default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _current_version() -> int:
+    global _version, _version_checked_at
+    now = time.monotonic()
+    if now - _version_checked_at < settings.search_cache_version_check_seconds:
+        return _version
+    remote = get_catalog_version()
+    with _lock:
+        _version_checked_at = now
+        if remote is not None and remote != _version:
+            # Catálogo mudou: entradas locais da versão anterior nunca mais serão lidas
+            _local.clear()
+            _version = remote
+    return _version
+
+
+def _cache_key(q: str, limit: int) -> str:
+    table_name = settings.postgres_products_table_name or "produtos-sp-queiroz"
+    return f"search_cache:v{_current_version()}:{table_name}:{limit}:{q}"
+
+
+def get_cached_search(q: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+    """Retorna os resultados ranqueados cacheados (lista, possivelmente vazia) ou None."""
+    if not settings.search_cache_enabled:
+        return None
+
+    key = _cache_key(q, limit)
+    now = time.time()
+    with _lock:
+        entry = _local.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                _local.move_to_end(key)
+                _stats["local_hits"] += 1
+                if not entry[1]:
+                    _stats["negative_hits"] += 1
+                return [dict(r) for r in entry[1]]
+            del _local[key]
+
+    client = get_redis_client()
+    if client is not None:
+        try:
+            data = client.get(key)
+            if data is not None:
+                results = json.loads(data)
+                ttl = client.ttl(key)
+                _store_local(key, results, ttl if ttl and ttl > 0 else settings.search_cache_negative_ttl_seconds)
+                _incr("redis_hits")
+                if not results:
+                    _incr("negative_hits")
+                return [dict(r) for r in results]
+        except Exception as e:
+            _incr("errors")
+            logger.warning(f"Falha ao ler cache de busca no Redis: {e}")
+
+    _incr("misses")
+    return None
+
+
+def _store_local(key: str, results: List[Dict[str, Any]], ttl: int) -> None:
+    max_size = max(0, settings.search_cache_local_size)
+    if max_size == 0:
+        return
+    with _lock:
+        _local[key] = (time.time() + ttl, results)
+        _local.move_to_end(key)
+        while len(_local) > max_size:
+            _local.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def set_cached_search(q: str, limit: int, results: List[Dict[str, Any]]) -> None:
+    """Guarda os resultados ranqueados (vazios inclusive) nas duas camadas."""
+    if not settings.search_cache_enabled:
+        return
+
+    key = _cache_key(q, limit)
+    ttl = settings.search_cache_ttl_seconds if results else settings.search_cache_negative_ttl_seconds
+    try:
+        # Serializa uma vez: normaliza Decimal/datas e desacopla do objeto do chamador
+        payload = json.dumps(results, ensure_ascii=False, default=_json_default)
+    except Exception as e:
+        _incr("errors")
+        logger.warning(f"Resultados de busca não serializáveis para cache: {e}")
+        return
+
+    _store_local(key, json.loads(payload), ttl)
+    _incr("stores")
+
+    client = get_redis_client()
+    if client is not None:
+        try:
+            client.set(key, payload, ex=ttl)
+        except Exception as e:
+            _incr("errors")
+            logger.warning(f"Falha ao gravar cache de busca no Redis: {e}")
+
+
+def invalidate_search_cache(catalog_version: Optional[int] = None) -> Optional[int]:
+    """
+    Publica a nova versão do catálogo (a do changelog, quando o sync informa) e limpa
+    o LRU local. Chamado após o sync.
+    """
+    global _version, _version_checked_at
+    version = bump_catalog_version(catalog_version)
+    with _lock:
+        _local.clear()
+        # Sem Redis, a versão local avança sozinha (só invalida este processo)
+        _version = version if version is not None else max(catalog_version or 0, _version + 1)
+        _version_checked_at = time.monotonic()
+    return version
+
+
+def get_search_cache_stats() -> Dict[str, Any]:
+    """Contadores de hit/miss para dimensionar o cache."""
+    with _lock:
+        stats = dict(_stats)
+        stats["local_size"] = len(_local)
+        stats["local_max_size"] = settings.search_cache_local_size
+        stats["catalog_version"] = _version
+    lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["local_hits"] + stats["redis_hits"]) / lookups, 4) if lookups else 0.0
+    return stats
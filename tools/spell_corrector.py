@@ -0,0 +1,309 @@
+"""
+Corretor ortográfico derivado do catálogo (índice de deleções simétricas).
+
+O vocabulário (palavras de nome/categoria/descrição com frequência = nº de
+produtos) é montado no sync (`rebuild_spell_dictionary`) e publicado no Redis,
+junto com uma chave pequena de versão (`spell:vocab:built_at`). Os processos de
+busca checam só a versão e recarregam o vocabulário em background quando ela
+muda. Os tokens da consulta são corrigidos antes do SQL:
+"calabrasa" -> "calabresa", "detergene" -> "detergente".
+
+Só troca quando a correção é clara: palavras comuns do português (COMMON_WORDS)
+nunca são mexidas, e a candidata precisa ser a única na menor distância ou ser
+bem mais frequente que a segunda (MIN_FREQUENCY_RATIO). Na dúvida, o token fica.
+
+Deleções simétricas: para cada palavra guardamos todas as variantes com até
+N letras removidas; uma palavra digitada casa com o vocabulário se as
+variantes dela cruzam com as do índice. A escolha final é pela menor
+distância (Damerau-Levenshtein restrita).
+"""
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+from psycopg2 import sql
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools.redis_tools import get_redis_client
+
+logger = setup_logger(__name__)
+
+SPELL_VOCAB_KEY = "spell:vocab"
+SPELL_VERSION_KEY = "spell:vocab:built_at"
+# Palavras menores que isso não são corrigidas (preposições, siglas, "po", "kg")
+MIN_WORD_LEN = 4
+# Empate na menor distância: a melhor candidata precisa ser N vezes mais frequente
+MIN_FREQUENCY_RATIO = 3.0
+# Checagem da versão do vocabulário publicada no Redis
+_RELOAD_CHECK_SECONDS = 60
+
+# Palavras corretas que não estão no catálogo (pedido, cortesia, unidades):
+# sem isso "para" vira "pera" e "quero" vira "queijo"
+COMMON_WORDS = frozenset("""
+    para pela pelo pelos pelas pra pro com sem mais menos muito muita muitos muitas pouco pouca
+    quero queria quer queremos gostaria preciso precisa precisamos tenho temos tem tinha
+    pode podia poderia posso vou vai vamos manda mandar traz trazer entrega entregar
+    entregam comprar compra pedir pedido pedidos favor obrigado obrigada valeu beleza
+    quanto quanta quantos quantas custa custam preco precos valor valores total troco
+    qual quais onde como quando porque tambem ainda agora hoje amanha ontem depois antes
+    esse essa esses essas este esta estes estas isso isto aquele aquela aqueles aquelas
+    desse dessa deste desta daquele daquela nesse nessa neste nesta outro outra outros outras
+    mesmo mesma todo toda todos todas tudo nada algum alguma alguns algumas cada
+    meu minha meus minhas seu sua seus suas nosso nossa dele dela deles delas voce voces
+    sim nao bom boa bons boas noite tarde manha tchau certo certa sera
+    unidade unidades litro litros quilo quilos kilo kilos grama gramas pacote pacotes
+    caixa caixas lata latas garrafa garrafas fardo fardos duzia meia metade inteiro inteira
+    grande grandes pequeno pequena pequenos pequenas medio media maior menor marca tipo
+    gelado gelada gelados geladas barato barata caro cara melhor cartao dinheiro
+    endereco casa rua numero bairro retirar retirada loja mercado supermercado
+""".split())
+
+
+def _fold(text: str) -> str:
+    return "".join(
+        ch
+        for ch in unicodedata.normalize("NFKD", (text or "").lower())
+        if not unicodedata.combining(ch)
+    )
+
+
+def _words(text: str) -> List[str]:
+    return [w for w in re.split(r"[^a-z]+", _fold(text)) if len(w) >= MIN_WORD_LEN]
+
+
+def _max_distance(word: str) -> int:
+    # Distância 2 só em palavras longas: "barato" não pode virar "batata"
+    return 1 if len(word) <= 6 else 2
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    out = {word}
+    frontier = {word}
+    for _ in range(distance):
+        nxt = set()
+        for w in frontier:
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i + 1:])
+        out |= nxt
+        frontier = nxt
+    return out
+
+
+def _osa_distance(a: str, b: str, max_dist: int) -> int:
+    """Damerau-Levenshtein restrita (transposição de vizinhas conta 1)."""
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class SpellCorrector:
+    """Índice de deleções simétricas sobre o vocabulário do catálogo."""
+
+    def __init__(self, vocab: Dict[str, int]):
+        self.vocab = dict(vocab)
+        self._index: Dict[str, List[str]] = {}
+        for word in self.vocab:
+            for d in _deletes(word, _max_distance(word)):
+                self._index.setdefault(d, []).append(word)
+
+    def __len__(self) -> int:
+        return len(self.vocab)
+
+    def correct_word(self, word: str) -> Optional[str]:
+        """
+        Palavra do vocabulário que claramente corrige `word`, ou None se não houver
+        candidata próxima ou se a escolha for ambígua (empate na menor distância sem
+        uma candidata MIN_FREQUENCY_RATIO vezes mais frequente que a segunda).
+        """
+        if word in self.vocab:
+            return word
+        max_dist = _max_distance(word)
+        best_dist = max_dist + 1
+        closest: List[str] = []
+        seen: Set[str] = set()
+        for d in _deletes(word, max_dist):
+            for cand in self._index.get(d, ()):
+                if cand in seen:
+                    continue
+                seen.add(cand)
+                dist = _osa_distance(word, cand, max_dist)
+                if dist < best_dist:
+                    best_dist, closest = dist, [cand]
+                elif dist == best_dist:
+                    closest.append(cand)
+        if not closest:
+            return None
+        if len(closest) == 1:
+            return closest[0]
+        ranked = sorted(closest, key=lambda c: -self.vocab[c])
+        if self.vocab[ranked[0]] >= MIN_FREQUENCY_RATIO * self.vocab[ranked[1]]:
+            return ranked[0]
+        return None
+
+    def correct_query(self, query: str) -> str:
+        """
+        Corrige só tokens alfabéticos desconhecidos com correção clara; números,
+        palavras curtas e palavras comuns (COMMON_WORDS) passam direto.
+        """
+        out = []
+        changed = False
+        for tok in query.split(" "):
+            folded = _fold(tok)
+            if (
+                len(folded) < MIN_WORD_LEN
+                or not folded.isalpha()
+                or folded in self.vocab
+                or folded in COMMON_WORDS
+            ):
+                out.append(tok)
+                continue
+            fixed = self.correct_word(folded)
+            if fixed and fixed != folded:
+                out.append(fixed)
+                changed = True
+            else:
+                out.append(tok)
+        if changed:
+            corrected = " ".join(out)
+            logger.info(f"✏️ Correção ortográfica: '{query}' -> '{corrected}'")
+            return corrected
+        return query
+
+
+def build_vocabulary(rows) -> Dict[str, int]:
+    """
+    Frequência de cada palavra = nº de produtos que a contêm. `rows` são tuplas de
+    textos do produto (nome, categoria, descricao); marcas que só aparecem na
+    descrição também entram, senão seriam "corrigidas" para outra palavra.
+    """
+    counts: Counter = Counter()
+    for texts in rows:
+        counts.update(set(_words(" ".join(t or "" for t in texts))))
+    return dict(counts)
+
+
+# Corretor ativo (troca atômica por atribuição)
+_active: Optional[SpellCorrector] = None
+_active_built_at: Optional[str] = None
+_checked_at = 0.0
+_loading = False
+_loading_lock = threading.Lock()
+
+
+def rebuild_spell_dictionary(conn) -> bool:
+    """Monta o vocabulário a partir da tabela de produtos e publica no Redis (chamado no sync)."""
+    global _active, _active_built_at
+    if not settings.spell_correction_enabled:
+        return False
+    table_name = settings.postgres_products_table_name or "produtos-sp-queiroz"
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("SELECT nome, categoria, descricao FROM {table} WHERE coalesce(ativo, true)").format(
+                    table=sql.Identifier(table_name)
+                )
+            )
+            vocab = build_vocabulary(cur.fetchall() or [])
+    except Exception as e:
+        logger.error(f"Falha ao montar vocabulário do corretor: {e}")
+        return False
+
+    built_at = str(time.time())
+    client = get_redis_client()
+    if client is not None:
+        try:
+            client.set(SPELL_VOCAB_KEY, json.dumps({"built_at": built_at, "vocab": vocab}, ensure_ascii=False))
+            # Versão publicada por último: quem vê a versão nova já encontra o vocabulário
+            client.set(SPELL_VERSION_KEY, built_at)
+        except Exception as e:
+            logger.warning(f"Falha ao publicar vocabulário do corretor no Redis: {e}")
+
+    _active = SpellCorrector(vocab)
+    _active_built_at = built_at
+    logger.info(f"✏️ Vocabulário do corretor ortográfico: {len(vocab)} palavras")
+    return True
+
+
+def _load_from_redis() -> None:
+    """Baixa o vocabulário publicado e monta o índice (fora do caminho da busca)."""
+    global _active, _active_built_at
+    client = get_redis_client()
+    if client is None:
+        return
+    data = client.get(SPELL_VOCAB_KEY)
+    if not data:
+        return
+    payload = json.loads(data)
+    if payload.get("built_at") == _active_built_at:
+        return
+    corrector = SpellCorrector(payload.get("vocab") or {})
+    _active, _active_built_at = corrector, payload.get("built_at")
+    logger.info(f"✏️ Corretor ortográfico carregado do Redis: {len(corrector)} palavras")
+
+
+def _schedule_background_load() -> None:
+    global _loading
+    with _loading_lock:
+        if _loading:
+            return
+        _loading = True
+
+    def _run():
+        global _loading
+        try:
+            _load_from_redis()
+        except Exception as e:
+            logger.warning(f"Falha ao carregar vocabulário do corretor: {e}")
+        finally:
+            _loading = False
+
+    threading.Thread(target=_run, daemon=True).start()
+
+
+def get_spell_corrector() -> Optional[SpellCorrector]:
+    """
+    Corretor ativo. A cada _RELOAD_CHECK_SECONDS lê só a versão publicada; se mudou,
+    o vocabulário é recarregado em background e a busca segue com o atual.
+    """
+    global _checked_at
+    if not settings.spell_correction_enabled:
+        return None
+    now = time.monotonic()
+    if _checked_at and now - _checked_at < _RELOAD_CHECK_SECONDS:
+        return _active
+    _checked_at = now
+    try:
+        client = get_redis_client()
+        version = client.get(SPELL_VERSION_KEY) if client is not None else None
+        if version and version != _active_built_at:
+            _schedule_background_load()
+    except Exception as e:
+        logger.warning(f"Falha ao checar versão do vocabulário do corretor: {e}")
+    return _active
+
+
+def correct_query(query: str) -> str:
+    """Aplica o corretor se disponível; sem vocabulário, devolve a consulta intacta."""
+    corrector = get_spell_corrector()
+    if corrector is None or not query:
+        return query
+    try:
+        return corrector.correct_query(query)
+    except Exception as e:
+        logger.warning(f"Falha na correção ortográfica: {e}")
+        return query
@@ -218,6 +218,13 @@ def _send_whatsapp_message(telefone: str, mensagem: str) -> bool:
         return False
 
 
+async def shutdown(ctx: Dict[str, Any]) -> None:
+    """Fecha os clientes HTTP async (pools keep-alive) ao desligar o worker."""
+    from tools.http_client import close_async_clients
+
+    await close_async_clients()
+
+
 class WorkerSettings:
     """Configuração do ARQ Worker"""
     
@@ -240,6 +247,7 @@ class WorkerSettings:
     
     # Funções que o worker pode executar
     functions = [process_message]
+    on_shutdown = shutdown
     
     # Configurações de concorrência e retry
     max_jobs = settings.workers_max_jobs  # Máximo de jobs simultâneos (5)